@@ -0,0 +1,43 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+
+class ArchiveAfterOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'archive_after'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Archive After'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'After how many days without being used should finished jobs be archived? (blank to never archive them)'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        if not value:
+            return value
+        try:
+            days = float(value)
+        except ValueError:
+            raise config_option.BadValue('expected a number of days')
+        if days <= 0:
+            raise config_option.BadValue('must be positive')
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            # in seconds
+            self._config_dict_value = float(value) * 24 * 60 * 60
+        else:
+            self._config_dict_value = None
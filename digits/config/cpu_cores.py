@@ -0,0 +1,41 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+
+class CpuCoresOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'cpu_cores'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'CPU Cores'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'How many CPU cores can the tasks use? (blank for all of them)'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        if value:
+            try:
+                cores = int(value)
+            except ValueError:
+                raise config_option.BadValue('expected a number of cores')
+            if cores < 1:
+                raise config_option.BadValue('must be at least 1')
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            self._config_dict_value = int(value)
+        else:
+            self._config_dict_value = None
@@ -6,6 +6,14 @@ from log_file import LogFileOption
 from log_level import LogLevelOption
 from server_name import ServerNameOption
 from secret_key import SecretKeyOption
+from tool_workers import ToolWorkersOption
+from cpu_cores import CpuCoresOption
+from memory import MemoryOption
+from io_tokens import IoTokensOption
+from shortest_job_first import ShortestJobFirstOption
+from task_priorities import TaskPrioritiesOption
+from snapshot_retention import SnapshotRetentionOption
+from archive_after import ArchiveAfterOption
 from caffe_option import CaffeOption
 
 option_list = None
@@ -23,6 +31,14 @@ def reset():
             LogLevelOption(),
             ServerNameOption(),
             SecretKeyOption(),
+            ToolWorkersOption(),
+            CpuCoresOption(),
+            MemoryOption(),
+            IoTokensOption(),
+            ShortestJobFirstOption(),
+            TaskPrioritiesOption(),
+            SnapshotRetentionOption(),
+            ArchiveAfterOption(),
             CaffeOption(),
             ]
 
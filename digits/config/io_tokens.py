@@ -0,0 +1,41 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+
+class IoTokensOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'io_tokens'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'I/O Tokens'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'How many disk-heavy tasks (e.g. creating a database) can run at once? (blank for the default)'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        if value:
+            try:
+                tokens = int(value)
+            except ValueError:
+                raise config_option.BadValue('expected a number of tokens')
+            if tokens < 1:
+                raise config_option.BadValue('must be at least 1')
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            self._config_dict_value = int(value)
+        else:
+            self._config_dict_value = None
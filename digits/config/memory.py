@@ -0,0 +1,64 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+
+# Suffixes for parse_size()
+UNITS = {
+        '': 1,
+        'K': 2**10,
+        'M': 2**20,
+        'G': 2**30,
+        'T': 2**40,
+        }
+
+def parse_size(value):
+    """
+    Returns a number of bytes
+
+    Arguments:
+    value -- a string like "16G", "512M" or "1000000"
+    """
+    value = value.strip().upper()
+    if value.endswith('B'):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in UNITS else ''
+    number = float(value[:len(value) - len(unit)])
+    return int(number * UNITS[unit])
+
+class MemoryOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'memory'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Task Memory'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'How much memory can the tasks use? (e.g. "16G", blank for all of it)'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        if value:
+            try:
+                size = parse_size(value)
+            except ValueError:
+                raise config_option.BadValue('expected a size like "16G"')
+            if size <= 0:
+                raise config_option.BadValue('must be positive')
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            self._config_dict_value = parse_size(value)
+        else:
+            self._config_dict_value = None
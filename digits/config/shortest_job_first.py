@@ -0,0 +1,37 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+import prompt
+
+class ShortestJobFirstOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'shortest_job_first'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Shortest Job First'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'Should the queued tasks which need the least work start first (among jobs with the same priority)? [yes/no]'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def suggestions(self):
+        return [
+                prompt.Suggestion('no', 'N', default=True),
+                prompt.Suggestion('yes', 'Y'),
+                ]
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip().lower()
+        if value not in ['yes', 'no']:
+            raise config_option.BadValue
+        return value
+
+    def _set_config_dict_value(self, value):
+        self._config_dict_value = (value == 'yes')
@@ -0,0 +1,61 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+
+def parse_retention(value):
+    """
+    Returns a dict of keyword arguments for a RetentionPolicy
+
+    Arguments:
+    value -- a string like "last=3 best=2 output=accuracy every=10"
+    """
+    kwargs = {}
+    for word in value.split():
+        key, sep, setting = word.partition('=')
+        if not sep:
+            raise ValueError('expected key=value, not "%s"' % word)
+        if key in ('last', 'best', 'every'):
+            number = int(setting)
+            if number < 1:
+                raise ValueError('%s must be at least 1' % key)
+            kwargs['keep_%s' % key] = number
+        elif key == 'output':
+            kwargs['best_output'] = setting
+        else:
+            raise ValueError('unknown setting "%s"' % key)
+    return kwargs
+
+class SnapshotRetentionOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'snapshot_retention'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Snapshot Retention'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'Which snapshots of each model should be kept? (e.g. "last=3 best=2 output=accuracy every=10", blank to keep them all)'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        try:
+            parse_retention(value)
+        except ValueError as e:
+            raise config_option.BadValue(str(e))
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            self._config_dict_value = parse_retention(value)
+        else:
+            self._config_dict_value = None
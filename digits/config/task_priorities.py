@@ -0,0 +1,39 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+from digits.process_priority import parse_priorities
+
+class TaskPrioritiesOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'task_priorities'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Task Priorities'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'How should the processes of each task type be scheduled? (e.g. "create_db: nice=10 ionice=idle cpus=2-7; train: cpus=0-1")'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def optional(self):
+        return True
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip()
+        try:
+            parse_priorities(value)
+        except ValueError as e:
+            raise config_option.BadValue(str(e))
+        return value
+
+    def _set_config_dict_value(self, value):
+        if value:
+            self._config_dict_value = parse_priorities(value)
+        else:
+            self._config_dict_value = None
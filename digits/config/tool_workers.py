@@ -0,0 +1,38 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import config_option
+import prompt
+
+class ToolWorkersOption(config_option.Option):
+    @staticmethod
+    def config_file_key():
+        return 'tool_workers'
+
+    @classmethod
+    def prompt_title(cls):
+        return 'Tool Workers'
+
+    @classmethod
+    def prompt_message(cls):
+        return 'Do you want to run the dataset tools in a worker process which keeps their modules imported? [yes/no]'
+
+    @classmethod
+    def visibility(self):
+        return config_option.Visibility.HIDDEN
+
+    def suggestions(self):
+        return [
+                prompt.Suggestion('no', 'N', default=True),
+                prompt.Suggestion('yes', 'Y'),
+                ]
+
+    @classmethod
+    def validate(cls, value):
+        value = value.strip().lower()
+        if value not in ['yes', 'no']:
+            raise config_option.BadValue
+        return value
+
+    def _set_config_dict_value(self, value):
+        self._config_dict_value = (value == 'yes')
+
@@ -1,9 +1,11 @@
 # Copyright (c) 2014-2015, NVIDIA CORPORATION.  All rights reserved.
 
 from flask.ext.wtf import Form
-from wtforms import StringField
+from wtforms import StringField, SelectField
 from wtforms.validators import DataRequired
 
+from digits.job import Job
+
 class DatasetForm(Form):
     """
     Defines the form used to create a new Dataset
@@ -14,3 +16,11 @@ class DatasetForm(Form):
             validators=[DataRequired()]
             )
 
+    username = StringField(u'User Name')
+
+    priority = SelectField(u'Priority',
+            choices=Job.PRIORITY_CHOICES,
+            coerce=int,
+            default=Job.PRIORITY_NORMAL,
+            )
+
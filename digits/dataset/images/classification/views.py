@@ -237,7 +237,9 @@ def image_classification_dataset_create():
                     int(form.resize_width.data),
                     int(form.resize_channels.data),
                     ),
-                resize_mode = form.resize_mode.data
+                resize_mode = form.resize_mode.data,
+                username    = form.username.data or None,
+                priority    = form.priority.data,
                 )
 
         if form.method.data == 'folder':
@@ -2,7 +2,6 @@
 
 import sys
 import os.path
-import re
 import operator
 
 import digits
@@ -17,6 +16,18 @@ PICKLE_VERSION = 3
 class CreateDbTask(Task):
     """Creates a database"""
 
+    # Estimated memory usage of tools/create_db.py without any images
+    BASE_MEMORY_REQUIRED = 512 * 2**20
+    # Passed to tools/create_db.py when shuffling (it uses one of each otherwise)
+    READ_THREADS = 10
+    WRITE_THREADS = 10
+    # Records added to the database at a time by each write thread
+    BATCH_SIZE = 100
+    # tools/create_db.py reports its progress with events
+    EVENTS_CHANNEL = True
+    TASK_TYPE = 'create_db'
+
+
     def __init__(self, input_file, db_name, image_dims, **kwargs):
         """
         Arguments:
@@ -109,13 +120,44 @@ class CreateDbTask(Task):
 
     @override
     def offer_resources(self, resources):
-        key = 'create_db_task_pool'
-        if key not in resources:
-            return None
-        for resource in resources[key]:
-            if resource.remaining() >= 1:
-                return {key: [(resource.identifier, 1)]}
-        return None
+        return self.request_resources(resources, {
+            'cpus': self.cpus_required(),
+            'memory': self.memory_required(),
+            'io': 1,
+            })
+
+    def threads(self):
+        """
+        Returns the number of (read, write) threads run by tools/create_db.py
+        """
+        if self.shuffle:
+            return self.READ_THREADS, self.WRITE_THREADS
+        else:
+            # one of each, to preserve the order
+            return 1, 1
+
+    def cpus_required(self):
+        """
+        Returns the number of CPU cores used by tools/create_db.py
+        """
+        # the read threads decode and resize images, the write threads
+        #   mostly wait on the database
+        read_threads, write_threads = self.threads()
+        return read_threads
+
+    def memory_required(self):
+        """
+        Returns the estimated memory usage of tools/create_db.py in bytes
+        """
+        read_threads, write_threads = self.threads()
+        image_bytes = self.image_dims[0] * self.image_dims[1] * self.image_dims[2]
+        # up to 2*batch_size Datums are queued for writing,
+        #   and each write thread holds a batch of up to batch_size Datums
+        images = (2 + write_threads) * self.BATCH_SIZE
+        if self.mean_file is not None:
+            # each read thread keeps a float64 sum for the mean image
+            images += read_threads * 8
+        return self.BASE_MEMORY_REQUIRED + image_bytes * images
 
     @override
     def task_arguments(self, resources):
@@ -138,6 +180,10 @@ class CreateDbTask(Task):
             args.append('--image_folder=%s' % self.image_folder)
         if self.shuffle:
             args.append('--shuffle')
+            read_threads, write_threads = self.threads()
+            args.append('--read_threads=%s' % read_threads)
+            args.append('--write_threads=%s' % write_threads)
+        args.append('--batch_size=%s' % self.BATCH_SIZE)
         if self.encoding and self.encoding != 'none':
             args.append('--encoding=%s' % self.encoding)
 
@@ -145,65 +191,46 @@ class CreateDbTask(Task):
 
     @override
     def process_output(self, line):
-        from digits.webapp import socketio
-
-        timestamp, level, message = self.preprocess_output_digits(line)
-        if not message:
-            return False
-
-        # progress
-        match = re.match(r'Processed (\d+)\/(\d+)', message)
-        if match:
-            self.progress = float(match.group(1))/int(match.group(2))
-            socketio.emit('task update',
-                    {
-                        'task': self.html_id(),
-                        'update': 'progress',
-                        'percentage': int(round(100*self.progress)),
-                        'eta': utils.time_filters.print_time_diff(self.est_done()),
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
+        # progress, results and errors arrive as events (see process_event)
+        return self.is_digits_output(line)
+
+    @override
+    def process_event(self, event):
+        from digits.webapp import rooms
+
+        name = event['event']
+        if name == 'progress':
+            self.progress = float(event['done'])/event['total']
+            rooms.emit('task update', self.progress_message, self.job_id,
+                    key=(self.html_id(), 'progress'))
             return True
 
-        # distribution
-        match = re.match(r'Category (\d+) has (\d+)', message)
-        if match and self.labels_file is not None:
+        if name == 'category':
+            if self.labels_file is None:
+                return True
             if not hasattr(self, 'distribution') or self.distribution is None:
                 self.distribution = {}
 
-            self.distribution[match.group(1)] = int(match.group(2))
+            self.distribution[str(event['label'])] = int(event['count'])
 
-            data = self.distribution_data()
-            if data:
-                socketio.emit('task update',
-                        {
+            def build():
+                data = self.distribution_data()
+                if data:
+                    return {
                             'task': self.html_id(),
                             'update': 'distribution',
                             'data': data,
-                            },
-                        namespace='/jobs',
-                        room=self.job_id,
-                        )
+                            }
+            rooms.emit('task update', build, self.job_id,
+                    key=(self.html_id(), 'distribution'))
             return True
 
-        # result
-        match = re.match(r'Total images added: (\d+)', message)
-        if match:
-            self.entries_count = int(match.group(1))
-            self.logger.debug(message)
-            return True
-
-        if level == 'warning':
-            self.logger.warning('%s: %s' % (self.name(), message))
-            return True
-        if level in ['error', 'critical']:
-            self.logger.error('%s: %s' % (self.name(), message))
-            self.exception = message
+        if name == 'result':
+            self.entries_count = int(event['entries'])
+            self.logger.debug('Total images added: %d' % self.entries_count)
             return True
 
-        return True
+        return super(CreateDbTask, self).process_event(event)
 
     def get_labels(self):
         """
@@ -2,7 +2,6 @@
 
 import sys
 import os.path
-import re
 
 import digits
 from digits import utils
@@ -15,6 +14,13 @@ PICKLE_VERSION = 1
 @subclass
 class ParseFolderTask(Task):
     """Parses a folder into textfiles"""
+
+    # Estimated memory usage of tools/parse_folder.py
+    MEMORY_REQUIRED = 256 * 2**20
+    # tools/parse_folder.py reports its progress with events
+    EVENTS_CHANNEL = True
+    TASK_TYPE = 'parse_folder'
+
     def __init__(self, folder, **kwargs):
         """
         Arguments:
@@ -105,13 +111,12 @@ class ParseFolderTask(Task):
 
     @override
     def offer_resources(self, resources):
-        key = 'parse_folder_task_pool'
-        if key not in resources:
-            return None
-        for resource in resources[key]:
-            if resource.remaining() >= 1:
-                return {key: [(resource.identifier, 1)]}
-        return None
+        # a single process walking a directory tree
+        return self.request_resources(resources, {
+            'cpus': 1,
+            'memory': self.MEMORY_REQUIRED,
+            'io': 1,
+            })
 
     @override
     def task_arguments(self, resources):
@@ -138,52 +143,29 @@ class ParseFolderTask(Task):
 
     @override
     def process_output(self, line):
-        from digits.webapp import socketio
-
-        timestamp, level, message = self.preprocess_output_digits(line)
-        if not message:
-            return False
-
-        # progress
-        match = re.match(r'Progress: ([-+]?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?)', message)
-        if match:
-            self.progress = float(match.group(1))
-            socketio.emit('task update',
-                    {
-                        'task': self.html_id(),
-                        'update': 'progress',
-                        'percentage': int(round(100*self.progress)),
-                        'eta': utils.time_filters.print_time_diff(self.est_done()),
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
-            return True
+        # progress, results and errors arrive as events (see process_event)
+        return self.is_digits_output(line)
 
-        # totals
-        match = re.match(r'Found (\d+) images in (\d+) categories', message)
-        if match:
-            self.label_count = int(match.group(2))
+    @override
+    def process_event(self, event):
+        from digits.webapp import rooms
+
+        name = event['event']
+        if name == 'progress':
+            self.progress = float(event['done'])/event['total']
+            rooms.emit('task update', self.progress_message, self.job_id,
+                    key=(self.html_id(), 'progress'))
             return True
 
-        # splits
-        match = re.match(r'Selected (\d+) for (\w+)', message)
-        if match:
-            if match.group(2).startswith('training'):
-                self.train_count = int(match.group(1))
-            elif match.group(2).startswith('validation'):
-                self.val_count = int(match.group(1))
-            elif match.group(2).startswith('test'):
-                self.test_count = int(match.group(1))
+        if name == 'found':
+            self.label_count = int(event['categories'])
             return True
 
-        if level == 'warning':
-            self.logger.warning('%s: %s' % (self.name(), message))
-            return True
-        if level in ['error', 'critical']:
-            self.logger.error('%s: %s' % (self.name(), message))
-            self.exception = message
+        if name == 'selected':
+            self.train_count = int(event['train'])
+            self.val_count = int(event['val'])
+            self.test_count = int(event['test'])
             return True
 
-        return True
+        return super(ParseFolderTask, self).process_event(event)
 
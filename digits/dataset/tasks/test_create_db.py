@@ -0,0 +1,40 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+from . import create_db as _
+
+class TestResources():
+
+    def task(self, **kwargs):
+        return _.CreateDbTask('train.txt', 'train_db', (256, 256, 3),
+                job_dir='/tmp/job', **kwargs)
+
+    def test_arguments(self):
+        """threads and batch size are passed to tools/create_db.py"""
+        args = self.task(shuffle=True).task_arguments({})
+        assert '--read_threads=%d' % _.CreateDbTask.READ_THREADS in args, args
+        assert '--write_threads=%d' % _.CreateDbTask.WRITE_THREADS in args, args
+        assert '--batch_size=%d' % _.CreateDbTask.BATCH_SIZE in args, args
+
+        args = self.task(shuffle=False).task_arguments({})
+        assert not [a for a in args if str(a).startswith('--read_threads')], args
+
+    def test_cpus(self):
+        """one cpu per read thread"""
+        assert self.task(shuffle=True).cpus_required() == _.CreateDbTask.READ_THREADS
+        assert self.task(shuffle=False).cpus_required() == 1
+
+    def test_memory(self):
+        """memory grows with the threads, the image size and the mean"""
+        shuffled = self.task(shuffle=True).memory_required()
+        ordered = self.task(shuffle=False).memory_required()
+        mean = self.task(shuffle=True, mean_file='mean.binaryproto').memory_required()
+        assert _.CreateDbTask.BASE_MEMORY_REQUIRED < ordered < shuffled < mean
+
+        image_bytes = 256 * 256 * 3
+        batches = (2 + _.CreateDbTask.WRITE_THREADS) * _.CreateDbTask.BATCH_SIZE
+        assert shuffled == _.CreateDbTask.BASE_MEMORY_REQUIRED + image_bytes * batches
+        assert mean - shuffled == image_bytes * 8 * _.CreateDbTask.READ_THREADS
+
+        small = _.CreateDbTask('train.txt', 'train_db', (28, 28, 1),
+                job_dir='/tmp/job', shuffle=True).memory_required()
+        assert small < shuffled
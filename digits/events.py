@@ -0,0 +1,118 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+"""
+A machine-readable channel from the tools to the Task which runs them
+
+The Task passes the write end of a pipe to the tool and puts its number in
+    the ENV_FD environment variable
+Each event is one line of JSON: {"event": <name>, <field>: <value>, ...}
+The human-readable log on stdout doesn't change
+"""
+
+import os
+import json
+import logging
+import threading
+
+ENV_FD = 'DIGITS_EVENTS_FD'
+
+class EventWriter(object):
+    """
+    Writes events to the file descriptor given in ENV_FD
+    Does nothing if the tool wasn't started by a Task
+    """
+
+    def __init__(self, fd=None):
+        """
+        Keyword arguments:
+        fd -- the file descriptor to write to (default: from ENV_FD)
+        """
+        if fd is None:
+            fd = os.environ.get(ENV_FD)
+        self._file = None
+        if fd is not None:
+            try:
+                # line buffered
+                self._file = os.fdopen(int(fd), 'w', 1)
+            except (ValueError, OSError):
+                self._file = None
+        # events may be emitted from several threads
+        self._lock = threading.Lock()
+
+    def enabled(self):
+        return self._file is not None
+
+    def emit(self, event, **fields):
+        """
+        Write an event
+
+        Arguments:
+        event -- the name of the event
+        """
+        if self._file is None:
+            return
+        fields['event'] = event
+        line = json.dumps(fields, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                self._file.write(line)
+            except IOError:
+                # the Task went away - keep going without events
+                self._file = None
+
+
+class EventHandler(logging.Handler):
+    """
+    Sends log records as "log" events with a level and a message
+    """
+
+    def __init__(self, writer, level=logging.WARNING):
+        super(EventHandler, self).__init__(level)
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            self.writer.emit('log',
+                    level=record.levelname.lower(),
+                    message=record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+# the EventWriter used by emit()
+_writer = None
+
+def writer():
+    """
+    Returns the EventWriter for this process
+    """
+    global _writer
+    if _writer is None:
+        _writer = EventWriter()
+    return _writer
+
+def set_writer(new_writer):
+    """
+    Replace the EventWriter for this process
+    (e.g. in a tool forked from a worker which was started without ENV_FD)
+    """
+    global _writer
+    _writer = new_writer
+
+def emit(event, **fields):
+    """
+    Write an event to the Task which started this process (if any)
+    """
+    writer().emit(event, **fields)
+
+def parse(line):
+    """
+    Returns the event (a dict with at least "event") in a line or None
+    """
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(event, dict) or 'event' not in event:
+        return None
+    return event
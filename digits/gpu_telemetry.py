@@ -0,0 +1,251 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import time
+import ctypes
+import itertools
+
+import gevent
+
+from digits import device_query
+from digits.log import logger
+
+class Nvml(object):
+    """
+    The parts of NVML which GpuTelemetry uses
+    Each query returns None if NVML fails
+    """
+
+    def __init__(self, library):
+        """
+        Arguments:
+        library -- the ctypes.CDLL for libnvidia-ml
+        """
+        self.library = library
+
+    def init(self):
+        rc = self.library.nvmlInit()
+        if rc != 0:
+            raise RuntimeError('nvmlInit() failed with error #%s' % rc)
+
+    def shutdown(self):
+        self.library.nvmlShutdown()
+
+    def device_handle(self, index):
+        """
+        Returns the handle for a CUDA device (NVML can number them differently)
+        """
+        device = device_query.get_device(index)
+        handle = device_query.c_nvmlDevice_t()
+        rc = self.library.nvmlDeviceGetHandleByPciBusId(
+                ctypes.c_char_p(device.pciBusID_str), ctypes.byref(handle))
+        if rc != 0:
+            raise RuntimeError('nvmlDeviceGetHandleByPciBusId() failed with error #%s' % rc)
+        return handle
+
+    def memory(self, handle):
+        memory = device_query.c_nvmlMemory_t()
+        if self.library.nvmlDeviceGetMemoryInfo(handle, ctypes.byref(memory)) != 0:
+            return None
+        return {
+                'total': memory.total,
+                'used': memory.used,
+                'free': memory.free,
+                }
+
+    def utilization(self, handle):
+        utilization = device_query.c_nvmlUtilization_t()
+        if self.library.nvmlDeviceGetUtilizationRates(handle, ctypes.byref(utilization)) != 0:
+            return None
+        return {
+                'gpu': utilization.gpu,
+                'memory': utilization.memory,
+                }
+
+    def temperature(self, handle):
+        temperature = ctypes.c_int()
+        if self.library.nvmlDeviceGetTemperature(handle, 0, ctypes.byref(temperature)) != 0:
+            return None
+        return temperature.value
+
+
+class GpuTelemetry(object):
+    """
+    Samples the GPUs which are in use with NVML
+
+    NVML is initialized once and the device handles are kept, and each GPU
+        is queried once per INTERVAL however many subscribers watch it
+    Samples are dicts like the ones from device_query.get_nvml_info()
+    """
+
+    # Seconds between samples
+    INTERVAL = 1
+
+    def __init__(self, nvml=None, interval=None):
+        """
+        Keyword arguments:
+        nvml -- an Nvml (default: libnvidia-ml if it's installed)
+        interval -- overrides INTERVAL
+        """
+        if nvml is None:
+            library = device_query.get_library('libnvidia-ml')
+            if library is not None:
+                nvml = Nvml(library)
+        self.nvml = nvml
+        self.interval = interval or self.INTERVAL
+        self._initialized = False
+        # index -> handle (or None if it couldn't be found)
+        self._handles = {}
+        # index -> the last sample
+        self._samples = {}
+        # id -> (indices, callback)
+        self._subscribers = {}
+        self._ids = itertools.count()
+        self._poller = None
+
+    def available(self):
+        """
+        Returns True if NVML can be used
+        """
+        return self.nvml is not None
+
+    def subscribe(self, indices, callback=None):
+        """
+        Start sampling some GPUs
+        Returns an id for unsubscribe()
+
+        Arguments:
+        indices -- a list of device indices
+
+        Keyword arguments:
+        callback -- called with a dict of {index: sample} for these GPUs
+            after each round of samples
+        """
+        subscription = next(self._ids)
+        self._subscribers[subscription] = (list(indices), callback)
+        if self._poller is None and self.available():
+            self._poller = gevent.spawn(self.run)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop sampling for a subscriber
+        """
+        self._subscribers.pop(subscription, None)
+        watched = self.watched()
+        for index in self._samples.keys():
+            if index not in watched:
+                del self._samples[index]
+
+    def watched(self):
+        """
+        Returns the set of indices which somebody subscribed to
+        """
+        return set(index for indices, _ in self._subscribers.itervalues()
+                for index in indices)
+
+    def latest(self, index):
+        """
+        Returns the last sample for a GPU or None
+        """
+        return self._samples.get(index)
+
+    def run(self):
+        """
+        Samples the GPUs until nobody is subscribed
+        """
+        try:
+            while self._subscribers:
+                start = time.time()
+                self.poll()
+                gevent.sleep(max(0, self.interval - (time.time() - start)))
+        finally:
+            self._poller = None
+
+    def poll(self):
+        """
+        Sample every watched GPU once and notify the subscribers
+        """
+        for index in sorted(self.watched()):
+            self._samples[index] = self.sample(index)
+        for indices, callback in self._subscribers.values():
+            if callback is None:
+                continue
+            try:
+                callback(dict((index, self._samples.get(index)) for index in indices))
+            except Exception as e:
+                logger.error('GPU telemetry callback failed: %s' % e)
+
+    def sample(self, index):
+        """
+        Query NVML for a GPU
+        Returns a dict or None
+        """
+        handle = self.handle(index)
+        if handle is None:
+            return None
+        info = {}
+        memory = self.nvml.memory(handle)
+        if memory is not None:
+            info['memory'] = memory
+        utilization = self.nvml.utilization(handle)
+        if utilization is not None:
+            info['utilization'] = utilization
+        temperature = self.nvml.temperature(handle)
+        if temperature is not None:
+            info['temperature'] = temperature
+        return info
+
+    def handle(self, index):
+        """
+        Returns the NVML handle for a GPU or None
+        """
+        if not self.available():
+            return None
+        if not self._initialized:
+            try:
+                self.nvml.init()
+            except Exception as e:
+                logger.error('GPU telemetry disabled: %s' % e)
+                self.nvml = None
+                return None
+            self._initialized = True
+        if index not in self._handles:
+            try:
+                self._handles[index] = self.nvml.device_handle(index)
+            except Exception as e:
+                logger.warning('No NVML handle for GPU #%s: %s' % (index, e))
+                self._handles[index] = None
+        return self._handles[index]
+
+    def stop(self):
+        """
+        Stop sampling and shut down NVML
+        """
+        self._subscribers = {}
+        if self._poller is not None:
+            self._poller.kill()
+        self._samples = {}
+        self._handles = {}
+        if self._initialized:
+            self._initialized = False
+            self.nvml.shutdown()
+
+
+# the GpuTelemetry used by get_telemetry()
+_telemetry = None
+
+def get_telemetry():
+    """
+    Returns the GpuTelemetry for this process
+    """
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = GpuTelemetry()
+    return _telemetry
+
+def stop_telemetry():
+    """
+    Stop the GpuTelemetry (if it was started)
+    """
+    if _telemetry is not None:
+        _telemetry.stop()
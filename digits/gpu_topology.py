@@ -0,0 +1,289 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import re
+import itertools
+import subprocess
+
+import device_query
+
+# Cost of the link between two GPUs (lower is better)
+# Uses the connection types printed by "nvidia-smi topo -m"
+LINK_COSTS = {
+        'X':    0,  # same device
+        'NV':   5,  # NVLink
+        'PIX':  10, # single PCIe switch
+        'PXB':  20, # multiple PCIe switches
+        'PHB':  30, # PCIe host bridge
+        'NODE': 40, # host bridges on the same CPU socket
+        'SOC':  50, # across CPU sockets
+        'SYS':  50, # across CPU sockets
+        }
+# Used when the link between two GPUs is unknown
+UNKNOWN_COST = LINK_COSTS['PHB']
+
+# Above this many candidate sets, place GPUs greedily
+MAX_COMBINATIONS = 1000
+
+class Topology(object):
+    """
+    Describes how GPUs are connected to each other
+    GPUs are referred to by their CUDA device index (as a string)
+
+    This base class knows nothing, so all GPUs are equally far apart
+    """
+
+    def __init__(self, matrix=None):
+        """
+        Keyword arguments:
+        matrix -- a dict mapping (index, index) to a link cost
+        """
+        if matrix is None:
+            matrix = {}
+        self.matrix = matrix
+
+    def distance(self, a, b):
+        """
+        Returns the cost of the link between two GPUs
+        """
+        if a == b:
+            return 0
+        cost = self.matrix.get((a, b), None)
+        if cost is None:
+            cost = self.matrix.get((b, a), UNKNOWN_COST)
+        return cost
+
+    def score(self, gpus):
+        """
+        Returns a sort key for a set of GPUs (lower is better)
+        The slowest link matters most, then the total cost of all links
+        """
+        costs = [self.distance(a, b) for a, b in itertools.combinations(gpus, 2)]
+        if not costs:
+            return (0, 0)
+        return (max(costs), sum(costs))
+
+    def best_set(self, candidates, count):
+        """
+        Returns the best connected list of count GPUs from candidates
+        Ties go to the earliest candidates in the list
+        Returns None if there aren't enough candidates
+
+        Arguments:
+        candidates -- a list of GPU indices, in order of preference
+        count -- how many GPUs are needed
+        """
+        if len(candidates) < count:
+            return None
+        if count <= 1:
+            return list(candidates[:count])
+
+        if n_choose_k(len(candidates), count) <= MAX_COMBINATIONS:
+            best = None
+            best_score = None
+            for gpus in itertools.combinations(candidates, count):
+                score = self.score(gpus)
+                if best is None or score < best_score:
+                    best = gpus
+                    best_score = score
+            return list(best)
+
+        # too many combinations - grow a set from each starting GPU
+        best = None
+        best_score = None
+        for start in candidates:
+            gpus = [start]
+            while len(gpus) < count:
+                gpus.append(min(
+                    (c for c in candidates if c not in gpus),
+                    key=lambda c: max(self.distance(c, g) for g in gpus),
+                    ))
+            score = self.score(gpus)
+            if best is None or score < best_score:
+                best = gpus
+                best_score = score
+        return best
+
+def n_choose_k(n, k):
+    """
+    Returns the number of combinations of k items out of n
+    """
+    result = 1
+    for i in xrange(min(k, n - k)):
+        result = result * (n - i) // (i + 1)
+    return result
+
+def normalize_bus_id(bus_id):
+    """
+    Returns a PCI bus ID in the format "dddd:bb:dd.f" (lowercase)
+    nvidia-smi pads the domain to 8 digits, CUDA pads it to 4
+
+    Returns None if the bus ID can't be parsed
+    """
+    if not bus_id:
+        return None
+    match = re.match(r'([0-9a-fA-F]+):([0-9a-fA-F]+):([0-9a-fA-F]+)\.([0-9a-fA-F]+)',
+            bus_id.strip('\x00 \n'))
+    if not match:
+        return None
+    return '%04x:%02x:%02x.%x' % tuple(int(g, 16) for g in match.groups())
+
+def cuda_bus_ids():
+    """
+    Returns a dict mapping CUDA device index to PCI bus ID
+    """
+    bus_ids = {}
+    for index, device in enumerate(device_query.get_devices()):
+        bus_id = normalize_bus_id(getattr(device, 'pciBusID_str', None))
+        if bus_id is not None:
+            bus_ids[str(index)] = bus_id
+    return bus_ids
+
+def parse_nvidia_smi_topo(text):
+    """
+    Parses the output of "nvidia-smi topo -m"
+    Returns a dict mapping (nvidia-smi index, nvidia-smi index) to a link cost
+    """
+    matrix = {}
+    columns = None
+    for line in text.splitlines():
+        tokens = line.split()
+        if not tokens:
+            continue
+        if columns is None:
+            if tokens[0].startswith('GPU'):
+                # header row
+                columns = tokens
+            continue
+        match = re.match(r'GPU(\d+)$', tokens[0])
+        if not match:
+            if tokens[0].startswith('Legend'):
+                break
+            continue
+        row = match.group(1)
+        for column, link in zip(columns, tokens[1:]):
+            column_match = re.match(r'GPU(\d+)$', column)
+            if not column_match:
+                continue
+            kind = re.sub(r'\d+$', '', link)
+            if kind in LINK_COSTS:
+                cost = LINK_COSTS[kind]
+                if kind == 'NV':
+                    # more NVLinks are better
+                    cost -= min(int(link[2:] or 1), LINK_COSTS['NV'] - 1)
+                matrix[(row, column_match.group(1))] = cost
+    return matrix
+
+def nvidia_smi_topology(bus_ids=None, run=None):
+    """
+    Returns a Topology built from "nvidia-smi topo -m", or None
+
+    Keyword arguments:
+    bus_ids -- a dict mapping CUDA index to PCI bus ID (default: query CUDA)
+    run -- a function which takes an argument list and returns the output
+    """
+    if bus_ids is None:
+        bus_ids = cuda_bus_ids()
+    if run is None:
+        run = subprocess.check_output
+    try:
+        text = run(['nvidia-smi', 'topo', '-m'])
+        smi_bus_ids = run(['nvidia-smi', '--query-gpu=index,pci.bus_id',
+            '--format=csv,noheader'])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    # nvidia-smi orders GPUs by PCI bus ID, CUDA may not
+    to_cuda = {}
+    by_bus_id = dict((bus_id, index) for index, bus_id in bus_ids.iteritems())
+    for line in smi_bus_ids.splitlines():
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) == 2:
+            cuda_index = by_bus_id.get(normalize_bus_id(parts[1]), None)
+            if cuda_index is not None:
+                to_cuda[parts[0]] = cuda_index
+
+    matrix = {}
+    for (a, b), cost in parse_nvidia_smi_topo(text).iteritems():
+        if a in to_cuda and b in to_cuda:
+            matrix[(to_cuda[a], to_cuda[b])] = cost
+    if not matrix:
+        return None
+    return Topology(matrix)
+
+def sysfs_topology(bus_ids=None, sysfs='/sys'):
+    """
+    Returns a Topology built from the PCIe tree in sysfs, or None
+
+    Keyword arguments:
+    bus_ids -- a dict mapping CUDA index to PCI bus ID (default: query CUDA)
+    sysfs -- where sysfs is mounted
+    """
+    if bus_ids is None:
+        bus_ids = cuda_bus_ids()
+
+    paths = {}
+    numa_nodes = {}
+    for index, bus_id in bus_ids.iteritems():
+        device_dir = os.path.join(sysfs, 'bus', 'pci', 'devices', bus_id)
+        if not os.path.exists(device_dir):
+            continue
+        # e.g. /sys/devices/pci0000:00/0000:00:03.0/0000:03:00.0
+        path = os.path.realpath(device_dir)
+        paths[index] = [p for p in path.split(os.sep) if p][:-1]
+        try:
+            with open(os.path.join(device_dir, 'numa_node')) as infile:
+                numa_nodes[index] = int(infile.read())
+        except (IOError, ValueError):
+            numa_nodes[index] = -1
+    if not paths:
+        return None
+
+    matrix = {}
+    for a, b in itertools.combinations(sorted(paths), 2):
+        common = 0
+        for x, y in zip(paths[a], paths[b]):
+            if x != y:
+                break
+            common += 1
+        # bridges shared below the root complex (pciXXXX:XX)
+        root = [i for i, p in enumerate(paths[a]) if p.startswith('pci')]
+        shared = common - (root[0] + 1) if root else 0
+        if shared < 0:
+            if numa_nodes[a] != numa_nodes[b] or numa_nodes[a] < 0:
+                cost = LINK_COSTS['SYS']
+            else:
+                cost = LINK_COSTS['NODE']
+        elif shared == 0:
+            cost = LINK_COSTS['PHB']
+        elif max(len(paths[a]), len(paths[b])) - common <= 1:
+            # both GPUs hang off the same switch
+            cost = LINK_COSTS['PIX']
+        else:
+            cost = LINK_COSTS['PXB']
+        matrix[(a, b)] = cost
+    return Topology(matrix)
+
+_topology = None
+
+def get_topology(force_reload=False):
+    """
+    Returns the Topology of the GPUs on this host
+    Tries nvidia-smi, then sysfs, then assumes nothing
+
+    Keyword arguments:
+    force_reload -- if False, return the previously loaded Topology
+    """
+    global _topology
+    if force_reload or _topology is None:
+        _topology = nvidia_smi_topology() or sysfs_topology() or Topology()
+    return _topology
+
+def set_topology(topology):
+    """
+    Replace the Topology returned by get_topology()
+    (None to detect it again)
+    """
+    global _topology
+    _topology = topology
+
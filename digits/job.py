@@ -3,22 +3,43 @@
 import os
 import time
 import os.path
+import json
 import pickle
 import shutil
 
 import flask
 
 from digits.config import config_value
+from digits.utils import dir_size
+import serialization
 from status import Status, StatusCls
 
 # NOTE: Increment this everytime the pickled object changes
-PICKLE_VERSION = 1
+PICKLE_VERSION = 2
 
 class Job(StatusCls):
     """
     Base class
     """
-    SAVE_FILE = 'status.pickle'
+    SAVE_FILE = 'status.state'
+    # Jobs were pickled to this file before the serialization module
+    PICKLE_FILE = 'status.pickle'
+    SUMMARY_FILE = 'summary.json'
+    # Archived jobs are compressed into this file (see job_archive)
+    ARCHIVE_FILE = 'archive.tar.gz'
+
+    # Jobs with a higher priority are started first
+    PRIORITY_LOW = -1
+    PRIORITY_NORMAL = 0
+    PRIORITY_HIGH = 1
+    PRIORITY_CHOICES = [
+            (PRIORITY_HIGH, 'High'),
+            (PRIORITY_NORMAL, 'Normal'),
+            (PRIORITY_LOW, 'Low'),
+            ]
+
+    # Seconds before disk_usage() measures the job directory again
+    DISK_USAGE_MAX_AGE = 60
 
     @classmethod
     def load(cls, job_id):
@@ -30,21 +51,33 @@ class Job(StatusCls):
 
         job_dir = os.path.join(config_value('jobs_dir'), job_id)
         filename = os.path.join(job_dir, cls.SAVE_FILE)
-        with open(filename, 'rb') as savefile:
-            job = pickle.load(savefile)
-            # Reset this on load
-            job._dir = job_dir
-            for task in job.tasks:
-                task.job_dir = job_dir
-                if isinstance(task, TrainTask):
-                    # can't call this until the job_dir is set
-                    task.detect_snapshots()
-            return job
-
-    def __init__(self, name):
+        if os.path.exists(filename):
+            with open(filename, 'rb') as savefile:
+                job = serialization.load(savefile)
+        else:
+            with open(os.path.join(job_dir, cls.PICKLE_FILE), 'rb') as savefile:
+                job = pickle.load(savefile)
+            # rewrite it in the new format
+            job.mark_dirty()
+        # Reset this on load
+        job._dir = job_dir
+        for task in job.tasks:
+            task.job_dir = job_dir
+            if isinstance(task, TrainTask):
+                # can't call these until the job_dir is set
+                task.detect_snapshots()
+                task.load_outputs()
+        return job
+
+    def __init__(self, name, username=None, priority=None):
         """
         Arguments:
         name -- name of this job
+
+        Keyword arguments:
+        username -- who created this job (for fair share scheduling, as
+            given in the form rather than authenticated)
+        priority -- one of the PRIORITY_* values (default PRIORITY_NORMAL)
         """
         super(Job, self).__init__()
 
@@ -52,29 +85,52 @@ class Job(StatusCls):
         self._id = '%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), os.urandom(2).encode('hex'))
         self._dir = os.path.join(config_value('jobs_dir'), self._id)
         self._name = name
+        self.username = username
+        if priority is None:
+            priority = self.PRIORITY_NORMAL
+        self.priority = priority
         self.pickver_job = PICKLE_VERSION
         self.tasks = []
         self.exception = None
+        # Set by the JobRegistry which stores this job
+        self._registry = None
+        # True if this job has changed since it was last saved
+        self._dirty = True
+        # (time measured, bytes) for disk_usage()
+        self._disk_usage = None
 
         os.mkdir(self._dir)
 
 
     def __getstate__(self):
         """
-        Used when saving a pickle file
+        Used when saving the job (see serialization)
         """
         d = self.__dict__.copy()
         # Isn't linked to state
         if '_dir' in d:
             del d['_dir']
+        if '_registry' in d:
+            del d['_registry']
+        if '_dirty' in d:
+            del d['_dirty']
+        if '_disk_usage' in d:
+            del d['_disk_usage']
 
         return d
 
     def __setstate__(self, state):
         """
-        Used when loading a pickle file
+        Used when loading the job (see serialization)
         """
+        if state['pickver_job'] < 2:
+            state['username'] = None
+            state['priority'] = self.PRIORITY_NORMAL
+        state['pickver_job'] = PICKLE_VERSION
         self.__dict__ = state
+        self._registry = None
+        self._dirty = False
+        self._disk_usage = None
 
     def json_dict(self, detailed=False):
         """
@@ -84,10 +140,14 @@ class Job(StatusCls):
                 'id': self.id(),
                 'name': self.name(),
                 'status': self.status.name,
+                'username': self.username,
+                'priority': self.priority,
                 }
         if detailed:
             d.update({
                 'directory': self.dir(),
+                'disk_usage': self.disk_usage(),
+                'tasks': [t.json_dict() for t in self.tasks],
                 })
         return d
 
@@ -139,26 +199,70 @@ class Job(StatusCls):
         """
         raise NotImplementedError('Implement me!')
 
+    def disk_usage(self, refresh=False):
+        """
+        Returns the number of bytes used by the job directory
+        The result is cached for DISK_USAGE_MAX_AGE seconds
+
+        Keyword arguments:
+        refresh -- if True, measure it again now
+        """
+        if refresh or self._disk_usage is None or \
+                time.time() - self._disk_usage[0] > self.DISK_USAGE_MAX_AGE:
+            self._disk_usage = (time.time(), dir_size(self._dir))
+        return self._disk_usage[1]
+
+    def mark_dirty(self):
+        """
+        Mark this job as needing to be saved
+        """
+        self._dirty = True
+
+    def is_dirty(self):
+        """
+        Returns True if the job or any of its tasks have changed since the
+        job was last saved
+        """
+        return self._dirty or any(task.is_dirty() for task in self.tasks)
+
     def on_status_update(self):
         """
         Called when StatusCls.status.setter is used
         """
-        from digits.webapp import app, socketio
+        from digits.webapp import app, rooms
 
-        message = {
-                'update': 'status',
-                'status': self.status.name,
-                'css': self.status.css,
-                'running': self.status.is_running(),
-                }
-        with app.app_context():
-            message['html'] = flask.render_template('status_updates.html', updates=self.status_history)
+        self.mark_dirty()
+        if self._registry is not None:
+            self._registry.update_status(self)
+
+        def build():
+            message = {
+                    'update': 'status',
+                    'status': self.status.name,
+                    'css': self.status.css,
+                    'running': self.status.is_running(),
+                    }
+            with app.app_context():
+                message['html'] = flask.render_template('status_updates.html', updates=self.status_history)
+            return message
 
-        socketio.emit('job update',
-                message,
-                namespace='/jobs',
-                room=self.id(),
-                )
+        rooms.emit('job update', build, self.id(), key='status')
+
+    def summary(self):
+        """
+        Returns a dict with enough information to list this job without
+        loading it (see JobSummary)
+        """
+        return {
+                'version': JobSummary.VERSION,
+                'id': self.id(),
+                'name': self.name(),
+                'class': '%s.%s' % (type(self).__module__, type(self).__name__),
+                'status_history': [(s.val, t) for s, t in self.status_history],
+                'dataset_id': getattr(self, 'dataset_id', None),
+                'username': self.username,
+                'priority': self.priority,
+                }
 
     def abort(self):
         """
@@ -171,15 +275,28 @@ class Job(StatusCls):
 
     def save(self):
         """
-        Saves the job to disk as a pickle file
+        Saves the job to disk (see serialization)
         Suppresses errors, but returns False if something goes wrong
         """
         try:
-            # use tmpfile so we don't abort during pickle dump (leading to EOFErrors)
+            # write anything which is appended rather than saved with the job
+            for task in self.tasks:
+                task.persist()
+            # use tmpfile so we don't abort during the dump (leading to truncated files)
             tmpfile_path = self.path(self.SAVE_FILE + '.tmp')
             with open(tmpfile_path, 'wb') as tmpfile:
-                pickle.dump(self, tmpfile)
+                serialization.dump(self, tmpfile)
             shutil.move(tmpfile_path, self.path(self.SAVE_FILE))
+            if os.path.exists(self.path(self.PICKLE_FILE)):
+                os.remove(self.path(self.PICKLE_FILE))
+            # write the summary after the job so that it's never newer
+            tmpfile_path = self.path(self.SUMMARY_FILE + '.tmp')
+            with open(tmpfile_path, 'w') as tmpfile:
+                json.dump(self.summary(), tmpfile)
+            shutil.move(tmpfile_path, self.path(self.SUMMARY_FILE))
+            self._dirty = False
+            for task in self.tasks:
+                task.mark_clean()
             return True
         except KeyboardInterrupt:
             pass
@@ -187,3 +304,104 @@ class Job(StatusCls):
             print 'Caught %s while saving job: %s' % (type(e).__name__, e)
         return False
 
+
+class JobSummary(object):
+    """
+    A lightweight stand-in for a Job which hasn't been loaded from disk yet
+    Has just enough information to list the job (id, name, type, status)
+    """
+    # NOTE: Increment this everytime the summary format changes
+    VERSION = 3
+
+    @classmethod
+    def load(cls, job_id):
+        """
+        Loads the JobSummary for the given job_id
+        Returns None if the summary is missing or older than the saved job
+        """
+        job_dir = os.path.join(config_value('jobs_dir'), job_id)
+        filename = os.path.join(job_dir, Job.SUMMARY_FILE)
+        save_filename = os.path.join(job_dir, Job.SAVE_FILE)
+        # the save file of an archived job is inside the archive, and the
+        #   summary was written before the job was archived
+        archived = os.path.exists(os.path.join(job_dir, Job.ARCHIVE_FILE))
+        if not archived and not os.path.exists(save_filename):
+            # not converted from a pickle file yet
+            return None
+        try:
+            if not archived and os.path.getmtime(filename) < os.path.getmtime(save_filename):
+                return None
+            with open(filename) as infile:
+                summary = json.load(infile)
+        except (IOError, OSError, ValueError):
+            return None
+        if summary.get('id') != job_id:
+            return None
+        if summary.get('version') != cls.VERSION:
+            # archived jobs keep their old summary until they're restored
+            #   (version 1 has no pretrained_model, version 2 no snapshot_epochs)
+            if not (archived and summary.get('version') in (1, 2)):
+                return None
+        return cls(job_dir, summary)
+
+    def __init__(self, job_dir, summary):
+        """
+        Arguments:
+        job_dir -- the directory for this job
+        summary -- a dict created by Job.summary()
+        """
+        self._dir = job_dir
+        self._id = str(summary['id'])
+        self._name = summary['name']
+        self._class_path = str(summary['class'])
+        self.status_history = [(Status(str(s)), t) for s, t in summary['status_history']]
+        if summary['dataset_id'] is not None:
+            self.dataset_id = str(summary['dataset_id'])
+        self.username = summary.get('username')
+        self.priority = summary.get('priority', Job.PRIORITY_NORMAL)
+        # the snapshot a ModelJob was initialized from
+        self.pretrained_model = summary.get('pretrained_model')
+        # the epochs of the snapshots of a ModelJob (oldest first)
+        self.snapshot_epochs = summary.get('snapshot_epochs') or []
+
+    @property
+    def status(self):
+        if len(self.status_history) > 0:
+            return self.status_history[-1][0]
+        else:
+            return Status(Status.INIT)
+
+    def id(self):
+        return self._id
+
+    def dir(self):
+        return self._dir
+
+    def name(self):
+        return self._name
+
+    def job_class(self):
+        """
+        Returns the class of the Job which this summarizes
+        """
+        module_name, _, class_name = self._class_path.rpartition('.')
+        module = __import__(module_name, fromlist=[class_name])
+        return getattr(module, class_name)
+
+    def json_dict(self, detailed=False):
+        """
+        Returns a dict used for a JSON representation
+        Matches Job.json_dict() for the non-detailed case
+        """
+        d = {
+                'id': self.id(),
+                'name': self.name(),
+                'status': self.status.name,
+                'username': self.username,
+                'priority': self.priority,
+                }
+        if detailed:
+            d.update({
+                'directory': self.dir(),
+                })
+        return d
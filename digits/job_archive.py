@@ -0,0 +1,79 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+"""
+Compresses the directory of a job which isn't used anymore
+
+Everything but the summary is moved into a single Job.ARCHIVE_FILE, so that
+    the job can still be listed (see JobSummary) without being restored
+"""
+
+import os
+import shutil
+import tarfile
+
+from job import Job
+
+# gzip compression level (lower is faster)
+COMPRESS_LEVEL = 6
+
+def is_archived(job_dir):
+    """
+    Returns True if the job directory has been archived
+    """
+    return os.path.exists(os.path.join(job_dir, Job.ARCHIVE_FILE))
+
+def archive(job_dir):
+    """
+    Move the contents of a job directory into an archive
+    Returns the size of the archive in bytes
+
+    The files are only deleted once the archive is complete, so a failure
+        leaves the job directory as it was
+    """
+    filename = os.path.join(job_dir, Job.ARCHIVE_FILE)
+    if os.path.exists(filename):
+        raise ValueError('"%s" is already archived' % job_dir)
+    tmp_filename = filename + '.tmp'
+    names = [name for name in sorted(os.listdir(job_dir))
+            if name not in (Job.SUMMARY_FILE, os.path.basename(tmp_filename))]
+    try:
+        with tarfile.open(tmp_filename, 'w:gz', compresslevel=COMPRESS_LEVEL) as tar:
+            for name in names:
+                tar.add(os.path.join(job_dir, name), arcname=name)
+    except:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    os.rename(tmp_filename, filename)
+
+    for name in names:
+        path = os.path.join(job_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    return os.path.getsize(filename)
+
+def restore(job_dir):
+    """
+    Extract the archive of a job directory and delete it
+
+    If this is interrupted, the archive is still there and the job can be
+        restored again
+    """
+    filename = os.path.join(job_dir, Job.ARCHIVE_FILE)
+    with tarfile.open(filename, 'r:gz') as tar:
+        members = tar.getmembers()
+        for member in members:
+            if not is_local(member.name):
+                raise ValueError('Archive for "%s" has a path outside of the job directory: %s'
+                        % (job_dir, member.name))
+        tar.extractall(job_dir, members)
+    os.remove(filename)
+
+def is_local(path):
+    """
+    Returns True if an archived path stays inside the job directory
+    """
+    path = os.path.normpath(path)
+    return not os.path.isabs(path) and not path.startswith('..')
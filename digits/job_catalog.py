@@ -0,0 +1,319 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import sqlite3
+import contextlib
+
+from job import Job, JobSummary
+from status import Status
+
+class JobCatalog(object):
+    """
+    A SQLite table with a row for each Job known to the JobRegistry
+    Used to list, filter and page through jobs without touching the Jobs
+
+    The catalog only holds information which can be rebuilt from the jobs
+        directory, so it isn't synced to disk after every change
+
+    Archived jobs (see job_archive) aren't in the JobRegistry, but keep
+        their row so that they can still be listed
+
+    The last time each job was used is kept here too, so that stale jobs
+        can still be found after a restart (losing it only delays archiving)
+    """
+
+    # Jobs which haven't finished yet
+    RUNNING_STATUSES = [Status.INIT, Status.WAIT, Status.RUN]
+
+    def __init__(self, filename=':memory:'):
+        """
+        Keyword arguments:
+        filename -- where to store the database
+        """
+        self.filename = filename
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.text_factory = str
+        self._conn.execute('PRAGMA synchronous=OFF')
+        # commit after each change, unless inside batch()
+        self._batch_depth = 0
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    class TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL,
+                    dataset_id TEXT,
+                    user TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    archived INTEGER NOT NULL DEFAULT 0,
+                    pretrained_model TEXT,
+                    retention TEXT,
+                    accessed REAL
+                )""")
+            # added after the table was first created
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')]
+            if 'archived' not in columns:
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN archived INTEGER NOT NULL DEFAULT 0')
+            for column, column_type in [('pretrained_model', 'TEXT'), ('retention', 'TEXT'),
+                    ('accessed', 'REAL'), ('updated', 'REAL')]:
+                if column not in columns:
+                    self._conn.execute('ALTER TABLE jobs ADD COLUMN %s %s' % (column, column_type))
+            for column in ['type', 'status', 'name', 'created', 'dataset_id', 'user']:
+                self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_%s ON jobs (%s)'
+                        % (column, column))
+
+    @staticmethod
+    def job_type(job):
+        """
+        Returns "dataset", "model" or "job" for a Job or JobSummary
+        """
+        from digits.dataset import DatasetJob
+        from digits.model import ModelJob
+
+        if isinstance(job, JobSummary):
+            cls = job.job_class()
+        else:
+            cls = job.__class__
+        if issubclass(cls, DatasetJob):
+            return 'dataset'
+        elif issubclass(cls, ModelJob):
+            return 'model'
+        return 'job'
+
+    @staticmethod
+    def pretrained_model(job):
+        """
+        Returns the snapshot which a ModelJob (or its JobSummary) was
+        initialized from, or None
+        """
+        if isinstance(job, JobSummary):
+            return job.pretrained_model
+        train_task = getattr(job, 'train_task', None)
+        if train_task is None:
+            return None
+        return train_task().pretrained_model
+
+    @staticmethod
+    def status_times(job):
+        """
+        Returns (created, updated) for a Job or JobSummary
+        (the times of its first and last status changes)
+        """
+        if job.status_history:
+            return job.status_history[0][1], job.status_history[-1][1]
+        return 0, 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Commit all the changes made inside this block at once
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._conn.commit()
+
+    def _commit(self):
+        if self._batch_depth == 0:
+            self._conn.commit()
+
+    ### Modifiers
+
+    def update(self, job, archived=False):
+        """
+        Add or replace the row for a Job or JobSummary
+        The retention policy last enforced on it and its last access are kept
+
+        Keyword arguments:
+        archived -- whether the job has been archived
+        """
+        created, updated = self.status_times(job)
+        if isinstance(job, JobSummary):
+            class_path = job._class_path
+        else:
+            class_path = '%s.%s' % (type(job).__module__, type(job).__name__)
+        self._conn.execute(
+                'INSERT OR REPLACE INTO jobs '
+                '(id, type, class, status, name, created, updated, dataset_id, user, priority, '
+                'archived, pretrained_model, retention, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '
+                '(SELECT retention FROM jobs WHERE id = ?), '
+                '(SELECT accessed FROM jobs WHERE id = ?))',
+                (job.id(), self.job_type(job), class_path, job.status.val,
+                    job.name(), created, updated, getattr(job, 'dataset_id', None),
+                    job.username, job.priority, int(bool(archived)),
+                    self.pretrained_model(job), job.id(), job.id()))
+        self._commit()
+
+    def update_status(self, job):
+        """
+        Update the status of a Job
+        """
+        self._conn.execute('UPDATE jobs SET status = ?, updated = ? WHERE id = ?',
+                (job.status.val, self.status_times(job)[1], job.id()))
+        self._commit()
+
+    def set_retention(self, job_id, policy):
+        """
+        Remember the retention policy which was enforced on a Job
+
+        Arguments:
+        policy -- a string which identifies the policy
+        """
+        self._conn.execute('UPDATE jobs SET retention = ? WHERE id = ?',
+                (policy, job_id))
+        self._commit()
+
+    def set_accessed(self, job_id, timestamp):
+        """
+        Remember when a Job was last used
+        """
+        self._conn.execute('UPDATE jobs SET accessed = ? WHERE id = ?',
+                (timestamp, job_id))
+        self._commit()
+
+    def remove(self, job_id):
+        """
+        Remove the row for a Job
+        """
+        self._conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        self._commit()
+
+    def retain(self, job_ids):
+        """
+        Remove the rows for all jobs which aren't in job_ids
+        """
+        job_ids = set(job_ids)
+        stale = [(row[0],) for row in self._conn.execute('SELECT id FROM jobs')
+                if row[0] not in job_ids]
+        self._conn.executemany('DELETE FROM jobs WHERE id = ?', stale)
+        self._commit()
+
+    ### Queries
+
+    @classmethod
+    def _where(cls, job_type=None, status=None, running=None, q=None,
+            archived=None, dataset_id=None):
+        """
+        Returns (sql, params) for the WHERE clause of a query
+        """
+        clauses = []
+        params = []
+        if job_type is not None:
+            clauses.append('type = ?')
+            params.append(job_type)
+        if status:
+            clauses.append('status IN (%s)' % ', '.join('?' * len(status)))
+            params.extend(status)
+        if running is not None:
+            clauses.append('status %s (%s)' % (
+                'IN' if running else 'NOT IN',
+                ', '.join('?' * len(cls.RUNNING_STATUSES))))
+            params.extend(cls.RUNNING_STATUSES)
+        if archived is not None:
+            clauses.append('archived = ?')
+            params.append(int(bool(archived)))
+        if dataset_id is not None:
+            clauses.append('dataset_id = ?')
+            params.append(dataset_id)
+        if q:
+            pattern = '%%%s%%' % q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("(name LIKE ? ESCAPE '\\' OR id LIKE ? ESCAPE '\\' OR user LIKE ? ESCAPE '\\')")
+            params.extend([pattern] * 3)
+        if not clauses:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def query(self, job_type=None, status=None, running=None, q=None,
+            archived=None, dataset_id=None, limit=None, offset=0):
+        """
+        Returns a list of rows (dict-like) sorted by creation time (newest first)
+
+        Keyword arguments:
+        job_type -- "dataset" or "model"
+        status -- a list of status values (e.g. [Status.DONE])
+        running -- if True or False, filter on Status.is_running()
+        q -- only return jobs whose name, id or user contains this
+        archived -- if True or False, filter on whether the job is archived
+        dataset_id -- only return the ModelJobs which use this dataset
+        limit -- return at most this many rows
+        offset -- skip this many rows
+        """
+        where, params = self._where(job_type, status, running, q, archived, dataset_id)
+        sql = 'SELECT * FROM jobs%s ORDER BY created DESC, id DESC' % where
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [-1 if limit is None else limit, offset]
+        return self._conn.execute(sql, params).fetchall()
+
+    def count(self, job_type=None, status=None, running=None, q=None,
+            archived=None, dataset_id=None):
+        """
+        Returns the number of rows which query() would return without a limit
+        """
+        where, params = self._where(job_type, status, running, q, archived, dataset_id)
+        return self._conn.execute('SELECT COUNT(*) FROM jobs%s' % where, params).fetchone()[0]
+
+    def retention_pending(self, policy):
+        """
+        Returns the ids of the finished ModelJobs (oldest first) which
+        policy hasn't been enforced on
+
+        Arguments:
+        policy -- a string which identifies the policy
+        """
+        where, params = self._where(job_type='model', running=False, archived=False)
+        sql = ('SELECT id FROM jobs%s AND (retention IS NULL OR retention != ?) '
+                'ORDER BY created, id' % where)
+        return [row[0] for row in self._conn.execute(sql, params + [policy])]
+
+    def last_access(self, job_id):
+        """
+        Returns the time passed to set_accessed() for a Job or None
+        """
+        row = self._conn.execute('SELECT accessed FROM jobs WHERE id = ?',
+                (job_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def pretrained_models(self):
+        """
+        Returns the set of snapshots which ModelJobs were initialized from
+        """
+        return set(row[0] for row in self._conn.execute(
+            'SELECT DISTINCT pretrained_model FROM jobs WHERE pretrained_model IS NOT NULL'))
+
+    @staticmethod
+    def json_dict(row):
+        """
+        Returns a dict which matches Job.json_dict() for a row
+        Archived jobs are flagged with "archived"
+        """
+        d = {
+                'id': row['id'],
+                'name': row['name'],
+                'status': Status(row['status']).name,
+                'username': row['user'],
+                'priority': row['priority'],
+                }
+        if row['archived']:
+            d['archived'] = True
+        return d
+
+    def close(self):
+        """
+        Commit any pending changes and close the database
+        """
+        self._conn.commit()
+        self._conn.close()
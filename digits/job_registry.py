@@ -0,0 +1,383 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import time
+import bisect
+from collections import OrderedDict
+
+from job import Job, JobSummary
+from job_catalog import JobCatalog
+
+class JobRegistry(object):
+    """
+    Stores the Jobs known to the Scheduler
+
+    Jobs are indexed by id, by type, by status and (for ModelJobs) by the
+        dataset they depend on
+    Sorted views (newest first) are maintained incrementally so that the
+        web pages don't need to filter and sort every job on each request
+
+    Jobs which haven't been loaded from disk yet are stored as JobSummaries
+        and are loaded (with the loader) the first time they are requested
+
+    A JobCatalog is kept in sync with the registry, and the last access of
+        each job is stored in it so that it outlives the registry
+
+    Archived jobs are not stored, but their ids are remembered so that
+        they can be restored (see Scheduler.restore_job)
+    """
+
+    # Seconds between the writes of the last access of a job to the catalog
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, loader=None, catalog=None):
+        """
+        Keyword arguments:
+        loader -- a function which takes a JobSummary and returns the Job
+        catalog -- a JobCatalog (an in-memory one by default)
+        """
+        self._loader = loader
+        if catalog is None:
+            catalog = JobCatalog()
+        self.catalog = catalog
+        # job_id -> Job (in the order they were added)
+        self._jobs = OrderedDict()
+        # Status.val -> set of job_ids
+        self._by_status = {}
+        # dataset_id -> set of job_ids for the ModelJobs which use it
+        self._by_dataset = {}
+        # (Job subclass, running) -> list of (created, job_id) sorted ascending
+        #   running is True, False or None (for all jobs of that type)
+        self._sorted = {}
+        # job_id -> (status, running) as currently indexed
+        self._indexed_status = {}
+        # job_ids of the archived jobs
+        self._archived = set()
+        # job_id -> time of the last call to get() (as stored in the catalog)
+        self._accessed = {}
+
+    ### Container methods
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def __iter__(self):
+        # iterate over a copy so that jobs can be added or removed meanwhile
+        return iter(self._jobs.values())
+
+
+    ### Modifiers
+
+    def add(self, job):
+        """
+        Add a Job (or a JobSummary) to the registry
+        Returns False if a job with the same id has already been added
+        """
+        job_id = job.id()
+        if job_id in self._jobs:
+            return False
+
+        self._jobs[job_id] = job
+        self._archived.discard(job_id)
+
+        dataset_id = getattr(job, 'dataset_id', None)
+        if dataset_id is not None:
+            self._by_dataset.setdefault(dataset_id, set()).add(job_id)
+
+        self._index_status(job)
+        # be notified of status changes
+        job._registry = self
+        self.catalog.update(job)
+        return True
+
+    def remove(self, job_id):
+        """
+        Remove a Job from the registry
+        Returns the Job or None if not found
+        """
+        job = self._remove(job_id)
+        archived = job_id in self._archived
+        self._archived.discard(job_id)
+        self._accessed.pop(job_id, None)
+        if job is not None or archived:
+            self.catalog.remove(job_id)
+        return job
+
+    def archive(self, job_id):
+        """
+        Remove a Job from the registry but remember that it was archived
+        Returns the Job or None if not found
+        """
+        job = self._remove(job_id)
+        if job is None:
+            return None
+        self._archived.add(job_id)
+        self._accessed.pop(job_id, None)
+        self.catalog.update(job, archived=True)
+        return job
+
+    def add_archived(self, summary):
+        """
+        Remember a job which was archived before the registry was created
+        Returns False if the job has already been added
+        """
+        job_id = summary.id()
+        if job_id in self._jobs or job_id in self._archived:
+            return False
+        self._archived.add(job_id)
+        self.catalog.update(summary, archived=True)
+        return True
+
+    def update_status(self, job):
+        """
+        Called by the Job when its status changes
+        """
+        job_id = job.id()
+        if job_id not in self._jobs:
+            return
+        old_status, old_running = self._indexed_status[job_id]
+        new_status = job.status.val
+        if new_status == old_status:
+            return
+
+        self._discard(self._by_status, old_status, job_id)
+        self._by_status.setdefault(new_status, set()).add(job_id)
+
+        new_running = job.status.is_running()
+        if new_running != old_running:
+            key = self._sort_key(job)
+            for cls in self._job_classes(job):
+                self._sorted_remove((cls, old_running), key)
+                self._sorted_insert((cls, new_running), key)
+        self._indexed_status[job_id] = (new_status, new_running)
+        self.catalog.update_status(job)
+
+    def update(self, job):
+        """
+        Called when other attributes of a Job change (e.g. the name)
+        """
+        if job.id() in self._jobs:
+            self.catalog.update(job)
+
+    def unload(self, job_id):
+        """
+        Replace a loaded Job with a JobSummary, to free its memory
+        Returns False if the Job is running or has unsaved changes
+        """
+        job = self._jobs.get(job_id)
+        if job is None or isinstance(job, JobSummary):
+            return False
+        if job.status.is_running() or job.is_dirty():
+            return False
+        self._remove(job_id)
+        self.add(JobSummary(job.dir(), job.summary()))
+        return True
+
+    def prune_catalog(self):
+        """
+        Remove the jobs which aren't in the registry from the catalog
+        (e.g. deleted while the server was stopped)
+        """
+        self.catalog.retain(self._jobs.keys() + list(self._archived))
+
+    def batch(self):
+        """
+        Returns a context manager which batches changes to the catalog
+        """
+        return self.catalog.batch()
+
+    def _remove(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return None
+
+        dataset_id = getattr(job, 'dataset_id', None)
+        if dataset_id is not None:
+            self._discard(self._by_dataset, dataset_id, job_id)
+
+        self._unindex_status(job)
+        if getattr(job, '_registry', None) is self:
+            job._registry = None
+        return job
+
+    ### Queries
+
+    def get(self, job_id, access=True):
+        """
+        Returns the Job or None if not found
+        Loads the Job from disk if necessary
+
+        Keyword arguments:
+        access -- if False, don't count this as a use of the Job (see
+            last_access)
+        """
+        job = self.peek(job_id)
+        if job is None:
+            return None
+        if access:
+            self._record_access(job_id)
+        if isinstance(job, JobSummary):
+            job = self._load(job)
+        return job
+
+    def peek(self, job_id):
+        """
+        Returns the Job, a JobSummary or None if not found
+        Never loads anything from disk
+        """
+        if job_id is None:
+            return None
+        return self._jobs.get(job_id, None)
+
+    def is_archived(self, job_id):
+        """
+        Returns True if the job has been archived (and not restored yet)
+        """
+        return job_id in self._archived
+
+    def last_access(self, job_id):
+        """
+        Returns the last time the Job was requested with get() or None
+        (accesses less than ACCESS_RESOLUTION seconds apart count as one)
+        """
+        accessed = self._accessed.get(job_id)
+        if accessed is None:
+            accessed = self.catalog.last_access(job_id)
+        return accessed
+
+    def loaded_jobs(self):
+        """
+        Returns a list of the Jobs which have been loaded (in no particular order)
+        """
+        return [j for j in self._jobs.values() if not isinstance(j, JobSummary)]
+
+    def jobs(self, cls=None, running=None):
+        """
+        Returns a list of Jobs sorted by creation time (newest first)
+        Jobs which haven't been loaded yet are returned as JobSummaries
+
+        Keyword arguments:
+        cls -- if set, only return instances of this Job subclass
+        running -- if True or False, filter on job.status.is_running()
+        """
+        if cls is None:
+            cls = Job
+        keys = self._sorted.get((cls, running), [])
+        return [self._jobs[job_id] for _, job_id in reversed(keys)]
+
+    def with_status(self, status):
+        """
+        Returns a list of Jobs with the given status (in no particular order)
+
+        Arguments:
+        status -- a Status or a status value (e.g. Status.RUN)
+        """
+        val = getattr(status, 'val', status)
+        return [self._jobs[job_id] for job_id in self._by_status.get(val, ())]
+
+    def count(self, cls=None, running=None):
+        """
+        Returns the number of Jobs which would be returned by jobs()
+        """
+        if cls is None:
+            cls = Job
+        return len(self._sorted.get((cls, running), []))
+
+    def models_for_dataset(self, dataset_id):
+        """
+        Returns a list of the ModelJobs which depend on this dataset
+        """
+        return [self._jobs[job_id] for job_id in self._by_dataset.get(dataset_id, ())]
+
+    ### Helpers
+
+    def _record_access(self, job_id):
+        """
+        Store the time of a call to get()
+        The catalog is only written to once every ACCESS_RESOLUTION seconds
+        """
+        now = time.time()
+        if now - self._accessed.get(job_id, 0) < self.ACCESS_RESOLUTION:
+            return
+        self._accessed[job_id] = now
+        self.catalog.set_accessed(job_id, now)
+
+    def _load(self, summary):
+        """
+        Replace a JobSummary with the loaded Job
+        Returns None if the Job fails to load
+        """
+        if self._loader is None:
+            raise RuntimeError('No loader set for job "%s"' % summary.id())
+        job = self._loader(summary)
+        if self._jobs.get(summary.id()) is not summary:
+            # removed or loaded by someone else in the meantime
+            return self._jobs.get(summary.id())
+        # replace it without removing it from the catalog
+        self._remove(summary.id())
+        if job is not None:
+            self.add(job)
+        else:
+            self.catalog.remove(summary.id())
+        return job
+
+    @staticmethod
+    def _job_classes(job):
+        """
+        Returns all the Job classes that this job is an instance of
+        """
+        if isinstance(job, JobSummary):
+            cls = job.job_class()
+        else:
+            cls = job.__class__
+        return [c for c in cls.__mro__
+                if isinstance(c, type) and issubclass(c, Job)]
+
+    @staticmethod
+    def _sort_key(job):
+        if job.status_history:
+            created = job.status_history[0][1]
+        else:
+            created = 0
+        return (created, job.id())
+
+    @staticmethod
+    def _discard(index, key, job_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(job_id)
+            if not ids:
+                del index[key]
+
+    def _index_status(self, job):
+        job_id = job.id()
+        status = job.status.val
+        running = job.status.is_running()
+        self._by_status.setdefault(status, set()).add(job_id)
+        key = self._sort_key(job)
+        for cls in self._job_classes(job):
+            self._sorted_insert((cls, None), key)
+            self._sorted_insert((cls, running), key)
+        self._indexed_status[job_id] = (status, running)
+
+    def _unindex_status(self, job):
+        job_id = job.id()
+        status, running = self._indexed_status.pop(job_id)
+        self._discard(self._by_status, status, job_id)
+        key = self._sort_key(job)
+        for cls in self._job_classes(job):
+            self._sorted_remove((cls, None), key)
+            self._sorted_remove((cls, running), key)
+
+    def _sorted_insert(self, index_key, key):
+        bisect.insort(self._sorted.setdefault(index_key, []), key)
+
+    def _sorted_remove(self, index_key, key):
+        keys = self._sorted.get(index_key)
+        if not keys:
+            return
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            keys.pop(i)
@@ -5,6 +5,7 @@ import logging
 import logging.handlers
 
 from digits.config import config_value
+from digits import events
 
 
 DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
@@ -48,6 +49,15 @@ class JobIdLoggerAdapter(logging.LoggerAdapter):
             kwargs['extra']['job_id'] = ' [%s]' % self.extra['job_id']
         return msg, kwargs
 
+def setup_events_logging():
+    """
+    Also send the warnings and errors of the tools to the Task which started
+    them (if any)
+    """
+    if events.writer().enabled():
+        tools_logger = logging.getLogger('digits.tools')
+        tools_logger.addHandler(events.EventHandler(events.writer()))
+
 def setup_logging():
     socketio_logger = logging.getLogger('socketio')
     socketio_logger.addHandler(logging.StreamHandler(sys.stdout))
@@ -70,6 +80,10 @@ def setup_logging():
     stdoutHandler.setLevel(logging.DEBUG)
     main_logger.addHandler(stdoutHandler)
 
+    ### digits.tools logger
+
+    setup_events_logging()
+
     ### digits.webapp logger
 
     if config_value('log_file'):
@@ -14,6 +14,7 @@ except ImportError:
 
 from digits.config import config_value
 from digits.device_query import get_device, get_nvml_info
+from digits.job import Job
 from digits.utils import sizeof_fmt
 from digits.utils.forms import validate_required_iff
 
@@ -62,6 +63,33 @@ class ModelForm(Form):
                 ],
             )
 
+    retention_keep_last = wtforms.IntegerField('Keep the last N snapshots',
+            validators = [
+                validators.NumberRange(min=1),
+                validators.Optional(),
+                ],
+            )
+
+    retention_keep_best = wtforms.IntegerField('Keep the best N snapshots',
+            validators = [
+                validators.NumberRange(min=1),
+                validators.Optional(),
+                ],
+            )
+
+    retention_best_output = wtforms.StringField('Score snapshots by',
+            validators = [
+                validators.Optional(),
+                ],
+            )
+
+    retention_keep_every = wtforms.IntegerField('Keep a snapshot every N epochs',
+            validators = [
+                validators.NumberRange(min=1),
+                validators.Optional(),
+                ],
+            )
+
     random_seed = wtforms.IntegerField('Random seed',
             validators = [
                 validators.NumberRange(min=0),
@@ -245,4 +273,12 @@ class ModelForm(Form):
                 ]
             )
 
+    username = wtforms.StringField('User Name')
+
+    priority = wtforms.SelectField('Priority',
+            choices = Job.PRIORITY_CHOICES,
+            coerce = int,
+            default = Job.PRIORITY_NORMAL,
+            )
+
 
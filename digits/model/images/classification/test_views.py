@@ -17,6 +17,9 @@ except ImportError:
 from . import views as _
 import digits
 from digits.webapp import app, scheduler
+from digits.job_registry import JobRegistry
+from digits.status import Status
+from digits.job import JobSummary
 
 class BaseTestCase(object):
     @classmethod
@@ -29,7 +32,7 @@ class BaseTestCase(object):
 
     @classmethod
     def tearDownClass(cls):
-        scheduler.jobs = []
+        scheduler.jobs = JobRegistry()
         scheduler.running = False
 
 class TestCreate(BaseTestCase):
@@ -51,18 +54,28 @@ class TestCreate(BaseTestCase):
             cls.url = flask.url_for('image_classification_model_create')
 
         dj = mock.Mock(spec=digits.dataset.ImageClassificationDatasetJob)
-        dj.status.is_running.return_value = True
+        dj.status = Status(Status.RUN)
         dj.id.return_value = 'dataset'
         dj.name.return_value = ''
+        dj.status_history = []
+        dj.username = None
+        dj.priority = None
 
         mj = mock.Mock(spec=digits.model.ImageClassificationModelJob)
+        mj.status = Status(Status.DONE)
         mj.id.return_value = 'model'
         mj.name.return_value = ''
+        mj.status_history = []
+        mj.username = None
+        mj.priority = None
         _, cls.temp_snapshot_path = tempfile.mkstemp() #instead of using a dummy hardcoded value as snapshot path, temp file path is used to avoid the filen't exists exception in views.py.
         mj.train_task.return_value.snapshots = [(cls.temp_snapshot_path, 1)]
         mj.train_task.return_value.network = caffe_pb2.NetParameter()
+        mj.train_task.return_value.pretrained_model = None
 
-        digits.webapp.scheduler.jobs = [dj, mj]
+        digits.webapp.scheduler.jobs = JobRegistry()
+        digits.webapp.scheduler.jobs.add(dj)
+        digits.webapp.scheduler.jobs.add(mj)
 
     @classmethod
     def tearDownClass(cls):
@@ -96,7 +109,7 @@ class TestCreate(BaseTestCase):
             else:
                 raise RuntimeError('Failed to create model')
 
-        assert scheduler.jobs[-1].train_task().crop_size == 12, \
+        assert scheduler.jobs.jobs()[0].train_task().crop_size == 12, \
                 'crop size not saved properly'
 
     def test_previous_network_pretrained_model(self):
@@ -117,6 +130,56 @@ class TestCreate(BaseTestCase):
             else:
                 raise RuntimeError('Failed to create model')
 
-        assert scheduler.jobs[-1].train_task().pretrained_model == self.temp_snapshot_path, \
+        assert scheduler.jobs.jobs()[0].train_task().pretrained_model == self.temp_snapshot_path, \
                 'pretrained model not saved properly'
 
+    def test_previous_network_snapshots(self):
+        """previous networks are listed without loading them"""
+        scheduler.jobs.add(JobSummary('/jobs/summary', {
+            'id': 'summary',
+            'name': 'summary',
+            'class': 'digits.model.images.classification.job.ImageClassificationModelJob',
+            'status_history': [['D', 1000]],
+            'dataset_id': 'dataset',
+            'snapshot_epochs': [1, 2],
+            }))
+        try:
+            with mock.patch.object(scheduler.jobs, 'get') as get:
+                snapshots = _.get_previous_network_snapshots()
+            assert not get.called, 'jobs were loaded'
+            assert [(0, 'None'), (2, 'Epoch #2'), (1, 'Epoch #1')] in snapshots
+            assert [(0, 'None'), (1, 'Epoch #1')] in snapshots
+        finally:
+            scheduler.jobs.remove('summary')
+
+    def test_new_page_not_an_access(self):
+        """opening the new model page doesn't count as using the models"""
+        with app.test_request_context():
+            url = flask.url_for('image_classification_model_new')
+        rv = self.app.get(url)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        assert scheduler.jobs.last_access('model') is None
+
+    def test_priority(self):
+        """priority and username"""
+
+        rv = self.app.post(self.url, data={
+            'method': 'standard',
+            'dataset': 'dataset',
+            'standard_networks': 'lenet',
+            'model_name': 'test',
+            'username': 'alice',
+            'priority': 1,
+            })
+
+        if not (300 <= rv.status_code <= 310):
+            msg = self.get_error_msg(rv.data)
+            if msg is not None:
+                raise RuntimeError(msg)
+            else:
+                raise RuntimeError('Failed to create model')
+
+        job = scheduler.jobs.jobs()[0]
+        assert job.priority == 1, 'priority not saved properly'
+        assert job.username == 'alice', 'username not saved properly'
+
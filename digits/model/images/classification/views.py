@@ -25,6 +25,7 @@ from digits.model import tasks
 from forms import ImageClassificationModelForm
 from job import ImageClassificationModelJob
 from digits.status import Status
+from digits.job import JobSummary
 
 NAMESPACE   = '/models/images/classification'
 
@@ -85,6 +86,8 @@ def image_classification_model_create():
         job = ImageClassificationModelJob(
                 name        = form.model_name.data,
                 dataset_id  = datasetJob.id(),
+                username    = form.username.data or None,
+                priority    = form.priority.data,
                 )
 
         network = caffe_pb2.NetParameter()
@@ -180,6 +183,15 @@ def image_classification_model_create():
                 selected_gpus = [str(form.select_gpu.data)]
                 gpu_count = None
 
+        retention = tasks.RetentionPolicy(
+                keep_last   = form.retention_keep_last.data,
+                keep_best   = form.retention_keep_best.data,
+                best_output = form.retention_best_output.data or None,
+                keep_every  = form.retention_keep_every.data,
+                )
+        if retention.is_empty():
+            retention = None
+
         job.tasks.append(
                 tasks.CaffeTrainTask(
                     job_dir         = job.dir(),
@@ -198,6 +210,7 @@ def image_classification_model_create():
                     network         = network,
                     random_seed     = form.random_seed.data,
                     solver_type     = form.solver_type.data,
+                    retention       = retention,
                     )
                 )
 
@@ -441,11 +454,13 @@ def image_classification_model_top_n():
             )
 
 def get_datasets():
-    return [(j.id(), j.name()) for j in sorted(
-        [j for j in scheduler.jobs if isinstance(j, ImageClassificationDatasetJob) and (j.status.is_running() or j.status == Status.DONE)],
-        cmp=lambda x,y: cmp(y.id(), x.id())
-        )
-        ]
+    # archived datasets are restored when a model is created from them
+    return [(j.id(), j.name())
+            for j in scheduler.jobs.jobs(ImageClassificationDatasetJob)
+            if j.status.is_running() or j.status == Status.DONE] + \
+        [(j.id(), '%s (archived)' % j.name())
+            for j in scheduler.archived_jobs(ImageClassificationDatasetJob)
+            if j.status == Status.DONE]
 
 def get_standard_networks():
     return [
@@ -459,18 +474,26 @@ def get_default_standard_network():
     return 'alexnet'
 
 def get_previous_networks():
-    return [(j.id(), j.name()) for j in sorted(
-        [j for j in scheduler.jobs if isinstance(j, ImageClassificationModelJob)],
-        cmp=lambda x,y: cmp(y.id(), x.id())
-        )
-        ]
+    return [(j.id(), j.name())
+            for j in scheduler.jobs.jobs(ImageClassificationModelJob)]
 
 def get_previous_network_snapshots():
+    """
+    Returns a list of (epoch, label) for the snapshots of each job from
+    get_previous_networks()
+    The jobs aren't loaded (the epochs of a JobSummary are in the summary)
+    """
     prev_network_snapshots = []
     for job_id, _ in get_previous_networks():
-        job = scheduler.get_job(job_id)
+        job = scheduler.jobs.peek(job_id)
+        if isinstance(job, JobSummary):
+            epochs = job.snapshot_epochs
+        elif job is not None:
+            epochs = [epoch for _, epoch in job.train_task().snapshots]
+        else:
+            epochs = []
         e = [(0, 'None')] + [(epoch, 'Epoch #%s' % epoch)
-                for _, epoch in reversed(job.train_task().snapshots)]
+                for epoch in reversed(epochs)]
         prev_network_snapshots.append(e)
     return prev_network_snapshots
 
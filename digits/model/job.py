@@ -41,9 +41,18 @@ class ModelJob(Job):
         if verbose:
             d.update({
                 'snapshots': [s[1] for s in self.train_task().snapshots],
+                'snapshot_disk_usage': self.train_task().snapshot_disk_usage(),
                 })
         return d
 
+    @override
+    def summary(self):
+        d = super(ModelJob, self).summary()
+        if self.tasks:
+            d['pretrained_model'] = self.train_task().pretrained_model
+            d['snapshot_epochs'] = [epoch for _, epoch in self.train_task().snapshots]
+        return d
+
     def load_dataset(self):
         from digits.webapp import scheduler
         job = scheduler.get_job(self.dataset_id)
@@ -2,3 +2,4 @@
 
 from train import TrainTask
 from caffe_train import CaffeTrainTask
+from retention import RetentionPolicy
@@ -0,0 +1,109 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+"""
+Parses the output of caffe
+
+Caffe can print thousands of lines per second, so the patterns are compiled
+    once and each message is only matched against the pattern which its
+    first word selects
+"""
+
+import re
+import time
+
+# NOTE: This must change when the logging format changes
+# LMMDD HH:MM:SS.MICROS pid file:lineno] message
+HEADER_RE = re.compile(r'(\w)(\d{4} \S{8})[^\]]*\]\s+(\S.*)$')
+
+LEVELS = {
+        'I': 'info',
+        'W': 'warning',
+        'E': 'error',
+        'F': 'critical', #FAIL
+        }
+
+FLOAT_EXP = r'(NaN|[-+]?[0-9]*\.?[0-9]+(?:e[-+]?[0-9]+)?)'
+
+ITERATION_RE = re.compile(r'Iteration (\d+)')
+LR_RE = re.compile(r'Iteration (\d+).*lr = %s' % FLOAT_EXP, re.IGNORECASE)
+NET_OUTPUT_RE = re.compile(r'(Train|Test) net output #(\d+): (\S*) = %s' % FLOAT_EXP, re.IGNORECASE)
+SNAPSHOT_RE = re.compile(r'Snapshotting to (.*)\s*$')
+MEMORY_RE = re.compile(r'Memory required for data:\s+(\d+)')
+
+# Kinds of messages returned by parse_message()
+ITERATION = 'iteration'
+NET_OUTPUT = 'net_output'
+SNAPSHOT = 'snapshot'
+MEMORY = 'memory'
+
+def parse_line(line):
+    """
+    Takes a line of output and parses it according to caffe's output format
+    Returns (level, message) or (None, None)
+    """
+    match = HEADER_RE.match(line)
+    if match is None:
+        return (None, None)
+    level = match.group(1)
+    return (LEVELS.get(level, level), match.group(3))
+
+def parse_timestamp(line):
+    """
+    Returns the time at which caffe printed a line, or None
+    """
+    match = HEADER_RE.match(line)
+    if match is None:
+        return None
+    # add the year because caffe omits it
+    timestr = '%s%s' % (time.strftime('%Y'), match.group(2))
+    return time.mktime(time.strptime(timestr, '%Y%m%d %H:%M:%S'))
+
+def parse_message(message):
+    """
+    Returns (kind, values) for the messages which DIGITS uses, or None
+
+    The values for each kind are:
+    ITERATION -- (iteration, learning rate or None)
+    NET_OUTPUT -- (phase, index, name, value string)
+    SNAPSHOT -- (filename,)
+    MEMORY -- (bytes,)
+    """
+    first = message[:4]
+    if first == 'Iter':
+        match = ITERATION_RE.match(message)
+        if match is None:
+            return None
+        lr = None
+        lr_match = LR_RE.match(message)
+        if lr_match is not None:
+            lr = float(lr_match.group(2))
+        return (ITERATION, (int(match.group(1)), lr))
+    elif first.lower() in ('trai', 'test'):
+        match = NET_OUTPUT_RE.match(message)
+        if match is None:
+            return None
+        return (NET_OUTPUT, (match.group(1).lower(), int(match.group(2)),
+            match.group(3), match.group(4)))
+    elif first == 'Snap':
+        match = SNAPSHOT_RE.match(message)
+        if match is None:
+            return None
+        return (SNAPSHOT, (match.group(1),))
+    elif first == 'Memo':
+        match = MEMORY_RE.match(message)
+        if match is None:
+            return None
+        return (MEMORY, (int(match.group(1)),))
+    return None
+
+def layer_types(network):
+    """
+    Returns a dict of {top name: layer type} for a NetParameter
+    When several layers write to the same top, the first one is used
+    """
+    types = {}
+    for layer in network.layer:
+        for top in layer.top:
+            if top not in types:
+                types[top] = layer.type
+    return types
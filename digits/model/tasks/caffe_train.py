@@ -16,6 +16,7 @@ except ImportError:
     from caffe.proto import caffe_pb2
 
 from train import TrainTask
+import caffe_output
 from digits.config import config_value
 from digits.status import Status
 from digits import utils, dataset
@@ -32,6 +33,9 @@ class CaffeTrainTask(TrainTask):
     """
 
     CAFFE_LOG = 'caffe_output.log'
+    # Bytes of caffe output to buffer before writing to CAFFE_LOG
+    # (the log is also flushed whenever the job is saved)
+    CAFFE_LOG_BUFFER = 2**16
 
     @staticmethod
     def upgrade_network(network):
@@ -60,6 +64,8 @@ class CaffeTrainTask(TrainTask):
         self.snapshot_prefix = constants.CAFFE_SNAPSHOT_PREFIX
         self.deploy_file = constants.CAFFE_DEPLOY_FILE
         self.caffe_log_file = self.CAFFE_LOG
+        self._layer_types = None
+        self._gpu_memory_key = None
 
     def __getstate__(self):
         state = super(CaffeTrainTask, self).__getstate__()
@@ -71,6 +77,10 @@ class CaffeTrainTask(TrainTask):
             del state['_transformer']
         if '_caffe_net' in state:
             del state['_caffe_net']
+        if '_layer_types' in state:
+            del state['_layer_types']
+        if '_gpu_memory_key' in state:
+            del state['_gpu_memory_key']
 
         return state
 
@@ -89,6 +99,8 @@ class CaffeTrainTask(TrainTask):
 
         # These things don't get pickled
         self.image_mean = None
+        self._layer_types = None
+        self._gpu_memory_key = None
 
     ### Task overrides
 
@@ -105,11 +117,14 @@ class CaffeTrainTask(TrainTask):
         else:
             raise NotImplementedError
 
-        self.caffe_log = open(self.path(self.CAFFE_LOG), 'a')
+        self.caffe_log = open(self.path(self.CAFFE_LOG), 'a', self.CAFFE_LOG_BUFFER)
+        self._layer_types = None
         self.saving_snapshot = False
         self.receiving_train_output = False
         self.receiving_val_output = False
         self.last_train_update = None
+        # bytes needed for data blobs, summed over all of the networks
+        self.data_memory = 0
         return True
 
     def save_prototxt_files(self):
@@ -397,50 +412,44 @@ class CaffeTrainTask(TrainTask):
 
     @override
     def process_output(self, line):
-        float_exp = '(NaN|[-+]?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?)'
-
         self.caffe_log.write('%s\n' % line)
-        self.caffe_log.flush()
         # parse caffe output
-        timestamp, level, message = self.preprocess_output_caffe(line)
+        level, message = caffe_output.parse_line(line)
         if not message:
             return True
 
+        parsed = caffe_output.parse_message(message)
+        kind = parsed[0] if parsed else None
+
         # iteration updates
-        match = re.match(r'Iteration (\d+)', message)
-        if match:
-            i = int(match.group(1))
+        if kind == caffe_output.ITERATION:
+            i, lr = parsed[1]
             self.new_iteration(i)
+            if self.gpu_memory is None and self.data_memory:
+                # all of the networks have been set up by now
+                gpu_count = len(self.current_resources.get('gpus', [])) or 1
+                self.set_data_memory(self.data_memory // gpu_count)
+
+            # learning rate updates
+            if lr is not None:
+                self.save_train_output('learning_rate', 'LearningRate', lr)
+                return True
 
         # net output
-        match = re.match(r'(Train|Test) net output #(\d+): (\S*) = %s' % float_exp, message, flags=re.IGNORECASE)
-        if match:
-            phase = match.group(1)
-            index = int(match.group(2))
-            name = match.group(3)
-            value = match.group(4)
+        elif kind == caffe_output.NET_OUTPUT:
+            phase, index, name, value = parsed[1]
             assert value.lower() != 'nan', 'Network outputted NaN for "%s" (%s phase). Try decreasing your learning rate.' % (name, phase)
             value = float(value)
 
             # Find the layer type
-            kind = '?'
-            for layer in self.network.layer:
-                if name in layer.top:
-                    kind = layer.type
-                    break
-
-            if phase.lower() == 'train':
-                self.save_train_output(name, kind, value)
-            elif phase.lower() == 'test':
-                self.save_val_output(name, kind, value)
-            return True
-
-        # learning rate updates
-        match = re.match(r'Iteration (\d+).*lr = %s' % float_exp, message, flags=re.IGNORECASE)
-        if match:
-            i = int(match.group(1))
-            lr = float(match.group(2))
-            self.save_train_output('learning_rate', 'LearningRate', lr)
+            if self._layer_types is None:
+                self._layer_types = caffe_output.layer_types(self.network)
+            layer_type = self._layer_types.get(name, '?')
+
+            if phase == 'train':
+                self.save_train_output(name, layer_type, value)
+            elif phase == 'test':
+                self.save_val_output(name, layer_type, value)
             return True
 
         # snapshot saved
@@ -455,16 +464,13 @@ class CaffeTrainTask(TrainTask):
             return True
 
         # snapshot starting
-        match = re.match(r'Snapshotting to (.*)\s*$', message)
-        if match:
+        if kind == caffe_output.SNAPSHOT:
             self.saving_snapshot = True
             return True
 
         # memory requirement
-        match = re.match(r'Memory required for data:\s+(\d+)', message)
-        if match:
-            bytes_required = int(match.group(1))
-            #self.logger.debug('memory required: %s' % utils.sizeof_fmt(bytes_required))
+        if kind == caffe_output.MEMORY:
+            self.data_memory += parsed[1][0]
             return True
 
         if level in ['error', 'critical']:
@@ -474,32 +480,30 @@ class CaffeTrainTask(TrainTask):
 
         return True
 
+    @override
+    def gpu_memory_key(self):
+        if self.dataset is None:
+            return None
+        if self._gpu_memory_key is None:
+            # the scheduler asks on every pass, and the network never changes
+            self._gpu_memory_key = (
+                    self.network.SerializeToString(),
+                    self.batch_size,
+                    self.crop_size,
+                    tuple(self.dataset.image_dims),
+                    )
+        return self._gpu_memory_key
+
     def preprocess_output_caffe(self, line):
         """
         Takes line of output and parses it according to caffe's output format
         Returns (timestamp, level, message) or (None, None, None)
         """
-        # NOTE: This must change when the logging format changes
-        # LMMDD HH:MM:SS.MICROS pid file:lineno] message
-        match = re.match(r'(\w)(\d{4} \S{8}).*]\s+(\S.*)$', line)
-        if match:
-            level = match.group(1)
-            # add the year because caffe omits it
-            timestr = '%s%s' % (time.strftime('%Y'), match.group(2))
-            message = match.group(3)
-            if level == 'I':
-                level = 'info'
-            elif level == 'W':
-                level = 'warning'
-            elif level == 'E':
-                level = 'error'
-            elif level == 'F': #FAIL
-                level = 'critical'
-            timestamp = time.mktime(time.strptime(timestr, '%Y%m%d %H:%M:%S'))
-            return (timestamp, level, message)
-        else:
+        level, message = caffe_output.parse_line(line)
+        if message is None:
             #self.logger.warning('Unrecognized task output "%s"' % line)
             return (None, None, None)
+        return (caffe_output.parse_timestamp(line), level, message)
 
     def new_iteration(self, it):
         """
@@ -515,17 +519,23 @@ class CaffeTrainTask(TrainTask):
         """
         Sends socketio message about the snapshot list
         """
-        from digits.webapp import socketio
+        from digits.webapp import rooms
 
-        socketio.emit('task update',
-                {
+        rooms.emit('task update',
+                lambda: {
                     'task': self.html_id(),
                     'update': 'snapshots',
                     'data': self.snapshot_list(),
                     },
-                namespace='/jobs',
-                room=self.job_id,
-                )
+                self.job_id,
+                key=(self.html_id(), 'snapshots'))
+
+    @override
+    def flush_outputs(self):
+        super(CaffeTrainTask, self).flush_outputs()
+        caffe_log = getattr(self, 'caffe_log', None)
+        if caffe_log is not None and not caffe_log.closed:
+            caffe_log.flush()
 
     @override
     def after_run(self):
@@ -591,6 +601,10 @@ class CaffeTrainTask(TrainTask):
 
         return len(self.snapshots) > 0
 
+    @override
+    def on_snapshots_deleted(self):
+        self.send_snapshot_update()
+
     @override
     def est_next_snapshot(self):
         if self.status != Status.RUN or self.current_iteration == 0:
@@ -0,0 +1,170 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import numpy as np
+
+class MinMaxSummary(object):
+    """
+    Multi-resolution summary of a series of values for drawing graphs
+
+    Level k splits the series into buckets of FACTOR**k values and stores
+        the indices of the lowest and highest value in each bucket, so a
+        graph of any length can be drawn with two points per bucket
+        without losing the spikes
+    Only complete buckets are stored. The summary is updated incrementally
+        as values are appended to the series.
+    """
+
+    # Buckets per bucket of the next level
+    FACTOR = 4
+
+    def __init__(self):
+        # number of values which have been summarized
+        self.count = 0
+        # level k-1 -> [mins, maxs, number of buckets] (buffers grow as needed)
+        self._levels = []
+
+    @staticmethod
+    def _fill(values, fill):
+        """
+        Returns values with NaNs replaced (so they're never picked)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        nans = np.isnan(values)
+        if nans.any():
+            values = np.where(nans, fill, values)
+        return values
+
+    def update(self, values):
+        """
+        Summarize the values appended since the last update
+
+        Arguments:
+        values -- all of the values in the series (e.g. a memmap)
+        """
+        count = len(values)
+        if count <= self.count:
+            return
+        size = self.FACTOR
+        level = 0
+        while count // size:
+            buckets = count // size
+            if level == len(self._levels):
+                self._levels.append([np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0])
+            done = self._levels[level][2]
+            if buckets > done:
+                if level == 0:
+                    offsets = np.arange(done, buckets, dtype=np.int64) * size
+                    chunk = values[done * size:buckets * size]
+                    mins = self._fill(chunk, np.inf).reshape(-1, size).argmin(axis=1) + offsets
+                    maxs = self._fill(chunk, -np.inf).reshape(-1, size).argmax(axis=1) + offsets
+                else:
+                    # combine the buckets of the level below
+                    lower_mins, lower_maxs, _ = self._levels[level - 1]
+                    lower = slice(done * self.FACTOR, buckets * self.FACTOR)
+                    candidates = lower_mins[lower].reshape(-1, self.FACTOR)
+                    picked = self._fill(values[lower_mins[lower]], np.inf).reshape(-1, self.FACTOR).argmin(axis=1)
+                    mins = candidates[np.arange(len(candidates)), picked]
+                    candidates = lower_maxs[lower].reshape(-1, self.FACTOR)
+                    picked = self._fill(values[lower_maxs[lower]], -np.inf).reshape(-1, self.FACTOR).argmax(axis=1)
+                    maxs = candidates[np.arange(len(candidates)), picked]
+                self._append(level, mins, maxs)
+            size *= self.FACTOR
+            level += 1
+        self.count = count
+
+    def _append(self, level, mins, maxs):
+        entry = self._levels[level]
+        used = entry[2]
+        needed = used + len(mins)
+        if needed > len(entry[0]):
+            capacity = max(needed, 2 * len(entry[0]), 16)
+            for i in (0, 1):
+                grown = np.zeros(capacity, dtype=np.int64)
+                grown[:used] = entry[i][:used]
+                entry[i] = grown
+        entry[0][used:needed] = mins
+        entry[1][used:needed] = maxs
+        entry[2] = needed
+
+    @classmethod
+    def bucket_size(cls, count, points):
+        """
+        Returns the smallest bucket size (a power of FACTOR) which draws
+        count values with at most points points (or 4 if points is smaller)
+        """
+        if count <= points:
+            return 1
+        # a range which isn't aligned with the buckets covers one more (so
+        #   at least two are needed, even if that's more than points)
+        buckets = max(points // 2, 2)
+        size = cls.FACTOR
+        while (count + size - 1) // size + 1 > buckets:
+            size *= cls.FACTOR
+        return size
+
+    def indices(self, values, points, start=0, stop=None, size=None):
+        """
+        Returns the sorted indices of the values which draw a range of the
+        series with at most points points (the lowest and highest value of
+        each bucket, see bucket_size)
+
+        Arguments:
+        values -- all of the values in the series
+        points -- the number of points to draw
+
+        Keyword arguments:
+        start -- the index of the first value in the range
+        stop -- the index after the last value in the range
+        size -- overrides the bucket size chosen for the range
+        """
+        count = len(values)
+        if stop is None or stop > count:
+            stop = count
+        start = max(start, 0)
+        if start >= stop:
+            return np.zeros(0, dtype=np.int64)
+        if size is None:
+            size = self.bucket_size(stop - start, points)
+        if size == 1:
+            return np.arange(start, stop, dtype=np.int64)
+        self.update(values)
+
+        parts = []
+        # the complete buckets inside the range come from the summary
+        first = -(-start // size)
+        last = min(stop // size, self._level_buckets(size))
+        if first < last:
+            mins, maxs, _ = self._levels[self._level_index(size)]
+            parts.append(mins[first:last])
+            parts.append(maxs[first:last])
+            edges = [(start, first * size), (last * size, stop)]
+        else:
+            edges = [(start, stop)]
+        # the values at the edges are split into buckets here
+        for begin, end in edges:
+            position = begin
+            while position < end:
+                # align with the buckets of the summary
+                bucket_end = min(end, (position // size + 1) * size)
+                chunk = values[position:bucket_end]
+                parts.append(np.array([
+                    position + self._fill(chunk, np.inf).argmin(),
+                    position + self._fill(chunk, -np.inf).argmax(),
+                    ], dtype=np.int64))
+                position = bucket_end
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def _level_index(self, size):
+        level = -1
+        while size > 1:
+            size //= self.FACTOR
+            level += 1
+        return level
+
+    def _level_buckets(self, size):
+        level = self._level_index(size)
+        if level >= len(self._levels):
+            return 0
+        return self._levels[level][2]
@@ -0,0 +1,300 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import json
+
+import numpy as np
+
+from downsample import MinMaxSummary
+
+class GpuHistory(object):
+    """
+    Stores the GPU utilization, memory used and temperature sampled while
+    a TrainTask runs, in a directory of append-only files
+
+    Each record is the mean of the samples of one GPU over "interval"
+        seconds. When a GPU has more than MAX_RECORDS records, the interval
+        doubles and the records are merged into the longer intervals, so
+        the files stay small however long the task runs
+    Records are buffered in memory until flush() is called
+    """
+
+    INDEX_FILE = 'index.json'
+    DATA_FILE = 'samples.bin'
+    # Seconds per record at first
+    INTERVAL = 1
+    # Records kept for each GPU
+    MAX_RECORDS = 10000
+
+    RECORD_DTYPE = np.dtype([
+        ('time', '<f8'),
+        # position in gpus()
+        ('gpu', '<i4'),
+        # percent
+        ('utilization', '<f4'),
+        # bytes
+        ('memory', '<f8'),
+        # degrees C
+        ('temperature', '<f4'),
+        ])
+
+    def __init__(self, directory):
+        """
+        Arguments:
+        directory -- where to store the files (created on the first flush)
+        """
+        self.directory = directory
+        self.start = None
+        self.interval = self.INTERVAL
+        # list of {index, name, memory_total} for each GPU
+        self._gpus = []
+        # samples which haven't been merged and flushed
+        self._pending = []
+        self._index_dirty = False
+        self._load_index()
+
+    def _load_index(self):
+        filename = os.path.join(self.directory, self.INDEX_FILE)
+        if not os.path.exists(filename):
+            return
+        with open(filename) as infile:
+            index = json.load(infile)
+        self.start = index['start']
+        self.interval = index['interval']
+        self._gpus = index['gpus']
+
+    def _write_index(self):
+        filename = os.path.join(self.directory, self.INDEX_FILE)
+        with open(filename + '.tmp', 'w') as outfile:
+            json.dump({
+                'start': self.start,
+                'interval': self.interval,
+                'gpus': self._gpus,
+                }, outfile)
+        os.rename(filename + '.tmp', filename)
+        self._index_dirty = False
+
+    def exists(self):
+        """
+        Returns True if anything has been flushed to the directory
+        """
+        return os.path.exists(os.path.join(self.directory, self.INDEX_FILE))
+
+    def gpus(self):
+        """
+        Returns a list of dicts with the index, name and memory_total of
+        each GPU (in the order they were added)
+        """
+        return list(self._gpus)
+
+    def append(self, timestamp, index, sample, name=None):
+        """
+        Add a sample of a GPU
+
+        Arguments:
+        timestamp -- when the sample was taken (seconds since the epoch)
+        index -- the device index
+        sample -- a dict from GpuTelemetry (or None)
+
+        Keyword arguments:
+        name -- the name of the device
+        """
+        sample = sample or {}
+        memory = sample.get('memory') or {}
+        utilization = sample.get('utilization') or {}
+
+        position = None
+        for i, gpu in enumerate(self._gpus):
+            if gpu['index'] == index:
+                position = i
+                break
+        if position is None:
+            position = len(self._gpus)
+            self._gpus.append({
+                'index': index,
+                'name': name,
+                'memory_total': memory.get('total'),
+                })
+            self._index_dirty = True
+        if self.start is None:
+            self.start = timestamp
+            self._index_dirty = True
+
+        self._pending.append((
+            timestamp,
+            position,
+            utilization.get('gpu', np.nan),
+            memory.get('used', np.nan),
+            sample.get('temperature', np.nan),
+            ))
+
+    def dirty(self):
+        """
+        Returns True if some samples haven't been flushed
+        """
+        return self._index_dirty or bool(self._pending)
+
+    def flush(self, final=False):
+        """
+        Merge the samples into records and append them to the file
+
+        Keyword arguments:
+        final -- if False, the samples of the last interval of each GPU are
+            kept until the interval is over
+        """
+        if not self.dirty():
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if self._index_dirty:
+            # write the index first so that the positions are known
+            self._write_index()
+
+        samples = np.array(self._pending, dtype=self.RECORD_DTYPE)
+        if not final and len(samples):
+            buckets = self._buckets(samples['time'], self.interval)
+            last = np.zeros(len(self._gpus), dtype=np.int64)
+            np.maximum.at(last, samples['gpu'], buckets)
+            ready = buckets < last[samples['gpu']]
+            self._pending = samples[~ready].tolist()
+            samples = samples[ready]
+        else:
+            self._pending = []
+        if not len(samples):
+            return
+
+        records = self.merge(samples, self.interval)
+        counts = np.bincount(self.read(pending=False)['gpu'], minlength=len(self._gpus))
+        counts += np.bincount(records['gpu'], minlength=len(self._gpus))
+        filename = os.path.join(self.directory, self.DATA_FILE)
+        if counts.max() <= self.MAX_RECORDS:
+            self._truncate_partial(filename)
+            with open(filename, 'ab') as outfile:
+                outfile.write(records.tobytes())
+            return
+
+        # use longer intervals
+        records = np.concatenate([self.read(pending=False), records])
+        while np.bincount(records['gpu']).max() > self.MAX_RECORDS:
+            self.interval *= 2
+            records = self.merge(records, self.interval)
+        with open(filename + '.tmp', 'wb') as outfile:
+            outfile.write(records.tobytes())
+        os.rename(filename + '.tmp', filename)
+        self._write_index()
+
+    def _buckets(self, times, interval):
+        """
+        Returns the number of the interval of each time
+        """
+        return ((times - self.start) // interval).astype(np.int64)
+
+    def merge(self, records, interval):
+        """
+        Returns the mean of the records of each GPU in each interval
+        (ignoring missing values), in order of time
+
+        Arguments:
+        records -- an array with RECORD_DTYPE
+        interval -- seconds per merged record
+        """
+        keys = self._buckets(records['time'], interval) * max(len(self._gpus), 1) + records['gpu']
+        keys, inverse = np.unique(keys, return_inverse=True)
+        merged = np.zeros(len(keys), dtype=self.RECORD_DTYPE)
+        for field in self.RECORD_DTYPE.names:
+            values = records[field].astype(np.float64)
+            present = ~np.isnan(values)
+            totals = np.bincount(inverse, weights=np.where(present, values, 0))
+            counts = np.bincount(inverse, weights=present)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                merged[field] = totals / counts
+        return merged[np.argsort(merged['time'], kind='mergesort')]
+
+    def _truncate_partial(self, filename):
+        """
+        Remove a partially written record from the end of the file
+        """
+        if not os.path.exists(filename):
+            return
+        size = os.path.getsize(filename)
+        itemsize = self.RECORD_DTYPE.itemsize
+        if size % itemsize:
+            with open(filename, 'r+b') as f:
+                f.truncate(size - size % itemsize)
+
+    def read(self, pending=True):
+        """
+        Returns the records as an array with RECORD_DTYPE
+
+        Keyword arguments:
+        pending -- if True, include the samples which haven't been flushed
+        """
+        filename = os.path.join(self.directory, self.DATA_FILE)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as infile:
+                data = infile.read()
+            # ignore a partially written record
+            data = data[:len(data) - len(data) % self.RECORD_DTYPE.itemsize]
+            records = np.frombuffer(data, dtype=self.RECORD_DTYPE)
+        else:
+            records = np.zeros(0, dtype=self.RECORD_DTYPE)
+        if pending and self._pending:
+            records = np.concatenate([records,
+                np.array(self._pending, dtype=self.RECORD_DTYPE)])
+        return records
+
+    def graph_data(self, points):
+        """
+        Returns the utilization, memory used (as a percentage) and
+        temperature of each GPU over time, formatted for a C3.js graph
+        Returns None if there are no records
+
+        Each GPU is drawn with at most about points points, keeping the
+            lowest and highest utilization of each stretch of records
+
+        Arguments:
+        points -- the number of points for each GPU
+        """
+        records = self.read()
+        if not len(records):
+            return None
+        data = {
+                'columns': [],
+                'xs': {},
+                'names': {},
+                'axes': {},
+                }
+        for position, gpu in enumerate(self._gpus):
+            gpu_records = records[records['gpu'] == position]
+            if not len(gpu_records):
+                continue
+            indices = MinMaxSummary().indices(gpu_records['utilization'], points)
+            gpu_records = gpu_records[indices]
+            prefix = 'gpu%s' % gpu['index']
+            label = 'GPU %s' % gpu['index']
+            data['columns'].append(self.column('%s_time' % prefix,
+                gpu_records['time'] - self.start))
+            data['columns'].append(self.column('%s_utilization' % prefix,
+                gpu_records['utilization']))
+            data['xs']['%s_utilization' % prefix] = '%s_time' % prefix
+            data['names']['%s_utilization' % prefix] = '%s utilization (%%)' % label
+            if gpu['memory_total']:
+                data['columns'].append(self.column('%s_memory' % prefix,
+                    100 * gpu_records['memory'] / gpu['memory_total']))
+                data['xs']['%s_memory' % prefix] = '%s_time' % prefix
+                data['names']['%s_memory' % prefix] = '%s memory used (%%)' % label
+            data['columns'].append(self.column('%s_temperature' % prefix,
+                gpu_records['temperature']))
+            data['xs']['%s_temperature' % prefix] = '%s_time' % prefix
+            data['names']['%s_temperature' % prefix] = '%s temperature (C)' % label
+            data['axes']['%s_temperature' % prefix] = 'y2'
+        return data
+
+    @staticmethod
+    def column(col_id, values):
+        """
+        Returns a C3.js column for a numpy array (None for missing values)
+        """
+        column = np.round(values.astype(np.float64), 2).astype(object)
+        column[np.isnan(values)] = None
+        return [col_id] + column.tolist()
@@ -0,0 +1,249 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import json
+
+import numpy as np
+
+from downsample import MinMaxSummary
+
+# Values are stored as float64 so that they print the same as they were
+#   parsed (the dtype is recorded per series in the index)
+VALUE_DTYPE = '<f8'
+
+class OutputStore(object):
+    """
+    Stores the outputs of a TrainTask in a directory of append-only files
+
+    Each series of outputs (a name in the "train" or "val" phase) has its
+        own file of fixed-size (epoch, value) records
+    Records are buffered in memory until flush() is called (or until they
+        are read) and are read through a memory map, so that graphs can be
+        built with numpy without copying the series
+    A record which was only partially written (e.g. during a crash) is
+        ignored when reading
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, directory):
+        """
+        Arguments:
+        directory -- where to store the files (created on the first flush)
+        """
+        self.directory = directory
+        # list of dicts describing each series (in the order they were added)
+        self._series = []
+        # (phase, name) -> dict from _series
+        self._by_key = {}
+        # (phase, name) -> list of (epoch, value) which haven't been flushed
+        self._pending = {}
+        # (phase, name) -> (count, memmap) for the flushed records
+        self._maps = {}
+        # (phase, name) -> last (epoch, value) appended
+        self._last = {}
+        # (phase, name) -> MinMaxSummary of the values
+        self._summaries = {}
+        self._index_dirty = False
+        self._load_index()
+
+    def _load_index(self):
+        filename = os.path.join(self.directory, self.INDEX_FILE)
+        if not os.path.exists(filename):
+            return
+        with open(filename) as infile:
+            index = json.load(infile)
+        for info in index['series']:
+            info = dict((str(k), str(v)) for k, v in info.iteritems())
+            self._series.append(info)
+            self._by_key[(info['phase'], info['name'])] = info
+
+    @staticmethod
+    def record_dtype(info):
+        """
+        Returns the numpy dtype for the records of a series
+        """
+        return np.dtype([('epoch', '<f8'), ('value', info['dtype'])])
+
+    def exists(self):
+        """
+        Returns True if anything has been flushed to the directory
+        """
+        return os.path.exists(os.path.join(self.directory, self.INDEX_FILE))
+
+    def series(self, phase=None):
+        """
+        Returns a list of (name, kind) for each series (in the order they were added)
+
+        Keyword arguments:
+        phase -- if set, only return the series for this phase
+        """
+        return [(info['name'], info['kind']) for info in self._series
+                if phase is None or info['phase'] == phase]
+
+    def kind(self, phase, name):
+        """
+        Returns the kind of a series or None
+        """
+        info = self._by_key.get((phase, name))
+        if info is None:
+            return None
+        return info['kind']
+
+    def append(self, phase, name, kind, epoch, value):
+        """
+        Add an output to a series (creating the series if needed)
+
+        Arguments:
+        phase -- "train" or "val"
+        name -- name of the output (e.g. "accuracy")
+        kind -- the type of output (e.g. "Accuracy")
+        epoch -- the epoch for this output
+        value -- value for this output (None for a missing value)
+        """
+        key = (phase, name)
+        if key not in self._by_key:
+            info = {
+                    'phase': phase,
+                    'name': name,
+                    'kind': kind,
+                    'dtype': VALUE_DTYPE,
+                    'file': '%s-%d.bin' % (phase, len(self._series)),
+                    }
+            self._series.append(info)
+            self._by_key[key] = info
+            self._index_dirty = True
+        if value is None:
+            value = np.nan
+        self._pending.setdefault(key, []).append((epoch, value))
+        self._last[key] = (epoch, value)
+
+    def last(self, phase, name):
+        """
+        Returns the last (epoch, value) for a series or None
+        """
+        key = (phase, name)
+        if key not in self._last:
+            if key not in self._by_key:
+                return None
+            records = self.read(phase, name)
+            if not len(records):
+                return None
+            self._last[key] = tuple(records[-1])
+        return self._last[key]
+
+    def dirty(self):
+        """
+        Returns True if some records haven't been flushed
+        """
+        return self._index_dirty or any(self._pending.itervalues())
+
+    def flush(self):
+        """
+        Append the buffered records to their files
+        """
+        if not self.dirty():
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if self._index_dirty:
+            # write the index first so that no file is left unlisted
+            filename = os.path.join(self.directory, self.INDEX_FILE)
+            with open(filename + '.tmp', 'w') as outfile:
+                json.dump({'series': self._series}, outfile)
+            os.rename(filename + '.tmp', filename)
+            self._index_dirty = False
+        for key, rows in self._pending.iteritems():
+            if not rows:
+                continue
+            info = self._by_key[key]
+            data = np.array(rows, dtype=self.record_dtype(info))
+            filename = os.path.join(self.directory, info['file'])
+            self._truncate_partial(filename, data.dtype.itemsize)
+            with open(filename, 'ab') as outfile:
+                outfile.write(data.tobytes())
+        self._pending = {}
+
+    @staticmethod
+    def _truncate_partial(filename, itemsize):
+        """
+        Remove a partially written record from the end of a file
+        """
+        if not os.path.exists(filename):
+            return
+        size = os.path.getsize(filename)
+        if size % itemsize:
+            with open(filename, 'r+b') as f:
+                f.truncate(size - size % itemsize)
+
+    def read(self, phase, name):
+        """
+        Returns a numpy record array with "epoch" and "value" fields
+        for a series (empty if the series doesn't exist)
+        """
+        key = (phase, name)
+        info = self._by_key.get(key)
+        if info is None:
+            return np.zeros(0, dtype=self.record_dtype({'dtype': VALUE_DTYPE}))
+        dtype = self.record_dtype(info)
+        if self._pending.get(key):
+            # rather than copying the whole series to add them
+            self.flush()
+
+        filename = os.path.join(self.directory, info['file'])
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        count = size // dtype.itemsize
+        cached = self._maps.get(key)
+        if cached is not None and cached[0] == count:
+            flushed = cached[1]
+        elif count:
+            flushed = np.memmap(filename, dtype=dtype, mode='r', shape=(count,))
+            self._maps[key] = (count, flushed)
+        else:
+            flushed = np.zeros(0, dtype=dtype)
+        return flushed
+
+    def downsample(self, phase, name, points, start=0, stop=None, size=None):
+        """
+        Returns (indices, records) for at most about points records of a
+        series, keeping the lowest and highest value of each stretch of
+        records (see MinMaxSummary)
+
+        Arguments:
+        phase -- "train" or "val"
+        name -- name of the output
+        points -- the number of records to return
+
+        Keyword arguments:
+        start -- the index of the first record in the range
+        stop -- the index after the last record in the range
+        size -- the number of records in each stretch (see
+            MinMaxSummary.bucket_size)
+        """
+        records = self.read(phase, name)
+        summary = self._summaries.get((phase, name))
+        if summary is None:
+            summary = self._summaries[(phase, name)] = MinMaxSummary()
+        indices = summary.indices(records['value'], points,
+                start=start, stop=stop, size=size)
+        return indices, records[indices]
+
+    def index_range(self, phase, name, first_epoch=None, last_epoch=None):
+        """
+        Returns (start, stop) indices of the records of a series between
+        two epochs (inclusive)
+        """
+        epochs = self.read(phase, name)['epoch']
+        start = 0
+        stop = len(epochs)
+        if first_epoch is not None:
+            start = int(np.searchsorted(epochs, first_epoch, side='left'))
+        if last_epoch is not None:
+            stop = int(np.searchsorted(epochs, last_epoch, side='right'))
+        return start, stop
+
+    def close(self):
+        """
+        Release the memory maps
+        """
+        self._maps = {}
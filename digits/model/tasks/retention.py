@@ -0,0 +1,60 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+class RetentionPolicy(object):
+    """
+    Decides which snapshots of a TrainTask to keep
+
+    A snapshot is kept if any of the rules keeps it, and the most recent
+        snapshot is always kept
+    A policy without any rules keeps everything
+    """
+
+    def __init__(self, keep_last=None, keep_best=None, best_output=None, keep_every=None):
+        """
+        Keyword arguments:
+        keep_last -- keep this many of the most recent snapshots
+        keep_best -- keep this many of the snapshots with the best score
+        best_output -- name of the validation output used to score the
+            snapshots (default: "accuracy" if there is one, else "loss")
+        keep_every -- keep the snapshots taken every this many epochs
+        """
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.best_output = best_output
+        self.keep_every = keep_every
+
+    def __repr__(self):
+        return 'RetentionPolicy(keep_last=%r, keep_best=%r, best_output=%r, keep_every=%r)' % (
+                self.keep_last, self.keep_best, self.best_output, self.keep_every)
+
+    def is_empty(self):
+        """
+        Returns True if this policy keeps every snapshot
+        """
+        return not (self.keep_last or self.keep_best or self.keep_every)
+
+    def to_delete(self, snapshots, scores=None):
+        """
+        Returns the snapshots which should be deleted
+
+        Arguments:
+        snapshots -- a list of (filename, epoch) sorted by epoch
+
+        Keyword arguments:
+        scores -- a dict mapping epoch to a score (higher is better)
+        """
+        if self.is_empty() or not snapshots:
+            return []
+
+        keep = set([snapshots[-1][0]])
+        if self.keep_last:
+            keep.update(filename for filename, _ in snapshots[-self.keep_last:])
+        if self.keep_best and scores:
+            scored = [s for s in snapshots if scores.get(s[1]) is not None]
+            # ties go to the most recent snapshot
+            scored.sort(key=lambda s: (scores[s[1]], s[1]), reverse=True)
+            keep.update(filename for filename, _ in scored[:self.keep_best])
+        if self.keep_every:
+            keep.update(filename for filename, epoch in snapshots
+                    if epoch == int(epoch) and int(epoch) % self.keep_every == 0)
+        return [s for s in snapshots if s[0] not in keep]
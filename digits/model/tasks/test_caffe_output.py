@@ -0,0 +1,87 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import mock
+
+from . import caffe_output as _
+
+# recorded from a LeNet training run
+SAMPLE_LOG = """\
+I0521 10:15:02.118563 21437 net.cpp:106] Creating Layer ip2
+I0521 10:15:02.118574 21437 net.cpp:454] ip2 <- ip1
+I0521 10:15:02.118582 21437 net.cpp:411] ip2 -> ip2
+I0521 10:15:02.120418 21437 net.cpp:150] Setting up ip2
+I0521 10:15:02.120432 21437 net.cpp:157] Top shape: 64 10 (640)
+I0521 10:15:02.120440 21437 net.cpp:165] Memory required for data: 5169920
+I0521 10:15:02.151902 21437 net.cpp:165] Memory required for data: 1292800
+I0521 10:15:02.152035 21437 solver.cpp:242] Solver scaffolding done.
+I0521 10:15:02.152328 21437 solver.cpp:404] Iteration 0, Testing net (#0)
+I0521 10:15:02.741210 21437 solver.cpp:464]     Test net output #0: accuracy = 0.0859
+I0521 10:15:02.741251 21437 solver.cpp:464]     Test net output #1: loss = 2.35161 (* 1 = 2.35161 loss)
+I0521 10:15:02.750716 21437 solver.cpp:228] Iteration 0, loss = 2.31372
+I0521 10:15:02.750751 21437 solver.cpp:244]     Train net output #0: loss = 2.31372 (* 1 = 2.31372 loss)
+I0521 10:15:02.750769 21437 sgd_solver.cpp:106] Iteration 0, lr = 0.01
+W0521 10:15:02.811121 21437 solver.cpp:250] Iteration 100 [sic] warning
+I0521 10:15:04.114612 21437 solver.cpp:454] Snapshotting to binary proto file snapshot_iter_938.caffemodel
+I0521 10:15:04.121902 21437 sgd_solver.cpp:273] Snapshotting solver state to binary proto file snapshot_iter_938.solverstate
+I0521 10:15:04.126711 21437 solver.cpp:244]     Train net output #0: loss = 1.2e-05 (* 1 = 1.2e-05 loss)
+I0521 10:15:04.126711 21437 solver.cpp:244]     Train net output #0: loss = nan (* 1 = nan loss)
+F0521 10:15:04.170002 21437 syncedmem.cpp:56] Check failed: error == cudaSuccess (2 vs. 0)  out of memory
+not a caffe line
+""".splitlines()
+
+class TestParseLine():
+
+    def test_levels(self):
+        """levels and messages are parsed from the header"""
+        parsed = [_.parse_line(line) for line in SAMPLE_LOG]
+        assert parsed[0] == ('info', 'Creating Layer ip2')
+        assert parsed[9] == ('info', 'Test net output #0: accuracy = 0.0859')
+        assert parsed[14] == ('warning', 'Iteration 100 [sic] warning')
+        assert parsed[-2] == ('critical', 'Check failed: error == cudaSuccess (2 vs. 0)  out of memory')
+        assert parsed[-1] == (None, None)
+
+    def test_timestamp(self):
+        """the timestamp is only parsed when asked for"""
+        assert _.parse_timestamp(SAMPLE_LOG[0]) is not None
+        assert _.parse_timestamp(SAMPLE_LOG[-1]) is None
+
+
+class TestParseMessage():
+
+    def parse(self):
+        return [_.parse_message(_.parse_line(line)[1])
+                for line in SAMPLE_LOG[:-1]]
+
+    def test_messages(self):
+        """the messages which DIGITS uses are recognized"""
+        parsed = self.parse()
+        assert parsed[0] is None
+        assert parsed[5] == (_.MEMORY, (5169920,))
+        assert parsed[8] == (_.ITERATION, (0, None))
+        assert parsed[9] == (_.NET_OUTPUT, ('test', 0, 'accuracy', '0.0859'))
+        assert parsed[10] == (_.NET_OUTPUT, ('test', 1, 'loss', '2.35161'))
+        assert parsed[12] == (_.NET_OUTPUT, ('train', 0, 'loss', '2.31372'))
+        assert parsed[13] == (_.ITERATION, (0, 0.01))
+        assert parsed[14] == (_.ITERATION, (100, None))
+        assert parsed[15] == (_.SNAPSHOT, ('binary proto file snapshot_iter_938.caffemodel',))
+        assert parsed[16] is None
+        assert parsed[17] == (_.NET_OUTPUT, ('train', 0, 'loss', '1.2e-05'))
+        assert parsed[18] == (_.NET_OUTPUT, ('train', 0, 'loss', 'nan'))
+        assert parsed[19] is None
+
+    def test_layer_types(self):
+        """the first layer which writes to a top gives its type"""
+        def layer(kind, *tops):
+            return mock.Mock(type=kind, top=list(tops))
+        network = mock.Mock(layer=[
+            layer('Data', 'data', 'label'),
+            layer('InnerProduct', 'ip1'),
+            layer('ReLU', 'ip1'),
+            layer('SoftmaxWithLoss', 'loss'),
+            ])
+        assert _.layer_types(network) == {
+                'data': 'Data',
+                'label': 'Data',
+                'ip1': 'InnerProduct',
+                'loss': 'SoftmaxWithLoss',
+                }
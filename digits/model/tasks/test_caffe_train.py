@@ -1,8 +1,26 @@
 # Copyright (c) 2014-2015, NVIDIA CORPORATION.  All rights reserved.
 
+import tempfile
+
+import mock
+
 from . import caffe_train as _
 
 def test_caffe_imports():
     import numpy
     import google.protobuf
 
+
+def test_gpu_memory_key():
+    """the network is only serialized once for the GPU memory key"""
+    network = mock.Mock()
+    network.SerializeToString.return_value = 'network'
+    dataset = mock.Mock(image_dims=[28, 28, 1])
+    task = _.CaffeTrainTask(network=network, dataset=dataset, train_epochs=1,
+            snapshot_interval=1, learning_rate=0.01, lr_policy={},
+            job_dir=tempfile.gettempdir(), batch_size=64)
+    key = task.gpu_memory_key()
+    assert key == ('network', 64, None, (28, 28, 1))
+    assert task.gpu_memory_key() is key
+    assert network.SerializeToString.call_count == 1
+    assert '_gpu_memory_key' not in task.__getstate__()
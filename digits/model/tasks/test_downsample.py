@@ -0,0 +1,72 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import numpy as np
+
+from . import downsample as _
+
+class TestMinMaxSummary():
+
+    def brute_force(self, values, size, start, stop):
+        """the indices of the lowest and highest value in each bucket"""
+        indices = set()
+        position = start
+        while position < stop:
+            end = min(stop, (position // size + 1) * size)
+            chunk = values[position:end]
+            indices.add(position + np.where(np.isnan(chunk), np.inf, chunk).argmin())
+            indices.add(position + np.where(np.isnan(chunk), -np.inf, chunk).argmax())
+            position = end
+        return sorted(indices)
+
+    def test_bucket_size(self):
+        """buckets are the smallest power of FACTOR which fits"""
+        assert _.MinMaxSummary.bucket_size(200, 200) == 1
+        assert _.MinMaxSummary.bucket_size(201, 200) == 4
+        assert _.MinMaxSummary.bucket_size(10000, 200) == 256
+        assert _.MinMaxSummary.bucket_size(397, 200) == 16
+        # too few points for two buckets
+        assert _.MinMaxSummary.bucket_size(100, 2) == 256
+        assert _.MinMaxSummary.bucket_size(100, 3) == 256
+        values = np.arange(100.0)
+        assert _.MinMaxSummary().indices(values, 2).tolist() == [0, 99]
+
+    def test_indices(self):
+        """the lowest and highest value of each bucket are kept"""
+        values = np.random.RandomState(0).randn(10003)
+        values[123] = np.nan
+        values[5000] = 100
+        summary = _.MinMaxSummary()
+        indices = summary.indices(values, 200).tolist()
+        assert indices == self.brute_force(values, 256, 0, len(values))
+        assert 5000 in indices
+        assert len(indices) <= 200
+
+    def test_incremental(self):
+        """the summary is updated as values are appended"""
+        values = np.random.RandomState(1).randn(5000)
+        summary = _.MinMaxSummary()
+        for count in [3, 17, 100, 1025, 4999, 5000]:
+            summary.update(values[:count])
+            expected = _.MinMaxSummary()
+            expected.update(values[:count])
+            for got, want in zip(summary._levels, expected._levels):
+                assert got[2] == want[2]
+                assert (got[0][:got[2]] == want[0][:want[2]]).all()
+                assert (got[1][:got[2]] == want[1][:want[2]]).all()
+
+    def test_range(self):
+        """a range is drawn at its own resolution"""
+        values = np.random.RandomState(2).randn(10000)
+        summary = _.MinMaxSummary()
+        summary.update(values)
+        indices = summary.indices(values, 100, start=1001, stop=3000).tolist()
+        assert indices == self.brute_force(values, 64, 1001, 3000)
+        assert summary.indices(values, 100, start=10, stop=20).tolist() == range(10, 20)
+        assert summary.indices(values, 100, start=20, stop=10).tolist() == []
+
+    def test_size(self):
+        """the bucket size can be fixed (e.g. for the end of a series)"""
+        values = np.arange(1000, dtype=np.float64)
+        summary = _.MinMaxSummary()
+        indices = summary.indices(values, 200, start=990, size=16).tolist()
+        assert indices == [990, 991, 992, 999], indices
@@ -0,0 +1,89 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from . import gpu_history as _
+
+def sample(utilization, used=25, temperature=60):
+    return {
+            'memory': {'total': 100, 'used': used, 'free': 100 - used},
+            'utilization': {'gpu': utilization, 'memory': 10},
+            'temperature': temperature,
+            }
+
+class TestGpuHistory():
+
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'gpu_history')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def test_merge(self):
+        """each record is the mean of an interval"""
+        history = _.GpuHistory(self.directory)
+        history.append(1000, '0', sample(10), name='Fake GPU')
+        history.append(1000.5, '0', sample(30))
+        history.append(1000.5, '1', None)
+        history.append(1001, '0', sample(50, temperature=None))
+        # the last interval of each GPU isn't over yet
+        history.flush()
+        assert history.dirty()
+        records = _.GpuHistory(self.directory).read()
+        assert records['gpu'].tolist() == [0], records
+        assert records['utilization'][0] == 20
+        history.flush(final=True)
+        assert not history.dirty()
+
+        history = _.GpuHistory(self.directory)
+        assert [gpu['index'] for gpu in history.gpus()] == ['0', '1']
+        assert history.gpus()[0]['name'] == 'Fake GPU'
+        assert history.gpus()[0]['memory_total'] == 100
+        records = history.read()
+        assert records['gpu'].tolist() == [0, 1, 0], records
+        assert np.isnan(records['utilization'][1])
+        assert records['utilization'][2] == 50
+        assert records['memory'][2] == 25
+        assert np.isnan(records['temperature'][2])
+
+    def test_bounded(self):
+        """intervals get longer instead of the files getting larger"""
+        history = _.GpuHistory(self.directory)
+        history.MAX_RECORDS = 100
+        for second in xrange(1000):
+            history.append(second, '0', sample(second % 100))
+            history.append(second, '1', sample(50))
+            if second % 10 == 0:
+                history.flush()
+        history.flush(final=True)
+        assert history.interval == 16
+        records = _.GpuHistory(self.directory).read()
+        counts = np.bincount(records['gpu'])
+        assert len(counts) == 2 and counts.max() <= 100, counts
+        assert counts.min() >= 1000 // 16, counts
+        assert (records['utilization'][records['gpu'] == 1] == 50).all()
+        # the merged records are the mean of their samples
+        assert records['utilization'][0] == 7.5
+        assert records['time'][0] == 7.5
+
+    def test_graph_data(self):
+        """the utilization is graphed with the dips kept"""
+        history = _.GpuHistory(self.directory)
+        assert history.graph_data(20) is None
+        for second in xrange(1000):
+            history.append(second, '0', sample(0 if second == 500 else 90, used=50))
+        history.flush(final=True)
+        data = history.graph_data(20)
+        columns = dict((column[0], column[1:]) for column in data['columns'])
+        assert len(columns['gpu0_time']) <= 20
+        assert 0 in columns['gpu0_utilization']
+        assert set(columns['gpu0_memory']) == set([50])
+        assert data['axes'] == {'gpu0_temperature': 'y2'}
+        assert data['xs']['gpu0_utilization'] == 'gpu0_time'
+        # fewer points than two buckets
+        data = history.graph_data(2)
+        assert 0 in data['columns'][1][1:]
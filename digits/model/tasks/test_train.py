@@ -0,0 +1,423 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import mock
+import numpy as np
+
+from . import train as _
+from . import output_store
+from . import retention
+from digits import gpu_telemetry
+from digits.rooms import RoomTracker
+
+class TestOutputStore():
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        """records are appended and read back"""
+        store = output_store.OutputStore(self.directory)
+        store.append('train', 'loss', 'SoftmaxWithLoss', 0, 0.5)
+        store.append('train', 'loss', 'SoftmaxWithLoss', 0.5, None)
+        assert store.dirty()
+        # the pending records are flushed rather than copied with the others
+        records = store.read('train', 'loss')
+        assert isinstance(records, np.memmap)
+        assert records['epoch'].tolist() == [0, 0.5]
+        assert np.isnan(records['value'][1])
+        assert not store.dirty()
+
+        store.append('train', 'loss', 'SoftmaxWithLoss', 1, 0.25)
+        assert store.read('train', 'loss')['value'][-1] == 0.25
+        store.flush()
+
+        reopened = output_store.OutputStore(self.directory)
+        assert reopened.series() == [('loss', 'SoftmaxWithLoss')]
+        records = reopened.read('train', 'loss')
+        assert isinstance(records, np.memmap)
+        assert records['epoch'].tolist() == [0, 0.5, 1]
+        assert reopened.last('train', 'loss') == (1, 0.25)
+        assert reopened.last('val', 'loss') is None
+
+    def test_partial_record(self):
+        """a partially written record is ignored"""
+        store = output_store.OutputStore(self.directory)
+        store.append('val', 'accuracy', 'Accuracy', 1, 0.75)
+        store.flush()
+        filename = os.path.join(self.directory, 'val-0.bin')
+        with open(filename, 'ab') as outfile:
+            outfile.write('\x00\x01\x02')
+
+        store = output_store.OutputStore(self.directory)
+        assert store.read('val', 'accuracy')['value'].tolist() == [0.75]
+        store.append('val', 'accuracy', 'Accuracy', 2, 0.8)
+        store.flush()
+        assert store.read('val', 'accuracy')['value'].tolist() == [0.75, 0.8]
+
+
+class TestOutputs():
+    """
+    tests for storing the network outputs outside of the pickle
+    """
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.job_dir)
+
+    def make_task(self):
+        task = _.TrainTask(dataset=None, train_epochs=2, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir=self.job_dir)
+        task.last_train_update = None
+        return task
+
+    def reload(self, task):
+        job_dir = task.job_dir
+        task = pickle.loads(pickle.dumps(task))
+        task.job_dir = job_dir
+        task.load_outputs()
+        return task
+
+    def old_job_dir(self):
+        # a job_dir which isn't shared with the task built by make_task()
+        job_dir = os.path.join(self.job_dir, 'old')
+        if not os.path.exists(job_dir):
+            os.mkdir(job_dir)
+        return job_dir
+
+    def save_outputs(self, task):
+        task.save_train_output('loss', 'SoftmaxWithLoss', 0.5)
+        task.save_train_output('learning_rate', 'LearningRate', 0.01)
+        task.current_epoch = 0.5
+        task.save_train_output('loss', 'SoftmaxWithLoss', 0.25)
+        task.save_val_output('accuracy', 'Accuracy', 0.75)
+
+    def test_append(self):
+        """outputs are appended to the store"""
+        task = self.make_task()
+        self.save_outputs(task)
+        assert task.is_dirty()
+        task.persist()
+        task.mark_clean()
+        assert not task.is_dirty()
+
+        filename = os.path.join(self.job_dir, task.OUTPUTS_DIR, 'train-0.bin')
+        size = os.path.getsize(filename)
+        task.current_epoch = 1
+        task.save_train_output('loss', 'SoftmaxWithLoss', 0.125)
+        assert task.is_dirty()
+        # while the task runs
+        task.flush_outputs()
+        assert os.path.getsize(filename) > size, 'outputs not appended'
+
+        loaded = self.reload(task)
+        assert loaded.combined_graph_data() == task.combined_graph_data()
+        assert loaded.output_store().read('train', 'loss')['value'].tolist() == [0.5, 0.25, 0.125]
+        assert loaded.current_epoch == 1
+
+    def test_not_pickled(self):
+        """outputs are not pickled"""
+        task = self.make_task()
+        task.save_train_output('loss', 'SoftmaxWithLoss', 0.5)
+        state = task.__getstate__()
+        assert '_outputs' not in state
+        assert task.combined_graph_data(), 'outputs should still be in memory'
+
+    def test_epoch_complete(self):
+        """outputs are complete once every output has a value for the epoch"""
+        task = self.make_task()
+        assert task.save_output('train', 'loss', 'SoftmaxWithLoss', 0.5)
+        assert task.save_output('train', 'learning_rate', 'LearningRate', 0.01)
+        assert task.save_output('train', 'accuracy', 'Accuracy', 0.5)
+        task.current_epoch = 1
+        assert not task.save_output('train', 'loss', 'SoftmaxWithLoss', 0.25)
+        assert task.save_output('train', 'accuracy', 'Accuracy', 0.75)
+
+    def test_graph_data(self):
+        """graph data for C3.js"""
+        task = self.make_task()
+        self.save_outputs(task)
+        task.save_val_output('loss', 'SoftmaxWithLoss', None)
+
+        data = task.combined_graph_data()
+        columns = dict((c[0], c[1:]) for c in data['columns'])
+        assert columns['loss-train'] == [0.5, 0.25]
+        assert columns[data['xs']['loss-train']] == [0, 0.5]
+        assert columns['accuracy-val'] == [75]
+        assert columns['loss-val'] == [None]
+        assert data['axes'] == {'accuracy-val': 'y2'}
+        assert data['names']['accuracy-val'] == 'accuracy (val)'
+
+        lr = task.lr_graph_data()
+        assert lr['columns'] == [['epoch', 0], ['lr', 0.01]]
+
+        loss = task.loss_graph_data()
+        assert sorted(loss['names']) == ['loss-train', 'loss-val']
+
+        for i in xrange(1000):
+            task.current_epoch = i
+            task.save_train_output('loss', 'SoftmaxWithLoss', i)
+        data = task.combined_graph_data()
+        assert len(data['columns'][0]) <= 201
+        data = task.combined_graph_data(cull=False)
+        assert len(data['columns'][0]) == 1003
+
+        # spikes aren't culled
+        task.save_train_output('loss', 'SoftmaxWithLoss', 5000)
+        for i in xrange(1000):
+            task.save_train_output('loss', 'SoftmaxWithLoss', i)
+        data = task.combined_graph_data()
+        assert 5000 in data['columns'][0]
+
+        # a range of epochs
+        data = task.combined_graph_data(epochs=(100, 199), points=50)
+        columns = dict((c[0], c[1:]) for c in data['columns'])
+        epochs = columns[data['xs']['loss-train']]
+        assert min(epochs) >= 100 and max(epochs) <= 199, epochs
+        assert 10 <= len(epochs) <= 50, epochs
+
+    def test_graph_update(self):
+        """graph updates only contain the new points"""
+        task = self.make_task()
+        task.save_output('train', 'loss', 'SoftmaxWithLoss', 0.5)
+        update = task.graph_update('combined')
+        assert update['seq'] == 1
+        assert update['data'] == task.combined_graph_data()
+        assert task.graph_update('combined') is None
+
+        state = task.graph_state('combined')
+        assert state['seq'] == 1
+        assert state['counts'] == {'loss-train': 1}
+
+        task.current_epoch = 0.5
+        task.save_output('train', 'loss', 'SoftmaxWithLoss', 0.25)
+        task.save_output('train', 'loss', 'SoftmaxWithLoss', None)
+        update = task.graph_update('combined')
+        assert update == {
+                'seq': 2,
+                'counts': {'loss-train': 3},
+                'series': {'loss-train': [(1, 0.5, 0.25), (2, 0.5, None)]},
+                }, update
+
+        # a new output sends the whole graph again
+        task.save_output('val', 'accuracy', 'Accuracy', 0.75)
+        update = task.graph_update('combined')
+        assert update['seq'] == 3
+        assert update['data'] == task.combined_graph_data()
+
+        task.current_epoch = 1
+        task.save_output('val', 'accuracy', 'Accuracy', 0.8)
+        update = task.graph_update('combined')
+        assert update['series'] == {'accuracy-val': [(1, 1, 80)]}, update
+
+        # the lr graph is followed separately
+        task.save_output('train', 'learning_rate', 'LearningRate', 0.01)
+        assert task.graph_update('lr')['data'] == task.lr_graph_data()
+
+    def test_graph_update_culled(self):
+        """graph updates are culled like the graph data"""
+        task = self.make_task()
+        for i in xrange(1000):
+            task.save_output('train', 'loss', 'SoftmaxWithLoss', i % 10)
+        task.graph_update('combined')
+        for i in xrange(1000, 1100):
+            task.save_output('train', 'loss', 'SoftmaxWithLoss', 100 if i == 1050 else i % 10)
+        update = task.graph_update('combined')
+        points = update['series']['loss-train']
+        # two points for each stretch of 16 records
+        assert len(points) <= 2 * (100 // 16 + 2), points
+        assert (1050, 0, 100) in points, points
+        assert all(point[0] >= 1000 for point in points), points
+
+    def test_graph_sent_not_pickled(self):
+        """clients of a reloaded task get the whole graph again"""
+        task = self.make_task()
+        task.save_output('train', 'loss', 'SoftmaxWithLoss', 0.5)
+        task.graph_update('combined')
+        loaded = self.reload(task)
+        assert loaded.graph_update('combined')['seq'] == 1
+
+    def test_upgrade_pickle(self):
+        """outputs are moved out of old pickle files"""
+        task = self.make_task()
+        self.save_outputs(task)
+        state = task.__dict__.copy()
+        del state['aborted']
+        del state['logger']
+        del state['_dirty']
+        del state['_outputs']
+        state['train_outputs'] = OrderedDict([
+            ('epoch', _.NetworkOutput('Epoch', [0, 0.5])),
+            ('loss', _.NetworkOutput('SoftmaxWithLoss', [0.5, 0.25])),
+            ('learning_rate', _.NetworkOutput('LearningRate', [0.01, None])),
+            ])
+        state['val_outputs'] = OrderedDict([
+            ('epoch', _.NetworkOutput('Epoch', [0.5])),
+            ('accuracy', _.NetworkOutput('Accuracy', [0.75])),
+            ])
+        state['pickver_task_train'] = 3
+
+        old = _.TrainTask.__new__(_.TrainTask)
+        old.__setstate__(state)
+        old.job_dir = self.old_job_dir()
+        old.load_outputs()
+        assert old.is_dirty(), 'the pickle should be rewritten'
+        assert old.combined_graph_data() == task.combined_graph_data()
+        assert old.lr_graph_data() == task.lr_graph_data()
+
+        loaded = self.reload(old)
+        assert loaded.combined_graph_data() == task.combined_graph_data()
+
+
+class TestGpuUpdates():
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        nvml = mock.Mock(spec=gpu_telemetry.Nvml)
+        nvml.memory.return_value = {'total': 100, 'used': 25, 'free': 75}
+        nvml.utilization.return_value = {'gpu': 50, 'memory': 10}
+        nvml.temperature.return_value = 60
+        self.telemetry = gpu_telemetry.GpuTelemetry(nvml, interval=0.01)
+        device = mock.Mock()
+        device.name = 'Fake GPU'
+        self.patchers = [
+                mock.patch('digits.webapp.socketio'),
+                mock.patch('digits.webapp.rooms', RoomTracker()),
+                mock.patch.object(gpu_telemetry, 'get_telemetry', return_value=self.telemetry),
+                mock.patch.object(_.device_query, 'get_device', return_value=device),
+                ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.telemetry.stop()
+        shutil.rmtree(self.job_dir)
+
+    def test_subscription(self):
+        """GPU updates are sent while the task runs"""
+        from digits.webapp import socketio, rooms
+        task = _.TrainTask(dataset=None, train_epochs=2, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir=self.job_dir)
+        rooms.join(task.job_id, 'client')
+        task.current_resources = {'gpus': [('0', 1)]}
+        task.before_run()
+        assert '_gpu_subscription' not in task.__getstate__()
+        self.telemetry.poll()
+        message = socketio.emit.call_args[0][1]
+        assert message['update'] == 'gpu_utilization'
+        assert 'Fake GPU' in message['html'] and '50%' in message['html'], message['html']
+        task.after_run()
+        assert not self.telemetry.watched()
+        # the samples were stored in the job directory
+        history = _.GpuHistory(task.path(task.GPU_HISTORY_DIR))
+        assert history.gpus()[0]['name'] == 'Fake GPU'
+        assert history.read()['utilization'].tolist() == [50]
+        assert task.gpu_history_data()['columns']
+
+    def test_nobody_watching(self):
+        """GPU updates aren't rendered while nobody watches the job"""
+        from digits.webapp import socketio, rooms
+        task = _.TrainTask(dataset=None, train_epochs=2, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir=self.job_dir)
+        task.current_resources = {'gpus': [('0', 1)]}
+        task.before_run()
+        with mock.patch('flask.render_template') as render:
+            self.telemetry.poll()
+            assert not render.called
+        assert not socketio.emit.called
+        # somebody who joins later gets the last update
+        rooms.join(task.job_id, 'client')
+        [(event, message)] = rooms.snapshot(task.job_id)
+        assert message['update'] == 'gpu_utilization'
+        assert '50%' in message['html'], message['html']
+        task.after_run()
+
+
+class TestRetention():
+    """
+    tests for deleting snapshots with a RetentionPolicy
+    """
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.job_dir)
+
+    def snapshots(self, epochs):
+        return [('snapshot_%s' % e, e) for e in epochs]
+
+    def test_policy(self):
+        """rules keep the union of their snapshots"""
+        snapshots = self.snapshots(range(1, 11))
+        def kept(policy, scores=None):
+            deleted = policy.to_delete(snapshots, scores)
+            return [e for f, e in snapshots if (f, e) not in deleted]
+
+        assert kept(retention.RetentionPolicy()) == range(1, 11)
+        assert kept(retention.RetentionPolicy(keep_last=3)) == [8, 9, 10]
+        assert kept(retention.RetentionPolicy(keep_every=4)) == [4, 8, 10]
+        scores = dict((e, -abs(e - 5)) for e in range(1, 11))
+        # ties go to the most recent snapshot
+        assert kept(retention.RetentionPolicy(keep_best=2), scores) == [5, 6, 10]
+        assert kept(retention.RetentionPolicy(keep_best=2)) == [10]
+        assert kept(retention.RetentionPolicy(keep_last=1, keep_every=5)) == [5, 10]
+
+    def test_enforce(self):
+        """the task deletes snapshot files"""
+        task = _.TrainTask(dataset=None, train_epochs=4, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir=self.job_dir,
+                retention=retention.RetentionPolicy(keep_best=1))
+        for epoch in range(1, 5):
+            filename = os.path.join(self.job_dir, 'snapshot_%d.caffemodel' % epoch)
+            with open(filename, 'w') as outfile:
+                outfile.write('x' * 100)
+            task.snapshots.append((filename, epoch))
+            task.current_epoch = epoch
+            task.save_output('val', 'loss', 'SoftmaxWithLoss', [0.5, 0.2, 0.3, 0.4][epoch-1])
+        assert task.snapshot_disk_usage() == 400
+        assert task.snapshot_scores() == {1: -0.5, 2: -0.2, 3: -0.3, 4: -0.4}
+
+        deleted = task.enforce_retention()
+        assert len(deleted) == 2
+        assert [s[1] for s in task.snapshots] == [2, 4]
+        assert not os.path.exists(os.path.join(self.job_dir, 'snapshot_1.caffemodel'))
+        assert task.snapshot_disk_usage() == 200
+
+        task.retention = None
+        assert task.enforce_retention() == []
+        assert task.enforce_retention(retention.RetentionPolicy(keep_last=1)) \
+                == [os.path.join(self.job_dir, 'snapshot_2.caffemodel')]
+
+    def test_enforce_referenced(self):
+        """snapshots which other models start from are kept"""
+        task = _.TrainTask(dataset=None, train_epochs=3, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir=self.job_dir,
+                retention=retention.RetentionPolicy(keep_last=1))
+        for epoch in range(1, 4):
+            filename = os.path.join(self.job_dir, 'snapshot_%d.caffemodel' % epoch)
+            with open(filename, 'w') as outfile:
+                outfile.write('x')
+            task.snapshots.append((filename, epoch))
+        referenced = os.path.join(self.job_dir, '.', 'snapshot_1.caffemodel')
+        deleted = task.enforce_retention(referenced=set([referenced]))
+        assert deleted == [os.path.join(self.job_dir, 'snapshot_2.caffemodel')]
+        assert [s[1] for s in task.snapshots] == [1, 3]
@@ -11,7 +11,7 @@ import numpy as np
 
 from train import TrainTask
 from digits.status import Status
-from digits import utils, dataset
+from digits import dataset
 from digits.utils import subclass, override, constants
 from digits.dataset import ImageClassificationDatasetJob
 
@@ -133,7 +133,7 @@ class TorchTrainTask(TrainTask):
         Sends socketio message about the current iteration
         """
         # TODO: move to TrainTask
-        from digits.webapp import socketio
+        from digits.webapp import rooms
 
         if self.current_iteration == it:
             return
@@ -141,16 +141,8 @@ class TorchTrainTask(TrainTask):
         self.current_iteration = it
         self.progress = float(it)/self.solver.max_iter
 
-        socketio.emit('task update',
-                {
-                    'task': self.html_id(),
-                    'update': 'progress',
-                    'percentage': int(round(100*self.progress)),
-                    'eta': utils.time_filters.print_time_diff(self.est_done()),
-                    },
-                namespace='/jobs',
-                room=self.job_id,
-                )
+        rooms.emit('task update', self.progress_message, self.job_id,
+                key=(self.html_id(), 'progress'))
 
     def send_data_update(self, important=False):
         """
@@ -160,7 +152,7 @@ class TorchTrainTask(TrainTask):
         important -- if False, only send this update if the last unimportant update was sent more than 5 seconds ago
         """
         # TODO: move to TrainTask
-        from digits.webapp import socketio
+        from digits.webapp import rooms
 
         if not important:
             if self.last_unimportant_update and (time.time() - self.last_unimportant_update) < 5:
@@ -168,47 +160,42 @@ class TorchTrainTask(TrainTask):
             self.last_unimportant_update = time.time()
 
         # loss graph data
-        data = self.loss_graph_data()
-        if data:
-            socketio.emit('task update',
-                    {
+        def build_loss_graph():
+            data = self.loss_graph_data()
+            if data:
+                return {
                         'task': self.html_id(),
                         'update': 'loss_graph',
                         'data': data,
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
+                        }
+        rooms.emit('task update', build_loss_graph, self.job_id)
 
         # lr graph data
-        data = self.lr_graph_data()
-        if data:
-            socketio.emit('task update',
-                    {
+        def build_lr_graph():
+            data = self.lr_graph_data()
+            if data:
+                return {
                         'task': self.html_id(),
                         'update': 'lr_graph',
                         'data': data,
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
+                        }
+        rooms.emit('task update', build_lr_graph, self.job_id)
 
     def send_snapshot_update(self):
         """
         Sends socketio message about the snapshot list
         """
         # TODO: move to TrainTask
-        from digits.webapp import socketio
+        from digits.webapp import rooms
 
-        socketio.emit('task update',
-                {
+        rooms.emit('task update',
+                lambda: {
                     'task': self.html_id(),
                     'update': 'snapshots',
                     'data': self.snapshot_list(),
                     },
-                namespace='/jobs',
-                room=self.job_id,
-                )
+                self.job_id,
+                key=(self.html_id(), 'snapshots'))
 
     ### TrainTask overrides
 
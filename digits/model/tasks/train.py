@@ -4,17 +4,21 @@ import time
 import os.path
 from collections import OrderedDict, namedtuple
 
-import gevent
 import flask
+import numpy as np
 
-from digits import utils, device_query
+from digits import device_query, gpu_topology, gpu_telemetry
 from digits.task import Task
 from digits.utils import override
+from output_store import OutputStore
+from gpu_history import GpuHistory
+from downsample import MinMaxSummary
+from retention import RetentionPolicy
 
 # NOTE: Increment this everytime the picked object changes
-PICKLE_VERSION = 2
+PICKLE_VERSION = 6
 
-# Used to store network outputs
+# Used to store network outputs (before PICKLE_VERSION 5)
 NetworkOutput = namedtuple('NetworkOutput', ['kind', 'data'])
 
 class TrainTask(Task):
@@ -22,6 +26,19 @@ class TrainTask(Task):
     Defines required methods for child classes
     """
 
+    # The GPU memory footprint is estimated from the memory needed for the
+    #   data blobs, to leave room for diffs, weights and workspaces
+    GPU_MEMORY_FACTOR = 3
+    # Memory used by the CUDA context
+    GPU_MEMORY_OVERHEAD = 256 * 2**20
+    # Network outputs are stored in an OutputStore in this directory
+    OUTPUTS_DIR = 'outputs'
+    TASK_TYPE = 'train'
+    # Culled graphs draw each output with this many points or fewer
+    GRAPH_POINTS = 200
+    # The GPU samples are stored in a GpuHistory in this directory
+    GPU_HISTORY_DIR = 'gpu_history'
+
     def __init__(self, dataset, train_epochs, snapshot_interval, learning_rate, lr_policy, **kwargs):
         """
         Arguments:
@@ -40,6 +57,8 @@ class TrainTask(Task):
         crop_size -- crop each image down to a square of this size
         use_mean -- subtract the dataset's mean file
         random_seed -- optional random seed
+        retention -- a RetentionPolicy for the snapshots (default: the
+            Scheduler's policy)
         """
         self.gpu_count = kwargs.pop('gpu_count', None)
         self.selected_gpus = kwargs.pop('selected_gpus', None)
@@ -50,6 +69,7 @@ class TrainTask(Task):
         self.use_mean = kwargs.pop('use_mean', None)
         self.random_seed = kwargs.pop('random_seed', None)
         self.solver_type = kwargs.pop('solver_type', None)
+        self.retention = kwargs.pop('retention', None)
 
         super(TrainTask, self).__init__(**kwargs)
         self.pickver_task_train = PICKLE_VERSION
@@ -62,10 +82,15 @@ class TrainTask(Task):
 
         self.current_epoch = 0
         self.snapshots = []
+        # bytes of memory needed on each GPU (None if unknown)
+        self.gpu_memory = None
 
-        # data gets stored as dicts of lists (for graphing)
-        self.train_outputs = OrderedDict()
-        self.val_outputs = OrderedDict()
+        # network outputs (see output_store())
+        self._outputs = None
+        # GPU samples (see gpu_history())
+        self._gpu_history = None
+        # graph -> (seq, {col_id: count}) of the last update (see graph_update())
+        self._graph_sent = {}
 
     def __getstate__(self):
         state = super(TrainTask, self).__getstate__()
@@ -75,8 +100,16 @@ class TrainTask(Task):
             del state['snapshots']
         if '_labels' in state:
             del state['_labels']
-        if '_gpu_socketio_thread' in state:
-            del state['_gpu_socketio_thread']
+        if '_gpu_subscription' in state:
+            del state['_gpu_subscription']
+        if '_outputs' in state:
+            del state['_outputs']
+        if '_gpu_history' in state:
+            del state['_gpu_history']
+        if '_legacy_outputs' in state:
+            del state['_legacy_outputs']
+        if '_graph_sent' in state:
+            del state['_graph_sent']
         return state
 
     def __setstate__(self, state):
@@ -98,106 +131,162 @@ class TrainTask(Task):
                 if va:
                     state['val_outputs']['accuracy'] = NetworkOutput('Accuracy', [x[1]/100 for x in va])
                 state['val_outputs']['loss'] = NetworkOutput('SoftmaxWithLoss', [x[1] for x in vl])
+        if state['pickver_task_train'] < 3:
+            state['gpu_memory'] = None
+        if state['pickver_task_train'] < 5:
+            # the outputs are moved to OUTPUTS_DIR by load_outputs()
+            state['_legacy_outputs'] = (
+                    state.pop('train_outputs', None),
+                    state.pop('val_outputs', None))
+        if state['pickver_task_train'] < 6:
+            state['retention'] = None
         state['pickver_task_train'] = PICKLE_VERSION
         super(TrainTask, self).__setstate__(state)
 
         self.snapshots = []
         self.dataset = None
+        self._outputs = None
+        self._gpu_history = None
+        self._graph_sent = {}
 
     @override
     def offer_resources(self, resources):
+        gpus = self.offer_gpus(resources)
+        if gpus is None:
+            return None
+        # one core per GPU to keep it fed with data
+        cpus = self.request_resources(resources, {
+            'cpus': max(1, len(gpus.get('gpus', []))),
+            })
+        if cpus is None:
+            return None
+        gpus.update(cpus)
+        return gpus
+
+    @override
+    def estimated_work(self):
+        dataset = getattr(self, 'dataset', None)
+        if dataset is None:
+            return None
+        db_task = dataset.train_db_task()
+        if db_task is None or not db_task.entries_count:
+            return None
+        return self.train_epochs * db_task.entries_count
+
+    @override
+    def gpus_needed(self):
+        if self.gpu_count is not None:
+            return self.gpu_count
+        elif self.selected_gpus is not None:
+            return len(self.selected_gpus)
+        return 0
+
+    def offer_gpus(self, resources):
+        """
+        Returns the gpus to use in the format expected by offer_resources()
+        Returns {} if there are no GPUs, or None if they are busy
+        """
         if 'gpus' not in resources:
             return None
         if not resources['gpus']:
             return {} # don't use a GPU at all
         if self.gpu_count is not None:
-            identifiers = []
-            for resource in resources['gpus']:
-                if resource.remaining() >= 1:
-                    identifiers.append(resource.identifier)
-                    if len(identifiers) == self.gpu_count:
-                        break
-            if len(identifiers) == self.gpu_count:
-                return {'gpus': [(i, 1) for i in identifiers]}
-            else:
+            # pack onto the busiest GPUs first to keep whole GPUs free
+            candidates = sorted(
+                    [gpu for gpu in resources['gpus'] if gpu.can_fit(self.gpu_memory)],
+                    key=lambda gpu: gpu.remaining())
+            # then pick the best connected set
+            identifiers = gpu_topology.get_topology().best_set(
+                    [gpu.identifier for gpu in candidates], self.gpu_count)
+            if identifiers is None:
                 return None
+            fractions = dict((gpu.identifier, gpu.memory_fraction(self.gpu_memory))
+                    for gpu in candidates)
+            return {'gpus': [(i, fractions[i]) for i in identifiers]}
         elif self.selected_gpus is not None:
-            all_available = True
+            chosen = []
             for i in self.selected_gpus:
                 available = False
                 for gpu in resources['gpus']:
                     if i == gpu.identifier:
-                        if gpu.remaining() >= 1:
+                        if gpu.can_fit(self.gpu_memory):
                             available = True
+                            chosen.append(gpu)
                         break
                 if not available:
-                    all_available = False
-                    break
-            if all_available:
-                return {'gpus': [(i, 1) for i in self.selected_gpus]}
-            else:
-                return None
+                    return None
+            return {'gpus': [(gpu.identifier, gpu.memory_fraction(self.gpu_memory))
+                for gpu in chosen]}
         return None
 
+    def set_data_memory(self, bytes_required):
+        """
+        Sets gpu_memory from the memory needed for the data blobs on each GPU
+        (which caffe reports while setting up the networks)
+        """
+        self.gpu_memory = int(bytes_required * self.GPU_MEMORY_FACTOR
+                + self.GPU_MEMORY_OVERHEAD)
+
     @override
     def before_run(self):
+        self._graph_sent = {}
         if 'gpus' in self.current_resources:
-            # start a thread which sends SocketIO updates about GPU utilization
-            self._gpu_socketio_thread = gevent.spawn(
-                    self.gpu_socketio_updater,
+            # record the GPU utilization and send SocketIO updates about it
+            self._gpu_subscription = gpu_telemetry.get_telemetry().subscribe(
                     [identifier for (identifier, value)
-                        in self.current_resources['gpus']]
+                        in self.current_resources['gpus']],
+                    self.on_gpu_samples,
                     )
 
-    def gpu_socketio_updater(self, gpus):
+    def on_gpu_samples(self, samples):
         """
-        This thread sends SocketIO messages about GPU utilization
-        to connected clients
+        Called by the GpuTelemetry after each round of samples
 
         Arguments:
-        gpus -- a list of identifiers for the GPUs currently being used
+        samples -- a dict of {index: sample} for the GPUs used by this task
         """
-        from digits.webapp import app, socketio
+        history = self.gpu_history()
+        now = time.time()
+        for index, sample in sorted(samples.iteritems()):
+            history.append(now, index, sample,
+                    name=device_query.get_device(index).name)
+        self.send_gpu_update(samples)
 
-        devices = []
-        for index in gpus:
-            device = device_query.get_device(index)
-            if device:
-                devices.append((index, device))
-        if not devices:
-            raise RuntimeError('Failed to load gpu information for "%s"' % gpus)
+    def send_gpu_update(self, samples):
+        """
+        Sends SocketIO message about GPU utilization to connected clients
 
-        # this thread continues until killed in after_run()
-        while True:
-            data = []
+        Arguments:
+        samples -- a dict of {index: sample} for the GPUs used by this task
+        """
+        from digits.webapp import app, rooms
 
-            for index, device in devices:
+        def build():
+            data = []
+            for index, sample in sorted(samples.iteritems()):
+                device = device_query.get_device(index)
                 update = {'name': device.name, 'index': index}
-                nvml_info = device_query.get_nvml_info(index)
-                if nvml_info is not None:
-                    update.update(nvml_info)
+                if sample is not None:
+                    update.update(sample)
                 data.append(update)
 
             with app.app_context():
                 html = flask.render_template('models/gpu_utilization.html',
                         data = data)
+            return {
+                    'task': self.html_id(),
+                    'update': 'gpu_utilization',
+                    'html': html,
+                    }
 
-                socketio.emit('task update',
-                        {
-                            'task': self.html_id(),
-                            'update': 'gpu_utilization',
-                            'html': html,
-                            },
-                        namespace='/jobs',
-                        room=self.job_id,
-                        )
-            gevent.sleep(1)
+        rooms.emit('task update', build, self.job_id,
+                key=(self.html_id(), 'gpu_utilization'))
 
     def send_progress_update(self, epoch):
         """
         Sends socketio message about the current progress
         """
-        from digits.webapp import socketio
+        from digits.webapp import rooms
 
         if self.current_epoch == epoch:
             return
@@ -205,24 +294,14 @@ class TrainTask(Task):
         self.current_epoch = epoch
         self.progress = epoch/self.train_epochs
 
-        socketio.emit('task update',
-                {
-                    'task': self.html_id(),
-                    'update': 'progress',
-                    'percentage': int(round(100*self.progress)),
-                    'eta': utils.time_filters.print_time_diff(self.est_done()),
-                    },
-                namespace='/jobs',
-                room=self.job_id,
-                )
+        rooms.emit('task update', self.progress_message, self.job_id,
+                key=(self.html_id(), 'progress'))
 
-    def save_train_output(self, *args):
+    def save_train_output(self, name, kind, value):
         """
-        Save output to self.train_outputs
+        Save a training output to the OutputStore
         """
-        from digits.webapp import socketio
-
-        if not self.save_output(self.train_outputs, *args):
+        if not self.save_output('train', name, kind, value):
             return
 
         if self.last_train_update and (time.time() - self.last_train_update) < 5:
@@ -231,61 +310,48 @@ class TrainTask(Task):
 
         self.logger.debug('Training %s%% complete.' % round(100 * self.current_epoch/self.train_epochs,2))
 
-        # loss graph data
-        data = self.combined_graph_data()
-        if data:
-            socketio.emit('task update',
-                    {
-                        'task': self.html_id(),
-                        'update': 'combined_graph',
-                        'data': data,
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
-
-        # lr graph data
-        data = self.lr_graph_data()
-        if data:
-            socketio.emit('task update',
-                    {
-                        'task': self.html_id(),
-                        'update': 'lr_graph',
-                        'data': data,
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
+        self.send_graph_update('combined')
+        self.send_graph_update('lr')
 
-    def save_val_output(self, *args):
+    def save_val_output(self, name, kind, value):
         """
-        Save output to self.val_outputs
+        Save a validation output to the OutputStore
         """
-        from digits.webapp import socketio
-
-        if not self.save_output(self.val_outputs, *args):
+        if not self.save_output('val', name, kind, value):
             return
 
-        # loss graph data
-        data = self.combined_graph_data()
-        if data:
-            socketio.emit('task update',
-                    {
+        self.send_graph_update('combined')
+
+    def send_graph_update(self, graph):
+        """
+        Sends socketio message with the points added to a graph
+        Nothing is computed while nobody is watching the job (the page gets
+            the whole graph when it loads)
+
+        Arguments:
+        graph -- "combined" or "lr"
+        """
+        from digits.webapp import rooms
+
+        def build():
+            data = self.graph_update(graph)
+            if data:
+                return {
                         'task': self.html_id(),
-                        'update': 'combined_graph',
+                        'update': 'graph',
+                        'graph': graph,
                         'data': data,
-                        },
-                    namespace='/jobs',
-                    room=self.job_id,
-                    )
+                        }
+
+        rooms.emit('task update', build, self.job_id)
 
-    def save_output(self, d, name, kind, value):
+    def save_output(self, phase, name, kind, value):
         """
-        Save output to self.train_outputs or self.val_outputs
+        Save output for the current epoch to the OutputStore
         Returns true if all outputs for this epoch have been added
 
         Arguments:
-        d -- the dictionary where the output should be stored
+        phase -- "train" or "val"
         name -- name of the output (e.g. "accuracy")
         kind -- the type of outputs (e.g. "Accuracy")
         value -- value for this output (e.g. 0.95)
@@ -294,43 +360,108 @@ class TrainTask(Task):
         name = str(name)
         kind = str(kind)
 
-        # update d['epoch']
-        if 'epoch' not in d:
-            d['epoch'] = NetworkOutput('Epoch', [self.current_epoch])
-        elif d['epoch'].data[-1] != self.current_epoch:
-            d['epoch'].data.append(self.current_epoch)
-
-        if name not in d:
-            d[name] = NetworkOutput(kind, [])
-        epoch_len = len(d['epoch'].data)
-        name_len = len(d[name].data)
-
-        # save to back of d[name]
-        if name_len > epoch_len:
-            raise Exception('Received a new output without being told the new epoch')
-        elif name_len == epoch_len:
-            # already exists
-            if isinstance(d[name].data[-1], list):
-                d[name].data[-1].append(value)
-            else:
-                d[name].data[-1] = [d[name].data[-1], value]
-        elif name_len == epoch_len - 1:
-            # expected case
-            d[name].data.append(value)
-        else:
-            # we might have missed one
-            d[name].data += [None] * (epoch_len - name_len - 1) + [value]
+        store = self.output_store()
+        store.append(phase, name, kind, self.current_epoch, value)
 
-        for key in d:
-            if key not in ['epoch', 'learning_rate']:
-                if len(d[key].data) != epoch_len:
+        for other, _ in store.series(phase):
+            if other != 'learning_rate':
+                last = store.last(phase, other)
+                if last is None or last[0] != self.current_epoch:
                     return False
         return True
 
+    def output_store(self):
+        """
+        Returns the OutputStore for the network outputs
+        """
+        if self._outputs is None:
+            self._outputs = OutputStore(self.path(self.OUTPUTS_DIR))
+        return self._outputs
+
+    def gpu_history(self):
+        """
+        Returns the GpuHistory for the GPU samples
+        """
+        if self._gpu_history is None:
+            self._gpu_history = GpuHistory(self.path(self.GPU_HISTORY_DIR))
+        return self._gpu_history
+
+    def gpu_history_data(self, points=None):
+        """
+        Returns the GPU utilization, memory and temperature over time
+        formatted for a C3.js graph (or None)
+
+        Keyword arguments:
+        points -- overrides GRAPH_POINTS
+        """
+        return self.gpu_history().graph_data(points or self.GRAPH_POINTS)
+
+    @override
+    def is_dirty(self):
+        return (super(TrainTask, self).is_dirty()
+                or (self._outputs is not None and self._outputs.dirty())
+                or (self._gpu_history is not None and self._gpu_history.dirty()))
+
+    @override
+    def persist(self):
+        self.flush_outputs()
+        if self._gpu_history is not None:
+            self._gpu_history.flush()
+
+    @override
+    def flush_outputs(self):
+        if self._outputs is not None:
+            self._outputs.flush()
+
+    def load_outputs(self):
+        """
+        Open the OutputStore after the job has been loaded
+        Moves the outputs of older versions into the OutputStore
+        """
+        legacy_outputs = getattr(self, '_legacy_outputs', None)
+        self._legacy_outputs = None
+        self._outputs = None
+        store = self.output_store()
+        if store.exists() or legacy_outputs is None:
+            return
+
+        self.import_outputs('train', legacy_outputs[0])
+        self.import_outputs('val', legacy_outputs[1])
+        store.flush()
+        # the pickle file still contains the old outputs
+        self.mark_dirty()
+
+    def import_outputs(self, phase, outputs):
+        """
+        Add outputs stored in the pre-version 5 format to the OutputStore
+
+        Arguments:
+        phase -- "train" or "val"
+        outputs -- an OrderedDict of NetworkOutputs, with one entry in
+            each list for each entry in outputs['epoch']
+        """
+        if not outputs or 'epoch' not in outputs:
+            return
+        store = self.output_store()
+        epochs = outputs['epoch'].data
+        for name, output in outputs.iteritems():
+            if name == 'epoch':
+                continue
+            for epoch, value in zip(epochs, output.data):
+                if value is None:
+                    continue
+                if not isinstance(value, list):
+                    value = [value]
+                for v in value:
+                    store.append(phase, name, output.kind, epoch, v)
+
     @override
     def after_run(self):
-        if hasattr(self, '_gpu_socketio_thread'):
-            self._gpu_socketio_thread.kill()
+        if getattr(self, '_gpu_subscription', None) is not None:
+            gpu_telemetry.get_telemetry().unsubscribe(self._gpu_subscription)
+            self._gpu_subscription = None
+        if self._gpu_history is not None:
+            self._gpu_history.flush(final=True)
 
     def detect_snapshots(self):
         """
@@ -339,6 +470,100 @@ class TrainTask(Task):
         """
         return False
 
+    def snapshot_scores(self, output_name=None):
+        """
+        Returns a dict mapping snapshot epoch to the value of a validation
+        output from the last validation before that snapshot was taken
+        Losses are negated so that higher is always better
+
+        Keyword arguments:
+        output_name -- the validation output to use (default: "accuracy"
+            if there is one, else "loss")
+        """
+        store = self.output_store()
+        if output_name is None:
+            names = [name for name, _ in store.series('val')]
+            for name in ['accuracy', 'loss']:
+                if name in names:
+                    output_name = name
+                    break
+            else:
+                return {}
+        kind = store.kind('val', output_name)
+        if kind is None:
+            return {}
+        records = store.read('val', output_name)
+        valid = ~np.isnan(records['value'])
+        epochs = records['epoch'][valid]
+        values = records['value'][valid]
+        if 'loss' in kind.lower():
+            values = -values
+
+        scores = {}
+        for _, epoch in self.snapshots:
+            # snapshot epochs are rounded to 3 decimals
+            i = np.searchsorted(epochs, epoch + 1e-3, side='right')
+            if i > 0:
+                scores[epoch] = float(values[i-1])
+        return scores
+
+    def enforce_retention(self, default_policy=None, referenced=None):
+        """
+        Delete the snapshots which the retention policy doesn't keep
+        Returns a list of the deleted filenames
+
+        Keyword arguments:
+        default_policy -- the RetentionPolicy to use if this task has none
+        referenced -- a set of snapshots which are never deleted (e.g.
+            the pretrained models of other ModelJobs)
+        """
+        policy = self.retention or default_policy
+        if policy is None or policy.is_empty():
+            return []
+        if getattr(self, 'saving_snapshot', False):
+            # try again once the snapshot is written
+            return []
+
+        scores = None
+        if policy.keep_best:
+            scores = self.snapshot_scores(policy.best_output)
+        deleted = []
+        if referenced:
+            referenced = set(os.path.realpath(f) for f in referenced)
+        for filename, epoch in policy.to_delete(self.snapshots, scores):
+            if referenced and os.path.realpath(filename) in referenced:
+                continue
+            try:
+                os.remove(filename)
+            except OSError as e:
+                if os.path.exists(filename):
+                    self.logger.warning('Failed to delete snapshot "%s": %s' % (filename, e))
+                    continue
+            deleted.append(filename)
+        if deleted:
+            self.logger.info('Deleted %d snapshot(s) which the retention policy does not keep.' % len(deleted))
+            self.snapshots = [s for s in self.snapshots if s[0] not in deleted]
+            self.on_snapshots_deleted()
+        return deleted
+
+    def on_snapshots_deleted(self):
+        """
+        Called after enforce_retention() deletes snapshots
+        """
+        pass
+
+    def snapshot_disk_usage(self):
+        """
+        Returns the number of bytes used by the snapshots
+        """
+        total = 0
+        for filename, _ in self.snapshots:
+            try:
+                total += os.path.getsize(filename)
+            except OSError:
+                pass
+        return total
+
     def snapshot_list(self):
         """
         Returns an array of arrays for creating an HTML select field
@@ -417,174 +642,249 @@ class TrainTask(Task):
         self._labels = labels
         return self._labels
 
-    def lr_graph_data(self):
+    def graph_series(self, phase, cull=True, points=None, epochs=None):
         """
-        Returns learning rate data formatted for a C3.js graph
+        Returns a list of (name, kind, epochs, values) for each output in a
+        phase, with numpy arrays for epochs and values
 
         Keyword arguments:
+        cull -- if True, return GRAPH_POINTS values or fewer for each
+            output, keeping the lowest and highest values
+        points -- overrides GRAPH_POINTS
+        epochs -- if set, only return the values between these (first,
+            last) epochs
+        """
+        store = self.output_store()
+        series = []
+        for name, kind in store.series(phase):
+            start, stop = 0, None
+            if epochs is not None:
+                start, stop = store.index_range(phase, name, *epochs)
+            if cull:
+                _, records = store.downsample(phase, name,
+                        points or self.GRAPH_POINTS, start=start, stop=stop)
+            else:
+                records = store.read(phase, name)[start:stop]
+            if not len(records):
+                continue
+            series.append((name, kind, records['epoch'], records['value']))
+        return series
 
+    @staticmethod
+    def graph_column(col_id, values):
         """
-        if not self.train_outputs or 'epoch' not in self.train_outputs or 'learning_rate' not in self.train_outputs:
-            return None
+        Returns a C3.js column for a numpy array (None for missing values)
+        """
+        column = values.astype(object)
+        column[np.isnan(values)] = None
+        return [col_id] + column.tolist()
 
-        # return 100-200 values or fewer
-        stride = max(len(self.train_outputs['epoch'].data)/100,1)
-        e = ['epoch'] + self.train_outputs['epoch'].data[::stride]
-        lr = ['lr'] + self.train_outputs['learning_rate'].data[::stride]
+    def lr_graph_data(self, points=None, epochs=None):
+        """
+        Returns learning rate data formatted for a C3.js graph
 
-        return {
-                'columns': [e, lr],
-                'xs': {
-                    'lr': 'epoch'
-                    },
-                'names': {
-                    'lr': 'Learning Rate'
-                    },
-                }
+        Keyword arguments:
+        points -- overrides GRAPH_POINTS
+        epochs -- if set, only include the values between these (first,
+            last) epochs
+        """
+        for name, kind, x, values in self.graph_series('train', points=points, epochs=epochs):
+            if name == 'learning_rate':
+                return {
+                        'columns': [
+                            self.graph_column('epoch', x),
+                            self.graph_column('lr', values),
+                            ],
+                        'xs': {
+                            'lr': 'epoch'
+                            },
+                        'names': {
+                            'lr': 'Learning Rate'
+                            },
+                        }
+        return None
 
-    def loss_graph_data(self):
+    def outputs_graph_data(self, accept, cull=True, points=None, epochs=None):
         """
-        Returns loss data formatted for a C3.js graph
+        Returns train/val outputs formatted for a C3.js graph
+        Accuracies are scaled to percentages and put on the y2 axis
+
+        Arguments:
+        accept -- a function which takes the kind of an output and
+            returns True if it should be graphed
+
+        Keyword arguments:
+        cull -- if True, cut down the number of data points returned to a reasonable size
+        points -- overrides GRAPH_POINTS when culling
+        epochs -- if set, only include the values between these (first,
+            last) epochs
         """
         data = {
                 'columns': [],
                 'xs': {},
+                'axes': {},
                 'names': {},
                 }
 
-        if self.train_outputs and 'epoch' in self.train_outputs:
-            added_column = False
-            stride = max(len(self.train_outputs['epoch'].data)/100,1)
-            for name, output in self.train_outputs.iteritems():
-                if name not in ['epoch', 'learning_rate']:
-                    if 'loss' in output.kind.lower():
-                        col_id = '%s-train' % name
-                        data['columns'].append([col_id] + output.data[::stride])
-                        data['xs'][col_id] = 'train_epochs'
-                        data['names'][col_id] = '%s (train)' % name
-                        added_column = True
-            if added_column:
-                data['columns'].append(['train_epochs'] + self.train_outputs['epoch'].data[::stride])
-
-        if self.val_outputs and 'epoch' in self.val_outputs:
-            added_column = False
-            stride = max(len(self.val_outputs['epoch'].data)/100,1)
-            for name, output in self.val_outputs.iteritems():
-                if name not in ['epoch']:
-                    if 'loss' in output.kind.lower():
-                        col_id = '%s-val' % name
-                        data['columns'].append([col_id] + output.data[::stride])
-                        data['xs'][col_id] = 'val_epochs'
-                        data['names'][col_id] = '%s (val)' % name
-                        added_column = True
-            if added_column:
-                data['columns'].append(['val_epochs'] + self.val_outputs['epoch'].data[::stride])
+        for phase in ['train', 'val']:
+            for name, kind, x, values in self.graph_series(phase, cull, points, epochs):
+                if name == 'learning_rate' or not accept(kind):
+                    continue
+                col_id = '%s-%s' % (name, phase)
+                x_id = '%s-%s-epochs' % (name, phase)
+                if 'accuracy' in kind.lower():
+                    values = values * 100
+                    data['axes'][col_id] = 'y2'
+                data['columns'].append(self.graph_column(col_id, values))
+                data['columns'].append(self.graph_column(x_id, x))
+                data['xs'][col_id] = x_id
+                data['names'][col_id] = '%s (%s)' % (name, phase)
 
         if not len(data['columns']):
             return None
         else:
             return data
 
+    def loss_graph_data(self):
+        """
+        Returns loss data formatted for a C3.js graph
+        """
+        data = self.outputs_graph_data(lambda kind: 'loss' in kind.lower())
+        if data:
+            del data['axes']
+        return data
+
     def accuracy_graph_data(self):
         """
         Returns accuracy data formatted for a C3.js graph
         """
-        data = {
-                'columns': [],
-                'xs': {},
-                'names': {},
-                }
-
-        if self.train_outputs and 'epoch' in self.train_outputs:
-            added_column = False
-            stride = max(len(self.train_outputs['epoch'].data)/100,1)
-            for name, output in self.train_outputs.iteritems():
-                if name not in ['epoch', 'learning_rate']:
-                    if output.kind == 'Accuracy':
-                        col_id = '%s-train' % name
-                        data['columns'].append([col_id] + [100*x for x in output.data[::stride]])
-                        data['xs'][col_id] = 'train_epochs'
-                        data['names'][col_id] = '%s (train)' % name
-                        added_column = True
-            if added_column:
-                data['columns'].append(['train_epochs'] + self.train_outputs['epoch'].data[::stride])
-
-        if self.val_outputs and 'epoch' in self.val_outputs:
-            added_column = False
-            stride = max(len(self.val_outputs['epoch'].data)/100,1)
-            for name, output in self.val_outputs.iteritems():
-                if name not in ['epoch']:
-                    if output.kind == 'Accuracy':
-                        col_id = '%s-val' % name
-                        data['columns'].append([col_id] + [100*x for x in output.data[::stride]])
-                        data['xs'][col_id] = 'val_epochs'
-                        data['names'][col_id] = '%s (val)' % name
-                        added_column = True
-            if added_column:
-                data['columns'].append(['val_epochs'] + self.val_outputs['epoch'].data[::stride])
-
-        if not len(data['columns']):
-            return None
-        else:
-            return data
+        data = self.outputs_graph_data(lambda kind: kind == 'Accuracy')
+        if data:
+            del data['axes']
+        return data
 
-    def combined_graph_data(self, cull=True):
+    def combined_graph_data(self, cull=True, points=None, epochs=None):
         """
         Returns all train/val outputs in data for one C3.js graph
 
         Keyword arguments:
         cull -- if True, cut down the number of data points returned to a reasonable size
+        points -- overrides GRAPH_POINTS when culling
+        epochs -- if set, only include the values between these (first,
+            last) epochs
         """
-        data = {
-                'columns': [],
-                'xs': {},
-                'axes': {},
-                'names': {},
+        return self.outputs_graph_data(lambda kind: True, cull, points, epochs)
+
+    def graph_data(self, graph, points=None, epochs=None):
+        """
+        Returns the data for a graph formatted for C3.js
+
+        Arguments:
+        graph -- "combined" or "lr"
+
+        Keyword arguments:
+        points -- overrides GRAPH_POINTS
+        epochs -- if set, only include the values between these (first,
+            last) epochs
+        """
+        if graph == 'combined':
+            return self.combined_graph_data(points=points, epochs=epochs)
+        elif graph == 'lr':
+            return self.lr_graph_data(points=points, epochs=epochs)
+        raise ValueError('unknown graph "%s"' % graph)
+
+    def graph_records(self, graph):
+        """
+        Returns a list of (col_id, phase, name, kind, records) for each
+        output in a graph
+        (the outputs in graph_data())
+        """
+        store = self.output_store()
+        graphed = []
+        for phase in ['train', 'val']:
+            for name, kind in store.series(phase):
+                if graph == 'lr':
+                    if phase != 'train' or name != 'learning_rate':
+                        continue
+                    col_id = 'lr'
+                else:
+                    if name == 'learning_rate':
+                        continue
+                    col_id = '%s-%s' % (name, phase)
+                records = store.read(phase, name)
+                if len(records):
+                    graphed.append((col_id, phase, name, kind, records))
+        return graphed
+
+    def graph_state(self, graph, points=None, epochs=None):
+        """
+        Returns what a client needs to follow a graph: a dict with the
+        graph data, the sequence number of the last update and how many
+        records of each output the data includes
+
+        Arguments:
+        graph -- "combined" or "lr"
+
+        Keyword arguments:
+        points -- overrides GRAPH_POINTS
+        epochs -- if set, only include the values between these (first,
+            last) epochs
+        """
+        sent = self._graph_sent.get(graph)
+        return {
+                'seq': sent[0] if sent else 0,
+                'counts': dict((col_id, len(records))
+                    for col_id, _, _, _, records in self.graph_records(graph)),
+                'data': self.graph_data(graph, points=points, epochs=epochs),
                 }
 
-        if self.train_outputs and 'epoch' in self.train_outputs:
-            added_column = False
-            if cull:
-                stride = max(len(self.train_outputs['epoch'].data)/100,1)
-            else:
-                stride = 1
-            for name, output in self.train_outputs.iteritems():
-                if name not in ['epoch', 'learning_rate']:
-                    col_id = '%s-train' % name
-                    data['xs'][col_id] = 'train_epochs'
-                    data['names'][col_id] = '%s (train)' % name
-                    if 'accuracy' in output.kind.lower():
-                        data['columns'].append([col_id] + [100*x for x in output.data[::stride]])
-                        data['axes'][col_id] = 'y2'
-                    else:
-                        data['columns'].append([col_id] + output.data[::stride])
-                    added_column = True
-            if added_column:
-                data['columns'].append(['train_epochs'] + self.train_outputs['epoch'].data[::stride])
-
-        if self.val_outputs and 'epoch' in self.val_outputs:
-            added_column = False
-            if cull:
-                stride = max(len(self.val_outputs['epoch'].data)/100,1)
-            else:
-                stride = 1
-            for name, output in self.val_outputs.iteritems():
-                if name not in ['epoch']:
-                    col_id = '%s-val' % name
-                    data['columns'].append([col_id] + output.data[::stride])
-                    data['xs'][col_id] = 'val_epochs'
-                    data['names'][col_id] = '%s (val)' % name
-                    if 'accuracy' in output.kind.lower():
-                        data['columns'].append([col_id] + [100*x for x in output.data[::stride]])
-                        data['axes'][col_id] = 'y2'
-                    else:
-                        data['columns'].append([col_id] + output.data[::stride])
-                    added_column = True
-            if added_column:
-                data['columns'].append(['val_epochs'] + self.val_outputs['epoch'].data[::stride])
+    def graph_update(self, graph):
+        """
+        Returns the points added to a graph since the last update
+        Returns None if there are none
 
-        if not len(data['columns']):
-            return None
-        else:
-            return data
+        The update is a dict with a sequence number ("seq"), the number of
+            records of each output ("counts") and lists of [index, epoch,
+            value] for each output ("series"), culled like graph_data()
+        When an output is added, it contains the full graph_state() instead
+            of "series"
 
+        Arguments:
+        graph -- "combined" or "lr"
+        """
+        sent = self._graph_sent.get(graph)
+        graphed = self.graph_records(graph)
+        counts = dict((col_id, len(records)) for col_id, _, _, _, records in graphed)
+        if sent is not None and counts == sent[1]:
+            return None
+        seq = (sent[0] if sent else 0) + 1
+        self._graph_sent[graph] = (seq, counts)
+
+        if sent is None or set(counts) != set(sent[1]):
+            return {
+                    'seq': seq,
+                    'counts': counts,
+                    'data': self.graph_data(graph),
+                    }
+
+        store = self.output_store()
+        series = {}
+        for col_id, phase, name, kind, records in graphed:
+            start = sent[1][col_id]
+            if len(records) == start:
+                continue
+            # the resolution of graph_data() for the whole output
+            size = MinMaxSummary.bucket_size(len(records), self.GRAPH_POINTS)
+            indices, added = store.downsample(phase, name, self.GRAPH_POINTS,
+                    start=start, size=size)
+            values = added['value']
+            if graph == 'combined' and 'accuracy' in kind.lower():
+                values = values * 100
+            values = values.astype(object)
+            values[np.isnan(added['value'])] = None
+            series[col_id] = zip(indices.tolist(), added['epoch'].tolist(), values.tolist())
+        return {
+                'seq': seq,
+                'counts': counts,
+                'series': series,
+                }
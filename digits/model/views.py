@@ -23,8 +23,11 @@ from digits.webapp import app, scheduler, autodoc
 from digits.utils.routing import request_wants_json
 import images.views
 import images as model_images
+from job import ModelJob
 
 NAMESPACE = '/models/'
+# Most points of each output which models_graph() returns
+MAX_GRAPH_POINTS = 10000
 
 @app.route(NAMESPACE + '<job_id>.json', methods=['GET'])
 @app.route(NAMESPACE + '<job_id>', methods=['GET'])
@@ -49,6 +52,76 @@ def models_show(job_id):
             raise werkzeug.exceptions.BadRequest(
                     'Invalid job type')
 
+@app.route(NAMESPACE + '<job_id>/graph/<graph>.json', methods=['GET'])
+@autodoc(['models', 'api'])
+def models_graph(job_id, graph):
+    """
+    Return the data for a graph of a ModelJob ("combined" or "lr")
+
+    Optional GET parameters:
+        start, end -- only include the points between these epochs
+        points -- the number of points for each output
+
+    Returns JSON:
+        {seq, counts: {series: count}, data: {C3.js data}}
+    """
+    job = scheduler.get_job(job_id)
+    if not isinstance(job, ModelJob):
+        raise werkzeug.exceptions.NotFound('Job not found')
+    if graph not in ('combined', 'lr'):
+        raise werkzeug.exceptions.NotFound('Graph not found')
+
+    args = flask.request.args
+    points = None
+    epochs = None
+    try:
+        if 'points' in args:
+            points = int(args['points'])
+        if 'start' in args or 'end' in args:
+            epochs = tuple(float(args[key]) if key in args else None
+                    for key in ('start', 'end'))
+    except ValueError:
+        raise werkzeug.exceptions.BadRequest('Invalid number')
+    if points is not None and not 2 <= points <= MAX_GRAPH_POINTS:
+        raise werkzeug.exceptions.BadRequest('points must be between 2 and %d' % MAX_GRAPH_POINTS)
+
+    return flask.jsonify(job.train_task().graph_state(graph, points=points, epochs=epochs))
+
+@app.route(NAMESPACE + '<job_id>/gpu_history.json', methods=['GET'])
+@autodoc(['models', 'api'])
+def models_gpu_history(job_id):
+    """
+    Return the GPU utilization, memory used and temperature sampled while
+    a ModelJob was training
+
+    Optional GET parameters:
+        points -- the number of points for each GPU
+
+    Returns JSON:
+        {start, interval, gpus: [{index, name, memory_total}], data: {C3.js data}}
+    """
+    job = scheduler.get_job(job_id)
+    if not isinstance(job, ModelJob):
+        raise werkzeug.exceptions.NotFound('Job not found')
+
+    points = None
+    if 'points' in flask.request.args:
+        try:
+            points = int(flask.request.args['points'])
+        except ValueError:
+            raise werkzeug.exceptions.BadRequest('Invalid number')
+        if not 2 <= points <= MAX_GRAPH_POINTS:
+            raise werkzeug.exceptions.BadRequest('points must be between 2 and %d' % MAX_GRAPH_POINTS)
+
+    task = job.train_task()
+    history = task.gpu_history()
+    return flask.jsonify({
+        'start': history.start,
+        'interval': history.interval,
+        'gpus': history.gpus(),
+        'data': task.gpu_history_data(points=points),
+        })
+
 @app.route(NAMESPACE + 'customize', methods=['POST'])
 @autodoc('models')
 def models_customize():
@@ -0,0 +1,226 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import ctypes
+import ctypes.util
+import platform
+
+# ioprio_set() isn't wrapped by libc, so it's called by number
+IOPRIO_SET_SYSCALLS = {
+        'x86_64': 251,
+        'i386': 289,
+        'i686': 289,
+        'aarch64': 30,
+        'armv7l': 314,
+        'ppc64le': 273,
+        }
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IONICE_CLASSES = {
+        'realtime': 1,
+        'best-effort': 2,
+        'idle': 3,
+        }
+# bits in the cpu_set_t passed to sched_setaffinity()
+CPU_SETSIZE = 1024
+
+_libc = None
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return _libc
+
+def parse_cpus(value):
+    """
+    Returns a sorted list of CPU numbers
+
+    Arguments:
+    value -- a list like "0,2-3" (the format of taskset --cpu-list)
+    """
+    cpus = set()
+    for word in value.split(','):
+        word = word.strip()
+        if not word:
+            continue
+        if '-' in word:
+            first, last = [int(x) for x in word.split('-', 1)]
+            if first > last:
+                raise ValueError('invalid CPU range "%s"' % word)
+            cpus.update(xrange(first, last + 1))
+        else:
+            cpus.add(int(word))
+    if not cpus:
+        raise ValueError('no CPUs in "%s"' % value)
+    if min(cpus) < 0 or max(cpus) >= CPU_SETSIZE:
+        raise ValueError('invalid CPU in "%s"' % value)
+    return sorted(cpus)
+
+
+class ProcessPriority(object):
+    """
+    How the process of a Task is scheduled: its niceness, IO priority and
+    the CPUs it can run on
+
+    Applied in the child between fork() and exec(), so the server itself is
+        unaffected
+    """
+
+    def __init__(self, nice=None, ionice_class=None, ionice_level=None, cpus=None):
+        """
+        Keyword arguments:
+        nice -- added to the niceness of the process (see nice(1))
+        ionice_class -- "realtime", "best-effort" or "idle" (see ionice(1))
+        ionice_level -- 0 (highest) to 7 (lowest) for realtime and best-effort
+        cpus -- a list of the CPUs which the process can run on
+        """
+        if nice is not None and not -20 <= nice <= 19:
+            raise ValueError('nice must be between -20 and 19')
+        if ionice_class is not None and ionice_class not in IONICE_CLASSES:
+            raise ValueError('unknown ionice class "%s"' % ionice_class)
+        if ionice_level is not None:
+            if not 0 <= ionice_level <= 7:
+                raise ValueError('ionice level must be between 0 and 7')
+            if ionice_class is None:
+                ionice_class = 'best-effort'
+        self.nice = nice
+        self.ionice_class = ionice_class
+        self.ionice_level = ionice_level
+        self.cpus = list(cpus) if cpus else None
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Returns a ProcessPriority
+
+        Arguments:
+        value -- a string like "nice=10 ionice=best-effort:7 cpus=2-7"
+        """
+        kwargs = {}
+        for word in value.split():
+            key, sep, setting = word.partition('=')
+            if not sep:
+                raise ValueError('expected key=value, not "%s"' % word)
+            if key == 'nice':
+                kwargs['nice'] = int(setting)
+            elif key == 'ionice':
+                ionice_class, sep, level = setting.partition(':')
+                kwargs['ionice_class'] = ionice_class
+                if sep:
+                    kwargs['ionice_level'] = int(level)
+            elif key == 'cpus':
+                kwargs['cpus'] = parse_cpus(setting)
+            else:
+                raise ValueError('unknown setting "%s"' % key)
+        return cls(**kwargs)
+
+    def __str__(self):
+        words = []
+        if self.nice is not None:
+            words.append('nice=%d' % self.nice)
+        if self.ionice_class is not None:
+            if self.ionice_level is not None:
+                words.append('ionice=%s:%d' % (self.ionice_class, self.ionice_level))
+            else:
+                words.append('ionice=%s' % self.ionice_class)
+        if self.cpus:
+            words.append('cpus=%s' % ','.join(str(cpu) for cpu in self.cpus))
+        return ' '.join(words)
+
+    def __eq__(self, other):
+        return isinstance(other, ProcessPriority) and str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def to_dict(self):
+        return {
+                'nice': self.nice,
+                'ionice_class': self.ionice_class,
+                'ionice_level': self.ionice_level,
+                'cpus': self.cpus,
+                }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def apply(self):
+        """
+        Apply to the current process
+        Returns a list of the settings which couldn't be applied
+        """
+        failed = []
+        if self.nice:
+            try:
+                os.nice(self.nice)
+            except OSError:
+                failed.append('nice')
+        if self.ionice_class is not None and not self.set_ionice():
+            failed.append('ionice')
+        if self.cpus and not self.set_affinity():
+            failed.append('cpus')
+        return failed
+
+    def check(self):
+        """
+        Returns a list of the settings which couldn't be applied
+        They are tried in a child process, so the current one is unaffected
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                os.write(write_fd, ' '.join(self.apply()))
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as infile:
+            failed = infile.read().split()
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            # already reaped (e.g. by gevent)
+            pass
+        return failed
+
+    def set_ionice(self):
+        syscall = IOPRIO_SET_SYSCALLS.get(platform.machine())
+        if syscall is None:
+            return False
+        ioprio = (IONICE_CLASSES[self.ionice_class] << IOPRIO_CLASS_SHIFT) | (self.ionice_level or 0)
+        try:
+            return libc().syscall(syscall, IOPRIO_WHO_PROCESS, 0, ioprio) == 0
+        except (OSError, AttributeError):
+            return False
+
+    def set_affinity(self):
+        bits = ctypes.sizeof(ctypes.c_ulong) * 8
+        mask = (ctypes.c_ulong * (CPU_SETSIZE // bits))()
+        for cpu in self.cpus:
+            mask[cpu // bits] |= 1 << (cpu % bits)
+        try:
+            return libc().sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) == 0
+        except (OSError, AttributeError):
+            return False
+
+
+def parse_priorities(value):
+    """
+    Returns a dict of {task type: ProcessPriority}
+
+    Arguments:
+    value -- a string like "create_db: nice=10 ionice=idle; train: cpus=0-1"
+    """
+    priorities = {}
+    for entry in value.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        task_type, sep, settings = entry.partition(':')
+        if not sep or not task_type.strip():
+            raise ValueError('expected "<task type>: <settings>", not "%s"' % entry)
+        priorities[task_type.strip()] = ProcessPriority.parse(settings)
+    return priorities
@@ -0,0 +1,126 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+from collections import OrderedDict
+
+class RoomTracker(object):
+    """
+    Keeps track of the clients in each SocketIO room, so that the messages
+    for a room are only built while somebody is listening
+
+    The last message of each kind is kept for each room (or the function
+        which builds it, if nobody was listening) and sent to the clients
+        which join later
+    """
+
+    # The last messages are kept for this many rooms
+    MAX_ROOMS = 100
+
+    def __init__(self):
+        # room -> set of client ids
+        self._clients = {}
+        # room -> OrderedDict of key -> (event, message or function)
+        self._last = OrderedDict()
+
+    def join(self, room, client):
+        """
+        A client joined a room
+
+        Arguments:
+        room -- the room (a job id)
+        client -- an id for the client
+        """
+        self._clients.setdefault(room, set()).add(client)
+
+    def leave(self, room, client):
+        """
+        A client left a room
+        """
+        clients = self._clients.get(room)
+        if clients is None:
+            return
+        clients.discard(client)
+        if not clients:
+            del self._clients[room]
+
+    def leave_all(self, client):
+        """
+        A client disconnected
+        """
+        for room in self._clients.keys():
+            self.leave(room, client)
+
+    def listeners(self, room):
+        """
+        Returns the number of clients in a room
+        """
+        return len(self._clients.get(room, ()))
+
+    def emit(self, event, build, room, key=None, namespace='/jobs'):
+        """
+        Send a message to a room if anybody is listening
+        Returns True if it was sent
+
+        Arguments:
+        event -- the SocketIO event (e.g. "task update")
+        build -- a function which returns the message (or None to send nothing)
+        room -- the room (a job id)
+
+        Keyword arguments:
+        key -- if set, the message is kept for clients which join later
+            (until another one with the same key replaces it)
+        namespace -- the SocketIO namespace
+        """
+        from digits.webapp import socketio
+
+        if not self.listeners(room):
+            if key is not None:
+                self.remember(room, key, event, build)
+            return False
+        message = build()
+        if message is None:
+            return False
+        if key is not None:
+            self.remember(room, key, event, message)
+        socketio.emit(event, message, namespace=namespace, room=room)
+        return True
+
+    def remember(self, room, key, event, message):
+        """
+        Keep the last message with a key for a room
+
+        Arguments:
+        message -- the message, or a function which returns it
+        """
+        last = self._last.pop(room, None)
+        if last is None:
+            last = OrderedDict()
+            while len(self._last) >= self.MAX_ROOMS:
+                self._last.popitem(last=False)
+        # the room was used most recently
+        self._last[room] = last
+        last.pop(key, None)
+        last[key] = (event, message)
+
+    def snapshot(self, room):
+        """
+        Returns a list of (event, message) for the last messages sent to a
+        room (in the order they were sent), building the ones which were
+        skipped
+        """
+        last = self._last.get(room)
+        if not last:
+            return []
+        messages = []
+        for key, (event, message) in last.items():
+            if callable(message):
+                message = message()
+                last[key] = (event, message)
+            if message is not None:
+                messages.append((event, message))
+        return messages
+
+    def forget(self, room):
+        """
+        Drop the last messages for a room (e.g. when the job is deleted)
+        """
+        self._last.pop(room, None)
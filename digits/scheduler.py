@@ -2,20 +2,32 @@
 
 import os
 import time
-import shutil
 import traceback
 import signal
+import collections
+import multiprocessing
 
 import gevent
 import gevent.event
+import gevent.lock
+import gevent.pool
 import gevent.queue
 
 from config import config_value
 from . import utils
+import device_query
 from status import Status
-from job import Job
+from job import Job, JobSummary
+from job_registry import JobRegistry
+from job_catalog import JobCatalog
+import job_archive
+import tool_pool
+import gpu_telemetry
+from process_priority import ProcessPriority
+from trash import Trash
 from dataset import DatasetJob
 from model import ModelJob
+from model.tasks import TrainTask, RetentionPolicy
 from digits.utils import errors
 from log import logger
 
@@ -77,26 +89,246 @@ class Resource(object):
                 return True
         return False
 
+    def resize(self, task, value):
+        """
+        Change how much of this resource a task is using
+        """
+        for a in self.allocations:
+            if id(task) == id(a.task):
+                if self.remaining() + a.value - value < 0:
+                    raise RuntimeError('Resource is already maxed out at %s/%s' % (
+                        self.remaining(),
+                        self.max_value)
+                        )
+                a.value = value
+                return True
+        return False
+
+class GpuResource(Resource):
+    """
+    A GPU which can be shared by tasks which know how much memory they need
+    A value of 1 is the whole GPU, smaller values are a share of its memory
+    """
+
+    def __init__(self, identifier, memory=None):
+        """
+        Arguments:
+        identifier -- the device index
+
+        Keyword arguments:
+        memory -- total memory on the device in bytes (None disables sharing)
+        """
+        super(GpuResource, self).__init__(identifier=identifier, max_value=1)
+        self.memory = memory
+
+    def memory_fraction(self, memory):
+        """
+        Returns the share of this GPU used by a task which needs this much
+        memory (1 if unknown)
+        """
+        if memory is None or not self.memory:
+            return 1
+        return min(1, float(memory) / self.memory)
+
+    def free_memory(self):
+        """
+        Returns the free memory on the device in bytes according to NVML
+        Returns None if unknown
+
+        The last GpuTelemetry sample is used if the GPU is being watched,
+            so NVML is only queried for idle GPUs
+        """
+        info = gpu_telemetry.get_telemetry().latest(self.identifier)
+        if info is None:
+            try:
+                info = device_query.get_nvml_info(self.identifier)
+            except Exception:
+                return None
+        if info is None or 'memory' not in info:
+            return None
+        return info['memory']['free']
+
+    def can_fit(self, memory=None):
+        """
+        Returns True if a task which needs this much memory can use this GPU
+        right now (a task with an unknown footprint needs the whole GPU)
+        """
+        fraction = self.memory_fraction(memory)
+        if self.remaining() < fraction:
+            return False
+        if fraction < 1:
+            # check for memory used outside of the scheduler as well
+            free = self.free_memory()
+            if free is not None and free < memory:
+                return False
+        return True
+
+def gpu_total_memory(identifier):
+    """
+    Returns the total memory of a GPU in bytes or None if unknown
+    """
+    try:
+        return device_query.get_device(identifier).totalGlobalMem
+    except Exception:
+        return None
+
+def host_cpu_count():
+    """
+    Returns the number of CPU cores on this host
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def host_memory():
+    """
+    Returns the amount of physical memory on this host in bytes
+    Returns None if it can't be determined
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def run_in_thread(func, *args):
+    """
+    Call a blocking function in gevent's threadpool and return its result
+    Used for work which would otherwise stall the server (e.g. compression)
+    """
+    return gevent.get_hub().threadpool.apply(func, args)
+
+class Reservation(object):
+    """
+    GPUs set aside for a task which has waited too long for them
+    """
+
+    def __init__(self, task):
+        """
+        Arguments:
+        task -- the task which will use the reserved GPUs
+        """
+        self.task = task
+        # identifiers of the reserved GPUs
+        self.gpus = []
+        # when the reserved GPUs are expected to be free (or inf if unknown)
+        self.start = float('inf')
+
 class Scheduler:
     """
     Coordinates execution of Jobs
     """
 
-    def __init__(self, gpu_list=None, verbose=False):
+    # How many jobs can be loaded from disk at once in load_past_jobs()
+    LOAD_POOL_SIZE = 8
+    # The JobCatalog is stored in this file in the jobs directory
+    CATALOG_FILE = 'jobs.sqlite'
+    # Used when the amount of memory on the host can't be determined
+    DEFAULT_MEMORY = 4 * 2**30
+    # Number of tasks which can do heavy disk IO at the same time
+    DEFAULT_IO_TOKENS = 4
+    # Seconds a multi-GPU task waits before GPUs are reserved for it
+    DEFAULT_RESERVATION_WAIT = 5 * 60
+    # Weight of the newest sample in the runtime estimates
+    RUNTIME_RATE_SMOOTHING = 0.5
+    # Seconds between enforcing the snapshot retention policies
+    SNAPSHOT_GC_INTERVAL = 60
+    # Seconds between looking for stale jobs to archive
+    ARCHIVE_INTERVAL = 60 * 60
+    # Deleted jobs are moved to this directory in the jobs directory
+    TRASH_DIR = '.trash'
+    # Seconds between attempts to empty the trash (if not woken up earlier)
+    REAPER_RETRY_INTERVAL = 5 * 60
+    # Task.TASK_TYPE -> ProcessPriority, used when none are configured
+    # The dataset tools yield the CPU and disk to the webapp and training
+    DEFAULT_PROCESS_PRIORITIES = {
+            'parse_folder': ProcessPriority(nice=10, ionice_class='best-effort', ionice_level=7),
+            'create_db': ProcessPriority(nice=10, ionice_class='best-effort', ionice_level=7),
+            }
+
+    def __init__(self, gpu_list=None, verbose=False,
+            cpu_cores=None, memory=None, io_tokens=None,
+            shortest_job_first=None, reservation_wait=None,
+            snapshot_retention=None, archive_after=None,
+            process_priorities=None):
         """
         Keyword arguments:
         gpu_list -- a comma-separated string which is a list of GPU id's
         verbose -- if True, print more errors
+        cpu_cores -- number of CPU cores which tasks can use (default: the
+            cpu_cores config option, or all of them if it isn't set)
+        memory -- bytes of memory which tasks can use (default: the memory
+            config option, or all of it if it isn't set)
+        io_tokens -- number of disk bandwidth tokens to hand out (default:
+            the io_tokens config option, or DEFAULT_IO_TOKENS if it isn't set)
+        shortest_job_first -- if True, start tasks with less estimated work
+            first (among jobs with the same priority and user share)
+            (default: the shortest_job_first config option)
+        reservation_wait -- seconds a multi-GPU task waits before GPUs
+            are reserved for it as they become free
+        snapshot_retention -- the RetentionPolicy for TrainTasks which
+            don't have their own (default: the snapshot_retention config
+            option, or keep every snapshot if it isn't set)
+        archive_after -- archive the finished jobs which haven't been used
+            for this many seconds (default: the archive_after config
+            option, or never if it isn't set)
+        process_priorities -- a dict of {Task.TASK_TYPE: ProcessPriority}
+            (default: the task_priorities config option, or
+            DEFAULT_PROCESS_PRIORITIES if it isn't set)
         """
-        self.jobs = []
+        self.jobs = JobRegistry(loader=self.load_job, catalog=JobCatalog(
+            os.path.join(config_value('jobs_dir'), self.CATALOG_FILE)))
         self.verbose = verbose
+        if shortest_job_first is None:
+            shortest_job_first = config_value('shortest_job_first')
+        self.shortest_job_first = shortest_job_first
+        if snapshot_retention is None and config_value('snapshot_retention'):
+            snapshot_retention = RetentionPolicy(**config_value('snapshot_retention'))
+        self.snapshot_retention = snapshot_retention
+        if archive_after is None:
+            archive_after = config_value('archive_after')
+        self.archive_after = archive_after
+        if process_priorities is None:
+            process_priorities = config_value('task_priorities')
+        if process_priorities is None:
+            process_priorities = self.DEFAULT_PROCESS_PRIORITIES
+        self.process_priorities = process_priorities
+        # the child processes can't report what they failed to apply
+        for task_type, priority in sorted(process_priorities.iteritems()):
+            failed = priority.check()
+            if failed:
+                logger.warning('Can\'t apply %s to %s tasks (%s not permitted or unavailable)'
+                        % (priority, task_type, ', '.join(failed)))
+        # job_id -> lock held while the job is archived or restored
+        self._archive_locks = collections.defaultdict(gevent.lock.Semaphore)
+        self.trash = Trash(os.path.join(config_value('jobs_dir'), self.TRASH_DIR))
+        # set when something is moved into the trash
+        self.trash_event = gevent.event.Event()
+        if reservation_wait is None:
+            reservation_wait = self.DEFAULT_RESERVATION_WAIT
+        self.reservation_wait = reservation_wait
+        # the current Reservation (only one at a time)
+        self.reservation = None
+        # Task class -> seconds per unit of Task.estimated_work()
+        self.runtime_rates = {}
+        # Task.gpu_memory_key() -> GPU memory measured for a previous task
+        self.gpu_footprints = {}
+        # ids of running tasks whose GPU footprint has been applied
+        self._measured_tasks = set()
+
+        if cpu_cores is None:
+            cpu_cores = config_value('cpu_cores') or host_cpu_count()
+        if memory is None:
+            memory = config_value('memory') or host_memory() or self.DEFAULT_MEMORY
+        if io_tokens is None:
+            io_tokens = config_value('io_tokens') or self.DEFAULT_IO_TOKENS
 
         # Keeps track of resource usage
         self.resources = {
-                # TODO: break this into CPU cores, memory usage, IO usage, etc.
-                'parse_folder_task_pool': [Resource()],
-                'create_db_task_pool': [Resource(max_value=2)],
-                'gpus': [Resource(identifier=index)
+                'cpus': [Resource(identifier='cpus', max_value=cpu_cores)],
+                'memory': [Resource(identifier='memory', max_value=memory)],
+                'io': [Resource(identifier='io', max_value=io_tokens)],
+                'gpus': [GpuResource(identifier=index, memory=gpu_total_memory(index))
                     for index in gpu_list.split(',')] if gpu_list else [],
                 }
 
@@ -106,65 +338,124 @@ class Scheduler:
     def load_past_jobs(self):
         """
         Look in the jobs directory and load all valid jobs
+
+        Only the JobSummaries are read here - the Jobs themselves are loaded
+        the first time they are requested. Jobs which need to be loaded now
+        (no summary, or they were running when the server stopped) are
+        loaded with a pool of workers.
         """
         failed = 0
-        loaded_jobs = []
+        summaries = []
+        archived = []
+        to_load = []
         for dir_name in sorted(os.listdir(config_value('jobs_dir'))):
-            if os.path.isdir(os.path.join(config_value('jobs_dir'), dir_name)):
-                exists = False
-
+            path = os.path.join(config_value('jobs_dir'), dir_name)
+            if os.path.isdir(path) and dir_name != self.TRASH_DIR:
                 # Make sure it hasn't already been loaded
-                for job in self.jobs:
-                    if job.id() == dir_name:
-                        exists = True
-                        break
-
-                if not exists:
-                    try:
-                        job = Job.load(dir_name)
-                        # The server might have crashed
-                        if job.status.is_running():
-                            job.status = Status.ABORT
-                        for task in job.tasks:
-                            if task.status.is_running():
-                                task.status = Status.ABORT
-
-                        # We might have changed some attributes here or in __setstate__
-                        job.save()
-                        loaded_jobs.append(job)
-                    except Exception as e:
+                if dir_name in self.jobs or self.jobs.is_archived(dir_name):
+                    continue
+                if job_archive.is_archived(path):
+                    # only the summary is left outside of the archive
+                    summary = JobSummary.load(dir_name)
+                    if summary is None:
                         failed += 1
-                        if self.verbose:
-                            if str(e):
-                                print 'Caught %s while loading job "%s":' % (type(e).__name__, dir_name)
-                                print '\t%s' % e
-                            else:
-                                print 'Caught %s while loading job "%s"' % (type(e).__name__, dir_name)
+                        self.print_load_error(dir_name, errors.ArchiveError('Missing summary'))
+                    else:
+                        archived.append(summary)
+                else:
+                    summary = JobSummary.load(dir_name)
+                    if summary is None or summary.status.is_running():
+                        to_load.append(dir_name)
+                    else:
+                        summaries.append(summary)
+
+        pool = gevent.pool.Pool(self.LOAD_POOL_SIZE)
+        for job in pool.imap(self.load_job_from_disk, to_load):
+            if job is None:
+                failed += 1
+            else:
+                # Jobs are listed from their summaries until they are requested
+                summaries.append(JobSummary(job.dir(), job.summary()))
 
-        # add DatasetJobs
-        for job in loaded_jobs:
-            if isinstance(job, DatasetJob):
-                self.jobs.append(job)
+        with self.jobs.batch():
+            # archived jobs are restored when they are requested
+            for summary in archived:
+                self.jobs.add_archived(summary)
 
-        # add ModelJobs
-        for job in loaded_jobs:
-            if isinstance(job, ModelJob):
+            # add DatasetJobs
+            for summary in summaries:
                 try:
-                    # load the DatasetJob
-                    job.load_dataset()
-                    self.jobs.append(job)
+                    if issubclass(summary.job_class(), DatasetJob):
+                        self.jobs.add(summary)
                 except Exception as e:
                     failed += 1
-                    if self.verbose:
-                        if str(e):
-                            print 'Caught %s while loading job "%s":' % (type(e).__name__, job.id())
-                            print '\t%s' % e
-                        else:
-                            print 'Caught %s while loading job "%s"' % (type(e).__name__, job.id())
+                    self.print_load_error(summary.id(), e)
+
+            # add ModelJobs
+            for summary in summaries:
+                try:
+                    if issubclass(summary.job_class(), ModelJob):
+                        # make sure the DatasetJob exists
+                        assert summary.dataset_id in self.jobs \
+                                or self.jobs.is_archived(summary.dataset_id), 'Cannot find dataset'
+                        self.jobs.add(summary)
+                except Exception as e:
+                    failed += 1
+                    self.print_load_error(summary.id(), e)
+
+            # forget the jobs which are gone
+            self.jobs.prune_catalog()
 
         if failed > 0 and self.verbose:
             print 'WARNING:', failed, 'jobs failed to load.'
 
+    def load_job_from_disk(self, job_id):
+        """
+        Load a Job from its save file
+        Returns None if the Job fails to load
+        """
+        try:
+            job = Job.load(job_id)
+            # The server might have crashed
+            if job.status.is_running():
+                job.status = Status.ABORT
+            for task in job.tasks:
+                if task.status.is_running():
+                    task.status = Status.ABORT
+
+            # We might have changed some attributes here or in __setstate__
+            job.save()
+            return job
+        except Exception as e:
+            self.print_load_error(job_id, e)
+            return None
+
+    def load_job(self, summary):
+        """
+        Called by self.jobs the first time a Job is requested
+        Returns the Job or None if it fails to load
+        """
+        job = self.load_job_from_disk(summary.id())
+        if isinstance(job, ModelJob):
+            try:
+                # load the DatasetJob
+                job.load_dataset()
+            except Exception as e:
+                self.print_load_error(job.id(), e)
+                return None
+        return job
+
+    def print_load_error(self, job_id, e):
+        """
+        Print information about an error which occurred while loading a job
+        """
+        if self.verbose:
+            if str(e):
+                print 'Caught %s while loading job "%s":' % (type(e).__name__, job_id)
+                print '\t%s' % e
+            else:
+                print 'Caught %s while loading job "%s"' % (type(e).__name__, job_id)
+
     def add_job(self, job):
         """
         Add a job to self.jobs
@@ -173,7 +464,7 @@ class Scheduler:
             logger.error('Scheduler not running. Cannot add job.')
             return False
         else:
-            self.jobs.append(job)
+            self.jobs.add(job)
             if 'DIGITS_MODE_TEST' not in os.environ:
                 # Let the scheduler do a little work before returning
                 time.sleep(utils.wait_time())
@@ -181,15 +472,128 @@ class Scheduler:
 
     def get_job(self, job_id):
         """
-        Look through self.jobs to try to find the Job
+        Look up the Job in self.jobs
+        Restores the Job if it was archived
         Returns None if not found
         """
-        if job_id is None:
-            return None
-        for j in self.jobs:
-            if j.id() == job_id:
-                return j
-        return None
+        job = self.jobs.get(job_id)
+        if job is None and self.jobs.is_archived(job_id):
+            job = self.restore_job(job_id)
+        return job
+
+    def archived_jobs(self, cls=None, dataset_id=None):
+        """
+        Returns a list of JobSummaries for the archived jobs (newest first)
+
+        Keyword arguments:
+        cls -- if set, only return jobs of this Job subclass
+        dataset_id -- if set, only return the ModelJobs which use this dataset
+        """
+        summaries = []
+        for row in self.jobs.catalog.query(archived=True, dataset_id=dataset_id):
+            summary = JobSummary.load(row['id'])
+            if summary is None:
+                continue
+            if cls is None or issubclass(summary.job_class(), cls):
+                summaries.append(summary)
+        return summaries
+
+    def archive_job(self, job):
+        """
+        Compress the directory of a finished Job and unload it
+        The Job is restored by get_job() when it is next requested
+        Raises an ArchiveError if the Job can't be archived
+        """
+        if isinstance(job, Job):
+            job_id = job.id()
+        else:
+            job_id = str(job)
+
+        with self._archive_locks[job_id]:
+            job = self.jobs.peek(job_id)
+            if job is None:
+                raise errors.ArchiveError('Job "%s" not found' % job_id)
+            if job.status.is_running():
+                raise errors.ArchiveError('Cannot archive "%s" while it is running' % job.name())
+            dependent_jobs = self.jobs.models_for_dataset(job_id)
+            if dependent_jobs:
+                raise errors.ArchiveError('Cannot archive "%s" because %d model%s depend%s on it' % (
+                    job.name(),
+                    len(dependent_jobs),
+                    ('s' if len(dependent_jobs) != 1 else ''),
+                    ('s' if len(dependent_jobs) == 1 else '')))
+            if not isinstance(job, JobSummary):
+                # make sure that the summary (which isn't archived) is current
+                if not job.save():
+                    raise errors.ArchiveError('Failed to save "%s"' % job.name())
+
+            self.jobs.archive(job_id)
+            try:
+                size = run_in_thread(job_archive.archive, job.dir())
+            except Exception as e:
+                if not job_archive.is_archived(job.dir()):
+                    self.jobs.add(job)
+                    raise errors.ArchiveError('Failed to archive "%s": %s' % (job.name(), e))
+                # only some of the original files are left
+                logger.error('Caught %s after archiving job: %s' % (type(e).__name__, e),
+                        job_id=job_id)
+            else:
+                logger.info('Job archived (%s).' % utils.sizeof_fmt(size), job_id=job_id)
+        return True
+
+    def restore_job(self, job_id):
+        """
+        Extract an archived Job and add it back to self.jobs
+        Returns the Job or None if it fails to restore
+        """
+        with self._archive_locks[job_id]:
+            if not self.jobs.is_archived(job_id):
+                # restored or deleted while waiting for the lock
+                return self.jobs.get(job_id)
+            try:
+                run_in_thread(job_archive.restore,
+                        os.path.join(config_value('jobs_dir'), job_id))
+            except Exception as e:
+                logger.error('Caught %s while restoring job: %s' % (type(e).__name__, e),
+                        job_id=job_id)
+                return None
+            summary = JobSummary.load(job_id)
+            if summary is None:
+                job = self.load_job_from_disk(job_id)
+                if job is None:
+                    return None
+                summary = JobSummary(job.dir(), job.summary())
+            self.jobs.add(summary)
+            logger.info('Job restored.', job_id=job_id)
+        # loads the Job (and restores its dataset if needed)
+        return self.jobs.get(job_id)
+
+    def archive_stale_jobs(self, max_age=None):
+        """
+        Archive the finished jobs which haven't been used for max_age seconds
+        Returns the number of jobs archived
+
+        Keyword arguments:
+        max_age -- defaults to self.archive_after
+        """
+        if max_age is None:
+            max_age = self.archive_after
+        cutoff = time.time() - max_age
+        archived = 0
+        # archive the models first so that their datasets become stale too
+        for cls in [ModelJob, DatasetJob]:
+            for job in self.jobs.jobs(cls, running=False):
+                last_used = max(
+                        job.status_history[-1][1] if job.status_history else 0,
+                        self.jobs.last_access(job.id()) or 0)
+                if last_used > cutoff or self.jobs.models_for_dataset(job.id()):
+                    continue
+                try:
+                    self.archive_job(job.id())
+                    archived += 1
+                except errors.ArchiveError as e:
+                    logger.error(str(e), job_id=job.id())
+        return archived
 
     def abort_job(self, job_id):
         """
@@ -203,10 +607,33 @@ class Scheduler:
         job.abort()
         return True
 
+    def peek_job(self, job_id):
+        """
+        Returns the Job, a JobSummary (for jobs which haven't been loaded or
+        are archived) or None if not found
+        Never loads or restores anything
+        """
+        job = self.jobs.peek(job_id)
+        if job is None and self.jobs.is_archived(job_id):
+            job = JobSummary.load(job_id)
+        return job
+
+    @staticmethod
+    def is_dataset(job):
+        """
+        Returns True if job is a DatasetJob or the JobSummary of one
+        """
+        if isinstance(job, JobSummary):
+            return issubclass(job.job_class(), DatasetJob)
+        return isinstance(job, DatasetJob)
+
     def delete_job(self, job):
         """
         Deletes an entire job folder from disk
         Returns True if the Job was found and deleted
+
+        The folder is moved into the trash and its files are removed later
+            by the reaper_thread
         """
         if isinstance(job, str) or isinstance(job, unicode):
             job_id = str(job)
@@ -214,16 +641,16 @@ class Scheduler:
             job_id = job.id()
         else:
             raise ValueError('called delete_job with a %s' % type(job))
-        dependent_jobs = []
-        # try to find the job
-        for i, job in enumerate(self.jobs):
-            if job.id() == job_id:
-                if isinstance(job, DatasetJob):
-                    # check for dependencies
-                    for j in self.jobs:
-                        if isinstance(j, ModelJob) and j.dataset_id == job.id():
-                            logger.error('Cannot delete "%s" (%s) because "%s" (%s) depends on it.' % (job.name(), job.id(), j.name(), j.id()))
-                            dependent_jobs.append(j.name())
+        # try to find the job (without loading it)
+        job = self.peek_job(job_id)
+        if job is not None:
+            if self.is_dataset(job):
+                # check for dependencies
+                dependent_jobs = []
+                for j in self.jobs.models_for_dataset(job_id) + \
+                        self.archived_jobs(ModelJob, dataset_id=job_id):
+                    logger.error('Cannot delete "%s" (%s) because "%s" (%s) depends on it.' % (job.name(), job.id(), j.name(), j.id()))
+                    dependent_jobs.append(j.name())
                 if len(dependent_jobs)>0:
                     error_message = 'Cannot delete "%s" because %d model%s depend%s on it: %s' % (
                             job.name(),
@@ -232,49 +659,87 @@ class Scheduler:
                             ('s' if len(dependent_jobs) == 1 else ''),
                             ', '.join(['"%s"' % j for j in dependent_jobs]))
                     raise errors.DeleteError(error_message)
-                self.jobs.pop(i)
+            self.jobs.remove(job_id)
+            if not isinstance(job, JobSummary):
                 job.abort()
-                if os.path.exists(job.dir()):
-                    shutil.rmtree(job.dir())
-                logger.info('Job deleted.', job_id=job_id)
-                return True
+            if os.path.exists(job.dir()):
+                self.move_to_trash(job.dir())
+            logger.info('Job deleted.', job_id=job_id)
+            return True
 
         # see if the folder exists on disk
         path = os.path.join(config_value('jobs_dir'), job_id)
         path = os.path.normpath(path)
-        if os.path.dirname(path) == config_value('jobs_dir') and os.path.exists(path):
-            shutil.rmtree(path)
+        if os.path.dirname(path) == config_value('jobs_dir') and os.path.exists(path) \
+                and job_id != self.TRASH_DIR:
+            # e.g. an archived job without a summary
+            self.jobs.remove(job_id)
+            self.move_to_trash(path)
             return True
 
         return False
 
+    def delete_jobs(self, job_ids):
+        """
+        Deletes several jobs at once
+        Models are deleted before datasets, so that a dataset can be deleted
+            along with the models which depend on it
+        Returns a dict of job_id -> None if deleted or an error message
+        """
+        def models_first(job_id):
+            job = self.peek_job(job_id)
+            try:
+                return job is not None and self.is_dataset(job)
+            except Exception:
+                return False
+
+        results = {}
+        with self.jobs.batch():
+            for job_id in sorted(set(job_ids), key=models_first):
+                try:
+                    if self.delete_job(job_id):
+                        results[job_id] = None
+                    else:
+                        results[job_id] = 'Job not found'
+                except errors.DeleteError as e:
+                    results[job_id] = str(e)
+        return results
+
+    def move_to_trash(self, path):
+        """
+        Move a directory into the trash and wake up the reaper_thread
+        """
+        self.trash.put(path)
+        self.trash_event.set()
+
+    def reaper_thread(self):
+        """
+        Removes the files in the trash
+        Runs until the Scheduler is shut down
+        """
+        while not self.shutdown.is_set():
+            self.trash_event.clear()
+            try:
+                self.trash.empty(stop=self.shutdown.is_set)
+            except Exception as e:
+                logger.error('Caught %s while emptying the trash: %s' % (type(e).__name__, e))
+            self.trash_event.wait(self.REAPER_RETRY_INTERVAL)
+
     def running_dataset_jobs(self):
         """a query utility"""
-        return sorted(
-                [j for j in self.jobs if isinstance(j, DatasetJob) and j.status.is_running()],
-                cmp=lambda x,y: cmp(y.id(), x.id())
-                )
+        return self.jobs.jobs(DatasetJob, running=True)
 
     def completed_dataset_jobs(self):
         """a query utility"""
-        return sorted(
-                [j for j in self.jobs if isinstance(j, DatasetJob) and not j.status.is_running()],
-                cmp=lambda x,y: cmp(y.id(), x.id())
-                )
+        return self.jobs.jobs(DatasetJob, running=False)
 
     def running_model_jobs(self):
         """a query utility"""
-        return sorted(
-                [j for j in self.jobs if isinstance(j, ModelJob) and j.status.is_running()],
-                cmp=lambda x,y: cmp(y.id(), x.id())
-                )
+        return self.jobs.jobs(ModelJob, running=True)
 
-    def running_model_jobs(self):
+    def completed_model_jobs(self):
         """a query utility"""
-        return sorted(
-                [j for j in self.jobs if isinstance(j, ModelJob) and not j.status.is_running()],
-                cmp=lambda x,y: cmp(y.id(), x.id())
-                )
+        return self.jobs.jobs(ModelJob, running=False)
 
     def start(self):
         """
@@ -285,6 +750,10 @@ class Scheduler:
             return True
 
         gevent.spawn(self.main_thread)
+        gevent.spawn(self.snapshot_gc_thread)
+        gevent.spawn(self.reaper_thread)
+        if self.archive_after:
+            gevent.spawn(self.archive_thread)
 
         self.running = True
         return True
@@ -295,14 +764,99 @@ class Scheduler:
         Returns True if the shutdown was graceful
         """
         self.shutdown.set()
+        # wake up the reaper_thread
+        self.trash_event.set()
         wait_limit = 5
         start = time.time()
         while self.running:
             if time.time() - start > wait_limit:
                 return False
             time.sleep(0.1)
+        tool_pool.stop_pool()
+        gpu_telemetry.stop_telemetry()
+        self.jobs.catalog.close()
         return True
 
+    def snapshot_gc_thread(self):
+        """
+        Deletes the snapshots which the retention policies don't keep
+        Runs until the Scheduler is shut down
+        """
+        while not self.shutdown.wait(self.SNAPSHOT_GC_INTERVAL):
+            self.collect_snapshots()
+
+    def archive_thread(self):
+        """
+        Archives the stale jobs
+        Runs until the Scheduler is shut down
+        """
+        while not self.shutdown.wait(self.ARCHIVE_INTERVAL):
+            self.archive_stale_jobs()
+
+    def collect_snapshots(self):
+        """
+        Enforce the retention policies of the loaded TrainTasks, and the
+        default policy on the finished ModelJobs which it hasn't been
+        enforced on yet (which are unloaded again afterwards)
+        Snapshots which other ModelJobs were initialized from are kept
+        Returns the number of snapshots deleted
+        """
+        catalog = self.jobs.catalog
+        referenced = catalog.pretrained_models()
+        deleted = 0
+        for job in self.jobs.loaded_jobs():
+            deleted += self.enforce_retention(job, referenced)
+            # let other greenlets run
+            gevent.sleep(0)
+
+        policy = self.snapshot_retention
+        if policy is None or policy.is_empty():
+            return deleted
+        for job_id in catalog.retention_pending(repr(policy)):
+            job = self.jobs.peek(job_id)
+            if job is None:
+                continue
+            if not isinstance(job, JobSummary):
+                # enforced above
+                catalog.set_retention(job_id, repr(policy))
+                continue
+            dataset_loaded = not isinstance(self.jobs.peek(job.dataset_id), JobSummary)
+            job = self.jobs.get(job_id, access=False)
+            if job is None:
+                continue
+            deleted += self.enforce_retention(job, referenced)
+            catalog.set_retention(job_id, repr(policy))
+            if job.is_dirty():
+                job.save()
+            self.jobs.unload(job_id)
+            if not dataset_loaded:
+                self.jobs.unload(job.dataset_id)
+            gevent.sleep(0)
+        return deleted
+
+    def enforce_retention(self, job, referenced):
+        """
+        Enforce the retention policies of the TrainTasks of a Job
+        Returns the number of snapshots deleted
+
+        Arguments:
+        job -- a Job
+        referenced -- a set of snapshots which are never deleted
+        """
+        if not isinstance(job, ModelJob):
+            return 0
+        deleted = 0
+        for task in job.tasks:
+            if isinstance(task, TrainTask):
+                try:
+                    deleted += len(task.enforce_retention(self.snapshot_retention, referenced))
+                except Exception as e:
+                    logger.error('Caught %s while deleting snapshots: %s' % (type(e).__name__, e),
+                            job_id=job.id())
+        if deleted:
+            job.disk_usage(refresh=True)
+        return deleted
+
     def main_thread(self):
         """
         Monitors the jobs in current_jobs, updates their statuses,
@@ -312,8 +866,10 @@ class Scheduler:
         try:
             last_saved = None
             while not self.shutdown.is_set():
-                # Iterate backwards so we can delete jobs
-                for job in reversed(self.jobs):
+                # Tasks which are ready to start, as (job, task)
+                queued = []
+                # Only running jobs need attention
+                for job in self.jobs.jobs(running=True):
                     if job.status == Status.INIT:
                         def start_this_job(job):
                             if isinstance(job, ModelJob):
@@ -345,17 +901,9 @@ class Scheduler:
                         for task in job.tasks:
                             if task.status in [Status.INIT, Status.WAIT]:
                                 alldone = False
-                                # try to start the task
+                                # try to start the task (below)
                                 if task.ready_to_queue():
-                                    requested_resources = task.offer_resources(self.resources)
-                                    if requested_resources is None:
-                                        task.status = Status.WAIT
-                                    else:
-                                        if self.reserve_resources(task, requested_resources):
-                                            logger.debug('%s task started.' % task.name(),
-                                                    job_id=job.id())
-                                            gevent.spawn(self.run_task,
-                                                    task, requested_resources)
+                                    queued.append((job, task))
                             elif task.status == Status.RUN:
                                 # job is not done
                                 alldone = False
@@ -374,10 +922,13 @@ class Scheduler:
                             logger.info('Job complete.', job_id=job.id())
                             job.save()
 
-                # save running jobs every 15 seconds
+                self.update_gpu_footprints()
+                self.start_queued_tasks(queued)
+
+                # save jobs which have changed every 15 seconds
                 if not last_saved or time.time()-last_saved > 15:
-                    for job in self.jobs:
-                        if job.status.is_running():
+                    for job in self.jobs.loaded_jobs():
+                        if job.is_dirty():
                             job.save()
                     last_saved = time.time()
 
@@ -386,11 +937,250 @@ class Scheduler:
             pass
 
         # Shutdown
-        for job in self.jobs:
+        for job in self.jobs.loaded_jobs():
             job.abort()
-            job.save()
+            if job.is_dirty():
+                job.save()
         self.running = False
 
+    def start_queued_tasks(self, queued):
+        """
+        Offer resources to the tasks which are ready to start
+        Tasks are considered in order of job priority, then by how much
+        the job's user is already using (fair share), then (optionally)
+        by estimated work and finally in the order they were created
+
+        Arguments:
+        queued -- a list of (job, task) tuples
+        """
+        usage = self.usage_by_user()
+        key = lambda jt: self.queue_key(jt[0], jt[1], usage)
+        queued = sorted(queued, key=key)
+        reservation = self.update_reservation(queued)
+        # popped from the end
+        queued.reverse()
+        while queued:
+            job, task = queued.pop()
+            self.apply_gpu_footprint(task)
+            resources = self.resources
+            if reservation is not None and task is not reservation.task \
+                    and not self.can_backfill(task, reservation):
+                # hide the reserved GPUs
+                resources = dict(self.resources)
+                resources['gpus'] = [gpu for gpu in self.resources['gpus']
+                        if gpu.identifier not in reservation.gpus]
+            requested_resources = task.offer_resources(resources)
+            if requested_resources is None:
+                task.status = Status.WAIT
+            elif self.reserve_resources(task, requested_resources):
+                logger.debug('%s task started.' % task.name(), job_id=job.id())
+                gevent.spawn(self.run_task, task, requested_resources)
+                usage[job.username] = usage.get(job.username, 0) + \
+                        self.resource_share(requested_resources)
+                # their other tasks may have to wait behind other users
+                queued.sort(key=key, reverse=True)
+
+    def apply_gpu_footprint(self, task):
+        """
+        If an identical task has run before, assume that this one needs
+        the same amount of GPU memory so that it can share a GPU
+        """
+        key = task.gpu_memory_key()
+        if key is not None and task.gpu_memory is None:
+            task.gpu_memory = self.gpu_footprints.get(key, None)
+
+    def update_gpu_footprints(self):
+        """
+        Once a running task has reported its GPU memory footprint, shrink
+        its GPU allocations so that other tasks can share those GPUs
+        """
+        for job in self.jobs.jobs(running=True):
+            for task in job.tasks:
+                if task.status != Status.RUN or id(task) in self._measured_tasks:
+                    continue
+                key = task.gpu_memory_key()
+                if key is None or task.gpu_memory is None:
+                    continue
+                self._measured_tasks.add(id(task))
+                self.gpu_footprints[key] = task.gpu_memory
+
+                resources = getattr(task, 'current_resources', None)
+                if not resources or 'gpus' not in resources:
+                    continue
+                gpus = []
+                for identifier, value in resources['gpus']:
+                    for gpu in self.resources['gpus']:
+                        if gpu.identifier == identifier:
+                            fraction = gpu.memory_fraction(task.gpu_memory)
+                            if fraction < value and gpu.resize(task, fraction):
+                                value = fraction
+                            break
+                    gpus.append((identifier, value))
+                resources['gpus'] = gpus
+
+    def update_reservation(self, queued):
+        """
+        Reserve GPUs for the first task (in queue order) which needs more
+        than one GPU and has been waiting for longer than reservation_wait
+        Returns the current Reservation or None
+
+        Arguments:
+        queued -- a list of (job, task) tuples in queue order
+        """
+        tasks = [task for job, task in queued]
+        if self.reservation is not None and \
+                not any(task is self.reservation.task for task in tasks):
+            # started, aborted or deleted
+            self.reservation = None
+
+        if self.reservation is None:
+            now = time.time()
+            for job, task in queued:
+                needed = task.gpus_needed()
+                if needed > 1 and needed <= len(self.resources['gpus']) \
+                        and task.status == Status.WAIT \
+                        and now - task.status_history[-1][1] > self.reservation_wait:
+                    self.reservation = Reservation(task)
+                    logger.info('Reserving %d GPUs for %s task.' % (needed, task.name()),
+                            job_id=job.id())
+                    break
+            else:
+                return None
+
+        # GPUs become free at different times, so update the plan each time
+        task = self.reservation.task
+        free_at = self.gpu_free_times()
+        selected = getattr(task, 'selected_gpus', None)
+        if selected:
+            gpus = [i for i in selected if i in free_at]
+        else:
+            gpus = sorted(free_at, key=lambda i: free_at[i])[:task.gpus_needed()]
+        self.reservation.gpus = gpus
+        self.reservation.start = max(free_at[i] for i in gpus) if gpus else float('inf')
+        return self.reservation
+
+    def can_backfill(self, task, reservation):
+        """
+        Returns True if the task is expected to finish before the
+        reservation starts, so it can use the reserved GPUs meanwhile
+        """
+        runtime = self.estimated_runtime(task)
+        if runtime is None:
+            return False
+        return time.time() + runtime <= reservation.start
+
+    def gpu_free_times(self):
+        """
+        Returns a dict mapping GPU identifiers to the time at which they
+        are expected to be free (inf if unknown)
+        """
+        now = time.time()
+        free_at = {}
+        for gpu in self.resources['gpus']:
+            t = now
+            for allocation in gpu.allocations:
+                t = max(t, now + self.estimated_time_left(allocation.task))
+            free_at[gpu.identifier] = t
+        return free_at
+
+    def estimated_runtime(self, task):
+        """
+        Returns the estimated runtime of a task in seconds, based on the
+        runtimes of other tasks of the same type
+        Returns None if unknown
+        """
+        work = task.estimated_work()
+        rate = self.runtime_rates.get(type(task), None)
+        if work is None or rate is None:
+            return None
+        return work * rate
+
+    def estimated_time_left(self, task):
+        """
+        Returns the estimated time in seconds until a running task is done
+        Returns inf if unknown
+        """
+        left = task.est_done()
+        if left is not None:
+            return left
+        runtime = self.estimated_runtime(task)
+        if runtime is not None and task.status == Status.RUN:
+            return max(0, runtime - (time.time() - task.status_history[-1][1]))
+        return float('inf')
+
+    def record_runtime(self, task):
+        """
+        Update the runtime estimates with a task which has finished
+        """
+        work = task.estimated_work()
+        if task.status != Status.DONE or not work:
+            return
+        started = None
+        for status, timestamp in task.status_history:
+            if status == Status.RUN:
+                started = timestamp
+        if started is None:
+            return
+        rate = (task.status_history[-1][1] - started) / float(work)
+        old_rate = self.runtime_rates.get(type(task), None)
+        if old_rate is not None:
+            rate = self.RUNTIME_RATE_SMOOTHING * rate + \
+                    (1 - self.RUNTIME_RATE_SMOOTHING) * old_rate
+        self.runtime_rates[type(task)] = rate
+
+    def queue_key(self, job, task, usage):
+        """
+        Returns the sort key used by start_queued_tasks()
+
+        NOTE: the username is whatever was typed in the job's form (DIGITS
+        doesn't authenticate its users), so fair share only works between
+        users who don't share a name or claim someone else's
+
+        Arguments:
+        job -- the Job
+        task -- a Task from that job
+        usage -- a dict returned by usage_by_user()
+        """
+        if self.shortest_job_first:
+            work = task.estimated_work()
+            if work is None:
+                # unknown jobs go after the ones we can estimate
+                work = float('inf')
+        else:
+            work = 0
+        return (
+                -job.priority,
+                usage.get(job.username, 0),
+                work,
+                JobRegistry._sort_key(job),
+                job.tasks.index(task),
+                )
+
+    def usage_by_user(self):
+        """
+        Returns a dict mapping username to the share of resources used by
+        their running tasks (jobs without a username share None)
+        """
+        usage = {}
+        for job in self.jobs.jobs(running=True):
+            for task in job.tasks:
+                resources = getattr(task, 'current_resources', None)
+                if task.status == Status.RUN and resources:
+                    usage[job.username] = usage.get(job.username, 0) + \
+                            self.resource_share(resources)
+        return usage
+
+    @staticmethod
+    def resource_share(resources):
+        """
+        Returns how much of the scheduler's capacity a task is using
+        GPUs are the scarce resource, but every task counts for at least one
+
+        Arguments:
+        resources -- the resources reserved for a task
+        """
+        return max(1, len(resources.get('gpus', [])))
+
     def sigterm_handler(self, signal, frame):
         """
         Gunicorn shuts down workers with SIGTERM, not SIGKILL
@@ -441,6 +1231,7 @@ class Scheduler:
                     if resource.identifier == identifier:
                         resource.deallocate(task)
         task.current_resources = None
+        self._measured_tasks.discard(id(task))
 
     def run_task(self, task, resources):
         """
@@ -452,7 +1243,9 @@ class Scheduler:
             a dict mapping resource_type to lists of (identifier, value) tuples
         """
         try:
+            task.process_priority = self.process_priorities.get(task.TASK_TYPE)
             task.run(resources)
+            self.record_runtime(task)
         except Exception as e:
             self.task_error(task, e)
         finally:
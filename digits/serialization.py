@@ -0,0 +1,331 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+"""
+A compact, versioned replacement for pickling Jobs
+
+The file starts with a header line, followed by a one-line JSON manifest
+    describing the object graph and then a section of binary blobs
+Protocol buffers (e.g. the NetParameter), numpy arrays and binary strings
+    are stored as blobs and referenced from the manifest by (offset, length)
+
+Objects are saved with __getstate__() and restored with __setstate__(), so
+    the per-class PICKLE_VERSION upgrade logic keeps working
+Values of any other type raise a TypeError instead of being pickled, so
+    that nothing in a saved job depends on pickle
+"""
+
+import json
+import types
+import inspect
+import cPickle
+import collections
+
+import numpy as np
+
+# Values which are the same in the manifest
+SCALARS = frozenset([int, long, float, bool, type(None)])
+
+# path -> class for find_class() and find_protobuf()
+_classes = {}
+
+MAGIC = 'DIGITS-STATE'
+# NOTE: Increment this everytime the format changes
+FORMAT_VERSION = 2
+
+class Encoder(object):
+    """
+    Converts an object graph into a JSON-compatible manifest and blobs
+    """
+
+    def __init__(self):
+        self.blobs = []
+        self.size = 0
+        # id(obj) -> (reference number, obj)
+        self.memo = {}
+
+    def blob(self, data):
+        """
+        Stores a binary string and returns a reference to it
+        """
+        ref = [self.size, len(data)]
+        self.blobs.append(data)
+        self.size += len(data)
+        return ref
+
+    def encode(self, value):
+        t = type(value)
+        if value is None or t in (bool, int, long, float):
+            return value
+        elif t is str:
+            try:
+                value.decode('ascii')
+                return value
+            except UnicodeDecodeError:
+                return {'__bytes__': self.blob(value)}
+        elif t is unicode:
+            return {'__unicode__': value}
+        elif t is list:
+            return [self.encode(v) for v in value]
+        elif t is tuple:
+            return {'__tuple__': [self.encode(v) for v in value]}
+        elif isinstance(value, tuple) and hasattr(t, '_fields'):
+            # a namedtuple
+            return {
+                    '__namedtuple__': '%s.%s' % (t.__module__, t.__name__),
+                    'items': [self.encode(v) for v in value],
+                    }
+        elif t in (set, frozenset):
+            return {'__set__': [self.encode(v) for v in value],
+                    '__frozen__': t is frozenset}
+        elif t is dict:
+            if all(is_plain_key(k) for k in value):
+                # references are resolved in the same (sorted) order by Decoder
+                encoded = {}
+                for k in sorted(value):
+                    encoded[k] = self.encode(value[k])
+                return encoded
+            return {'__dict__': [[self.encode(k), self.encode(v)]
+                for k, v in value.iteritems()]}
+        elif t is collections.OrderedDict:
+            return {'__odict__': [[self.encode(k), self.encode(v)]
+                for k, v in value.iteritems()]}
+        elif isinstance(value, np.ndarray) and value.dtype.fields is None \
+                and value.dtype != np.object_:
+            return {
+                    '__ndarray__': self.blob(np.ascontiguousarray(value).tobytes()),
+                    'dtype': value.dtype.str,
+                    'shape': list(value.shape),
+                    }
+        elif isinstance(value, np.generic) and value.dtype.fields is None \
+                and value.dtype != np.object_:
+            return {
+                    '__npscalar__': self.blob(value.tobytes()),
+                    'dtype': value.dtype.str,
+                    }
+        elif is_protobuf(value):
+            return {
+                    '__protobuf__': protobuf_path(value),
+                    'blob': self.blob(value.SerializeToString()),
+                    }
+        elif is_plain_object(value):
+            key = id(value)
+            if key in self.memo:
+                return {'__ref__': self.memo[key][0]}
+            number = len(self.memo)
+            # keep value alive so that its id isn't reused
+            self.memo[key] = (number, value)
+            if hasattr(value, '__getstate__'):
+                state = value.__getstate__()
+            else:
+                state = value.__dict__
+            cls = value.__class__
+            return {
+                    '__object__': '%s.%s' % (cls.__module__, cls.__name__),
+                    'id': number,
+                    'state': self.encode(state),
+                    }
+        else:
+            raise TypeError("Can't serialize %s" % t)
+
+
+class Decoder(object):
+    """
+    Rebuilds an object graph from a manifest and blobs
+    """
+
+    def __init__(self, data, offset):
+        """
+        Arguments:
+        data -- the contents of the file
+        offset -- where the blobs start in data
+        """
+        self.data = data
+        self.offset = offset
+        # reference number -> obj
+        self.memo = {}
+
+    def blob(self, ref):
+        start = self.offset + ref[0]
+        end = start + ref[1]
+        if end > len(self.data):
+            raise ValueError('Truncated file')
+        return self.data[start:end]
+
+    def decode(self, value):
+        t = type(value)
+        if t is unicode:
+            return str(value)
+        elif t is list:
+            # skip the call for scalars (most of the values)
+            return [v if type(v) in SCALARS else self.decode(v) for v in value]
+        elif t is not dict:
+            return value
+
+        if '__object__' in value:
+            cls = find_class(value['__object__'])
+            if isinstance(cls, types.ClassType):
+                obj = types.InstanceType(cls)
+            else:
+                obj = cls.__new__(cls)
+            self.memo[value['id']] = obj
+            state = self.decode(value['state'])
+            if hasattr(obj, '__setstate__'):
+                obj.__setstate__(state)
+            else:
+                obj.__dict__.update(state)
+            return obj
+        elif '__ref__' in value:
+            return self.memo[value['__ref__']]
+        elif '__tuple__' in value:
+            return tuple(self.decode(v) for v in value['__tuple__'])
+        elif '__namedtuple__' in value:
+            cls = find_class(value['__namedtuple__'])
+            return cls(*[self.decode(v) for v in value['items']])
+        elif '__dict__' in value:
+            return dict((self.decode(k), self.decode(v)) for k, v in value['__dict__'])
+        elif '__odict__' in value:
+            return collections.OrderedDict(
+                    (self.decode(k), self.decode(v)) for k, v in value['__odict__'])
+        elif '__unicode__' in value:
+            return value['__unicode__']
+        elif '__bytes__' in value:
+            return self.blob(value['__bytes__'])
+        elif '__set__' in value:
+            items = [self.decode(v) for v in value['__set__']]
+            return frozenset(items) if value['__frozen__'] else set(items)
+        elif '__ndarray__' in value:
+            return np.frombuffer(self.blob(value['__ndarray__']),
+                    dtype=np.dtype(str(value['dtype']))
+                    ).reshape(value['shape']).copy()
+        elif '__npscalar__' in value:
+            return np.frombuffer(self.blob(value['__npscalar__']),
+                    dtype=np.dtype(str(value['dtype'])))[0]
+        elif '__protobuf__' in value:
+            message = find_protobuf(value['__protobuf__'])()
+            message.ParseFromString(self.blob(value['blob']))
+            return message
+        elif '__pickle__' in value:
+            # only written by format version 1
+            return cPickle.loads(self.blob(value['__pickle__']))
+        else:
+            # in the same order as Encoder
+            decoded = {}
+            for k in sorted(value):
+                v = value[k]
+                decoded[str(k)] = v if type(v) in SCALARS else self.decode(v)
+            return decoded
+
+
+def is_plain_key(key):
+    """
+    Returns True if a dict key can be stored as a JSON object key
+    """
+    if type(key) is not str or key.startswith('__'):
+        return False
+    try:
+        key.decode('ascii')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def is_protobuf(value):
+    """
+    Returns True if value is a protocol buffer message
+    """
+    return (hasattr(value, 'DESCRIPTOR')
+            and hasattr(value, 'SerializeToString')
+            and hasattr(value, 'ParseFromString'))
+
+def protobuf_path(message):
+    """
+    Returns "module:Message.Nested" for a protocol buffer message
+    """
+    descriptor = message.DESCRIPTOR
+    name = descriptor.full_name
+    package = descriptor.file.package
+    if package:
+        name = name[len(package)+1:]
+    return '%s:%s' % (type(message).__module__, name)
+
+def find_protobuf(path):
+    cls = _classes.get(path)
+    if cls is None:
+        module_name, _, name = path.partition(':')
+        cls = __import__(module_name, fromlist=['__name__'])
+        for part in name.split('.'):
+            cls = getattr(cls, part)
+        _classes[path] = cls
+    return cls
+
+def is_plain_object(value):
+    """
+    Returns True if value is an instance of a class which can be restored
+    from its __dict__ or __getstate__()
+    """
+    if isinstance(value, (type, types.ClassType, types.FunctionType,
+        types.BuiltinFunctionType, types.ModuleType,
+        basestring, int, long, float, tuple, list, dict, set, frozenset)):
+        return False
+    if not hasattr(value, '__dict__'):
+        return False
+    # objects which need arguments for __new__ or __reduce__ can't be restored
+    cls = value.__class__
+    if hasattr(cls, '__getnewargs__'):
+        return False
+    for name in ['__reduce__', '__reduce_ex__']:
+        for base in inspect.getmro(cls):
+            if name in base.__dict__:
+                if base is not object:
+                    return False
+                break
+    return True
+
+def find_class(path):
+    cls = _classes.get(path)
+    if cls is None:
+        module_name, _, class_name = path.rpartition('.')
+        module = __import__(module_name, fromlist=[class_name])
+        cls = getattr(module, class_name)
+        _classes[path] = cls
+    return cls
+
+def dumps(obj):
+    """
+    Returns obj serialized as a string
+    Raises TypeError if obj contains a value which can't be serialized
+    """
+    encoder = Encoder()
+    manifest = json.dumps({
+        'version': FORMAT_VERSION,
+        'root': encoder.encode(obj),
+        }, separators=(',', ':'))
+    return ''.join(['%s %d\n' % (MAGIC, FORMAT_VERSION), manifest, '\n'] + encoder.blobs)
+
+def loads(data):
+    """
+    Returns the object serialized in data
+    Raises ValueError if data isn't in a supported format
+    """
+    header_end = data.find('\n')
+    header = data[:header_end].split(' ')
+    if len(header) != 2 or header[0] != MAGIC:
+        raise ValueError('Not a DIGITS state file')
+    if int(header[1]) > FORMAT_VERSION:
+        raise ValueError('Unsupported format version %s' % header[1])
+    manifest_end = data.find('\n', header_end + 1)
+    if manifest_end < 0:
+        raise ValueError('Truncated file')
+    manifest = json.loads(data[header_end+1:manifest_end])
+    return Decoder(data, manifest_end + 1).decode(manifest['root'])
+
+def dump(obj, f):
+    """
+    Write obj to a file opened in binary mode
+    """
+    f.write(dumps(obj))
+
+def load(f):
+    """
+    Read an object from a file opened in binary mode
+    """
+    return loads(f.read())
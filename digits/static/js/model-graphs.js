@@ -1,7 +1,7 @@
 // Copyright (c) 2014-2015, NVIDIA CORPORATION.  All rights reserved.
-function drawCombinedGraph(data) {
+function drawCombinedGraph(data, options) {
     $(".combined-graph").show();
-    c3.generate($.extend({
+    return c3.generate($.extend(true, {
         bindto: '#combined-graph',
         axis: {
             x: {
@@ -39,12 +39,13 @@ function drawCombinedGraph(data) {
         grid: {x: {show: true} },
         legend: {position: 'bottom'},
     },
+    options || {},
     {data: data}
     ));
 }
 function drawLRGraph(data) {
     $(".lr-graph").show();
-    c3.generate($.extend({
+    return c3.generate($.extend({
         bindto: '#lr-graph',
         size: {height: 300},
         axis: {
@@ -76,3 +77,172 @@ function drawLRGraph(data) {
     {data: data}
     ));
 }
+
+function drawGpuGraph(data) {
+    $(".gpu-graph").show();
+    return c3.generate($.extend({
+        bindto: '#gpu-graph',
+        size: {height: 300},
+        axis: {
+            x: {
+                label: {
+                    text: 'Time (minutes)',
+                    position: 'outer-center',
+                },
+                tick: {
+                    format: function(x) { return Math.round(x/6)/10; },
+                    fit: false,
+                },
+                min: 0,
+                padding: {left: 0},
+            },
+            y: {
+                label: {
+                    text: 'Utilization / Memory (%)',
+                    position: 'outer-middle',
+                },
+                min: 0,
+                max: 100,
+                padding: {top: 0, bottom: 0},
+            },
+            y2: {
+                show: true,
+                label: {
+                    text: 'Temperature (C)',
+                    position: 'outer-middle',
+                },
+            },
+        },
+        grid: {x: {show: true} },
+        legend: {position: 'bottom'},
+        point: {show: false},
+    },
+    {data: data}
+    ));
+}
+
+// The GPU graph is fetched again at most this often while the task runs
+var GPU_GRAPH_REFRESH = 30000;
+var gpuGraph = {url: null, chart: null, fetched: 0, fetching: false};
+
+// Draw the GpuHistory of a TrainTask from models_gpu_history
+function loadGpuGraph(url) {
+    gpuGraph.url = url;
+    gpuGraph.fetching = true;
+    gpuGraph.fetched = Date.now();
+    $.getJSON(url)
+        .done(function(history) {
+            if (!history.data)
+                return;
+            if (gpuGraph.chart)
+                gpuGraph.chart.load({columns: history.data.columns});
+            else
+                gpuGraph.chart = drawGpuGraph(history.data);
+        })
+        .always(function() { gpuGraph.fetching = false; });
+}
+
+// Called for each 'gpu_utilization' update
+function refreshGpuGraph() {
+    if (gpuGraph.url && !gpuGraph.fetching
+            && Date.now() - gpuGraph.fetched > GPU_GRAPH_REFRESH)
+        loadGpuGraph(gpuGraph.url);
+}
+
+// The graphs which follow the 'graph' updates of a TrainTask
+// graph -> {seq, counts, data, url, chart, fetching}
+var graphStates = {};
+var graphDrawers = {combined: drawCombinedGraph, lr: drawLRGraph};
+
+// Draw a graph from TrainTask.graph_state()
+function loadGraph(graph, state, url) {
+    var old = graphStates[graph];
+    graphStates[graph] = state;
+    state.url = url || (old && old.url);
+    if (state.data)
+        state.chart = graphDrawers[graph](state.data);
+}
+
+// Apply an update from TrainTask.graph_update()
+function updateGraph(graph, update) {
+    var state = graphStates[graph];
+    if (state && state.fetching)
+        return;
+    if (state && state.data && update.seq <= state.seq)
+        // the page was loaded after this update
+        return;
+    if (update.data) {
+        loadGraph(graph, update);
+        return;
+    }
+    if (!state || !state.data || update.seq != state.seq + 1) {
+        // missed an update
+        if (state && state.url) {
+            state.fetching = true;
+            $.getJSON(state.url)
+                .done(function(fetched) { loadGraph(graph, fetched); })
+                .always(function() { state.fetching = false; });
+        }
+        return;
+    }
+    state.seq = update.seq;
+    var columns = {};
+    $.each(state.data.columns, function(i, column) { columns[column[0]] = column; });
+    var changed = [];
+    $.each(update.series, function(col_id, points) {
+        var values = columns[col_id];
+        var epochs = columns[state.data.xs[col_id]];
+        $.each(points, function(i, point) {
+            // the page may already have this point
+            if (point[0] >= state.counts[col_id]) {
+                epochs.push(point[1]);
+                values.push(point[2]);
+            }
+        });
+        changed.push(epochs, values);
+    });
+    state.counts = update.counts;
+    if (changed.length && state.chart)
+        state.chart.load({columns: changed});
+}
+
+// Show the zoomed range of a graph at a higher resolution
+// The data outside of the range comes from the overview (the data for the
+//   whole graph)
+function zoomGraph(chart, overview, url, domain, points) {
+    $.getJSON(url, {start: domain[0], end: domain[1], points: points})
+        .done(function(zoomed) {
+            if (!zoomed.data)
+                return;
+            var base = {};
+            $.each(overview.columns, function(i, column) { base[column[0]] = column; });
+            var detail = {};
+            $.each(zoomed.data.columns, function(i, column) { detail[column[0]] = column; });
+            var columns = [];
+            $.each(overview.xs, function(col_id, x_id) {
+                var values = [col_id];
+                var epochs = [x_id];
+                var added = false;
+                for (var i = 1; i < base[x_id].length; i++) {
+                    var epoch = base[x_id][i];
+                    if (epoch >= domain[0] && !added) {
+                        if (detail[x_id]) {
+                            values = values.concat(detail[col_id].slice(1));
+                            epochs = epochs.concat(detail[x_id].slice(1));
+                        }
+                        added = true;
+                    }
+                    if (epoch < domain[0] || epoch > domain[1]) {
+                        values.push(base[col_id][i]);
+                        epochs.push(epoch);
+                    }
+                }
+                if (!added && detail[x_id]) {
+                    values = values.concat(detail[col_id].slice(1));
+                    epochs = epochs.concat(detail[x_id].slice(1));
+                }
+                columns.push(epochs, values);
+            });
+            chart.load({columns: columns});
+        });
+}
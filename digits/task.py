@@ -1,23 +1,35 @@
 # Copyright (c) 2014-2015, NVIDIA CORPORATION.  All rights reserved.
 
+import os
 import os.path
 import re
+import sys
 import time
 import logging
 import subprocess
 import signal
 
 import flask
+import gevent
 import gevent.event
+import gevent.subprocess
 
 from . import utils
+from . import events
+from . import tool_pool
 import digits.log
 from config import config_value
 from status import Status, StatusCls
+from utils.errors import ToolPoolError
+from utils.usage import ResourceUsage, UsageReport
 
 # NOTE: Increment this everytime the pickled version changes
 PICKLE_VERSION = 1
 
+# NOTE: This must change when the logging format changes
+# YYYY-MM-DD HH:MM:SS [LEVEL] message
+DIGITS_OUTPUT_RE = re.compile(r'(\S{10} \S{8}) \[(\w+)\s*\] (.*)$')
+
 class Task(StatusCls):
     """
     Base class for Tasks
@@ -25,6 +37,22 @@ class Task(StatusCls):
     Communication is done by processing the stdout of the executable
     """
 
+    # Seconds between checks for an abort while the executable is quiet
+    READ_TIMEOUT = 0.5
+    # True if the executable writes events (see digits.events)
+    EVENTS_CHANNEL = False
+    # Seconds to wait for the last events after the executable exits
+    EVENTS_TIMEOUT = 5
+    # Seconds between calls to flush_outputs() while the executable runs
+    FLUSH_INTERVAL = 1
+    # Seconds between samples of the resources used by the executable
+    USAGE_INTERVAL = 2
+    # Runs the executable and reports the resources it used
+    REPORT_USAGE_TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'tools', 'report_usage.py')
+    # Selects the ProcessPriority which the Scheduler gives the executable
+    TASK_TYPE = None
+
     def __init__(self, job_dir, parents=None):
         super(Task, self).__init__()
         self.pickver_task = PICKLE_VERSION
@@ -44,8 +72,14 @@ class Task(StatusCls):
         self.progress = 0
         self.exception = None
         self.traceback = None
+        # the ResourceUsage of the last run
+        self.usage = None
+        # the ProcessPriority for the executable (set by the Scheduler)
+        self.process_priority = None
         self.aborted = gevent.event.Event()
         self.set_logger()
+        # True if this task has changed since the job was last saved
+        self._dirty = True
 
     def __getstate__(self):
         d = self.__dict__.copy()
@@ -54,14 +88,22 @@ class Task(StatusCls):
             del d['aborted']
         if 'logger' in d:
             del d['logger']
+        if '_dirty' in d:
+            del d['_dirty']
+        if 'process_priority' in d:
+            del d['process_priority']
 
         return d
 
     def __setstate__(self, state):
         self.__dict__ = state
+        if 'usage' not in state:
+            self.usage = None
+        self.process_priority = None
 
         self.aborted = gevent.event.Event()
         self.set_logger()
+        self._dirty = False
 
     def set_logger(self):
         self.logger = digits.log.JobIdLoggerAdapter(
@@ -69,6 +111,40 @@ class Task(StatusCls):
                 {'job_id': self.job_id},
                 )
 
+    def mark_dirty(self):
+        """
+        Mark this task as needing to be saved
+        """
+        self._dirty = True
+
+    def is_dirty(self):
+        """
+        Returns True if this task has changed since it was last saved
+        """
+        return self._dirty
+
+    def mark_clean(self):
+        """
+        Called after the job has been saved
+        """
+        self._dirty = False
+
+    def persist(self):
+        """
+        Called by Job.save() before the job is pickled
+        Writes any state which is stored outside of the pickle file
+        """
+        pass
+
+    def flush_outputs(self):
+        """
+        Called every FLUSH_INTERVAL seconds while the executable runs
+        Writes the outputs processed so far, so that a crash only loses the
+        last few seconds of them rather than everything since the job was
+        last saved
+        """
+        pass
+
     def name(self):
         """
         Returns a string
@@ -85,29 +161,41 @@ class Task(StatusCls):
         """
         Called when StatusCls.status.setter is used
         """
-        from digits.webapp import app, socketio
+        from digits.webapp import app, rooms
+
+        self.mark_dirty()
 
         # Send socketio updates
-        message = {
+        def build():
+            message = {
+                    'task': self.html_id(),
+                    'update': 'status',
+                    'status': self.status.name,
+                    'css': self.status.css,
+                    'show': (self.status in [Status.RUN, Status.ERROR]),
+                    'running': self.status.is_running(),
+                    }
+            with app.app_context():
+                message['html'] = flask.render_template('status_updates.html',
+                        updates     = self.status_history,
+                        exception   = self.exception,
+                        traceback   = self.traceback,
+                        )
+            return message
+
+        rooms.emit('task update', build, self.job_id,
+                key=(self.html_id(), 'status'))
+
+    def progress_message(self):
+        """
+        Returns the socketio message about the current progress
+        """
+        return {
                 'task': self.html_id(),
-                'update': 'status',
-                'status': self.status.name,
-                'css': self.status.css,
-                'show': (self.status in [Status.RUN, Status.ERROR]),
-                'running': self.status.is_running(),
+                'update': 'progress',
+                'percentage': int(round(100*self.progress)),
+                'eta': utils.time_filters.print_time_diff(self.est_done()),
                 }
-        with app.app_context():
-            message['html'] = flask.render_template('status_updates.html',
-                    updates     = self.status_history,
-                    exception   = self.exception,
-                    traceback   = self.traceback,
-                    )
-
-        socketio.emit('task update',
-                message,
-                namespace='/jobs',
-                room=self.job_id,
-                )
 
     def path(self, filename, relative=False):
         """
@@ -150,6 +238,53 @@ class Task(StatusCls):
         """
         raise NotImplementedError
 
+    def estimated_work(self):
+        """
+        Returns a number proportional to how long this task will take to
+        run, which is only compared with other tasks' estimates
+        Returns None if unknown
+        """
+        return None
+
+    def gpus_needed(self):
+        """
+        Returns the number of GPUs this task needs to run
+        """
+        return 0
+
+    def gpu_memory_key(self):
+        """
+        Returns a hashable key which is the same for tasks which need the
+        same amount of GPU memory, or None if this task doesn't use GPUs
+        Tasks which return a key must have a gpu_memory attribute
+        """
+        return None
+
+    def request_resources(self, resources, requests):
+        """
+        Utility for offer_resources()
+        Returns the requested resources in the format expected by the
+        scheduler, or None if they are not all available right now
+        Each request is capped at the capacity of the resource, so that
+        a large task can still run once everything else is done
+
+        Arguments:
+        resources -- a copy of scheduler.resources
+        requests -- a dict mapping resource_type to the amount needed
+        """
+        offer = {}
+        for resource_type, value in requests.iteritems():
+            if not resources.get(resource_type):
+                return None
+            for resource in resources[resource_type]:
+                value = min(value, resource.max_value)
+                if resource.remaining() >= value:
+                    offer[resource_type] = [(resource.identifier, value)]
+                    break
+            else:
+                return None
+        return offer
+
     def task_arguments(self, resources):
         """
         Returns args used by subprocess.Popen to execute the task
@@ -189,44 +324,85 @@ class Task(StatusCls):
 
         unrecognized_output = []
 
-        p = subprocess.Popen(args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                cwd=self.job_dir,
-                close_fds=True,
-                )
+        events_write_fd = None
+        if self.EVENTS_CHANNEL:
+            events_fd, events_write_fd = os.pipe()
+
+        self.usage = ResourceUsage()
+        try:
+            p = self.start_process(args, events_write_fd)
+        finally:
+            # only the child writes events
+            if events_write_fd is not None:
+                os.close(events_write_fd)
+        events_reader = None
+        if self.EVENTS_CHANNEL:
+            events_file = os.fdopen(events_fd, 'rb')
+            events_reader = gevent.spawn(self.read_events, events_file)
 
         try:
             sigterm_time = None # When was the SIGTERM signal sent
             sigterm_timeout = 2 # When should the SIGKILL signal be sent
-            while p.poll() is None:
-                for line in utils.nonblocking_readlines(p.stdout):
-                    if self.aborted.is_set():
-                        if sigterm_time is None:
-                            # Attempt graceful shutdown
-                            p.send_signal(signal.SIGTERM)
-                            sigterm_time = time.time()
-                            self.status = Status.ABORT
+            flush_time = time.time() # When were the outputs last flushed
+            sample_time = None # When was the usage last sampled
+            # wakes up at least this often to check for an abort
+            for lines in utils.readlines(p.stdout, timeout=self.READ_TIMEOUT):
+                if sample_time is None or time.time() - sample_time >= self.USAGE_INTERVAL:
+                    pid = self.process_pid(p)
+                    if pid is not None:
+                        self.usage.sample(pid)
+                        sample_time = time.time()
+
+                if self.aborted.is_set():
+                    if p.poll() is not None:
                         break
-
-                    if line is not None:
-                        # Remove whitespace
-                        line = line.strip()
-
+                    if sigterm_time is None:
+                        # Attempt graceful shutdown
+                        p.send_signal(signal.SIGTERM)
+                        sigterm_time = time.time()
+                        self.status = Status.ABORT
+                    elif p.poll() is None and time.time() - sigterm_time > sigterm_timeout:
+                        p.send_signal(signal.SIGKILL)
+                        self.logger.warning('Sent SIGKILL to task "%s"' % self.name())
+                        sigterm_time = time.time()
+                    # ignore the output after an abort
+                    continue
+
+                if not lines and p.poll() is not None:
+                    # exited, but something else still has the pipe open
+                    break
+
+                for line in lines:
+                    # Remove whitespace
+                    line = line.strip()
                     if line:
-                        if not self.process_output(line):
+                        if self.process_output(line):
+                            self.mark_dirty()
+                        else:
                             self.logger.warning('%s unrecognized output: %s' % (self.name(), line.strip()))
                             unrecognized_output.append(line)
-                    else:
-                        time.sleep(0.05)
-                if sigterm_time is not None and (time.time() - sigterm_time > sigterm_timeout):
-                    p.send_signal(signal.SIGKILL)
-                    self.logger.warning('Sent SIGKILL to task "%s"' % self.name())
-                    time.sleep(0.1)
+
+                if time.time() - flush_time >= self.FLUSH_INTERVAL:
+                    self.flush_outputs()
+                    flush_time = time.time()
+
+            # the pipe was closed, but the process may not have exited yet
+            p.wait()
+            if events_reader is not None:
+                events_reader.join(timeout=self.EVENTS_TIMEOUT)
         except:
             p.terminate()
             self.after_run()
             raise
+        finally:
+            if events_reader is not None:
+                events_reader.kill()
+                events_file.close()
+            rusage = self.process_rusage(p)
+            if rusage is not None:
+                self.usage.add_rusage(rusage)
+            self.usage.finish()
+            self.mark_dirty()
 
         self.after_run()
 
@@ -246,6 +422,103 @@ class Task(StatusCls):
             self.status = Status.DONE
             return True
 
+    def start_process(self, args, events_fd=None):
+        """
+        Start the executable
+        Returns a Popen (or something which behaves like one)
+
+        Tools which the ToolPool can run are run there if it's enabled
+        Other executables are run by tools/report_usage.py (see process_pid
+            and process_rusage)
+        The process_priority (if any) is applied to the executable
+
+        Arguments:
+        args -- the arguments from task_arguments()
+
+        Keyword arguments:
+        events_fd -- the write end of the events pipe (if EVENTS_CHANNEL)
+        """
+        pool = tool_pool.get_pool()
+        if pool is not None and pool.can_run(args):
+            try:
+                return pool.popen(args, self.job_dir, events_fd=events_fd,
+                        priority=self.process_priority)
+            except ToolPoolError as e:
+                self.logger.warning('%s: running without the tool worker: %s' % (self.name(), e))
+
+        env = None
+        pass_fds = ()
+        if events_fd is not None:
+            env = os.environ.copy()
+            env[events.ENV_FD] = str(events_fd)
+            pass_fds = (events_fd,)
+        preexec_fn = None
+        if self.process_priority is not None:
+            preexec_fn = self.process_priority.apply
+        # run it with tools/report_usage.py to find out what it used
+        rusage_fd, rusage_write_fd = os.pipe()
+        try:
+            p = gevent.subprocess.Popen(
+                    [sys.executable, self.REPORT_USAGE_TOOL, str(rusage_write_fd)] + args,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    cwd=self.job_dir,
+                    close_fds=True,
+                    pass_fds=pass_fds + (rusage_write_fd,),
+                    env=env,
+                    preexec_fn=preexec_fn,
+                    )
+        except:
+            os.close(rusage_fd)
+            raise
+        finally:
+            os.close(rusage_write_fd)
+        p.usage_report = UsageReport(rusage_fd)
+        return p
+
+    @staticmethod
+    def process_pid(p):
+        """
+        Returns the pid of the executable of a process from start_process()
+        or None if it hasn't started yet
+        """
+        report = getattr(p, 'usage_report', None)
+        if report is None:
+            # from the ToolPool
+            return p.pid
+        report.read()
+        return report.pid
+
+    @staticmethod
+    def process_rusage(p):
+        """
+        Returns what a process from start_process() used (a dict like the
+        one ResourceUsage.add_rusage takes) or None if it isn't known
+        """
+        report = getattr(p, 'usage_report', None)
+        if report is None:
+            # from the ToolPool
+            return getattr(p, 'rusage', None)
+        try:
+            if p.poll() is None:
+                # the report would never arrive
+                return None
+            report.read()
+            # None if it was killed before it could report
+            return report.rusage
+        finally:
+            report.close()
+
+    def json_dict(self):
+        """
+        Returns a dict used for a JSON representation
+        """
+        return {
+                'name': self.name(),
+                'status': self.status.name,
+                'usage': self.usage.json_dict() if self.usage else None,
+                }
+
     def abort(self):
         """
         Abort the Task
@@ -253,14 +526,55 @@ class Task(StatusCls):
         if self.status.is_running():
             self.aborted.set()
 
+    def read_events(self, infile):
+        """
+        Reads the events channel until the executable closes it
+
+        Arguments:
+        infile -- the read end of the channel
+        """
+        for lines in utils.readlines(infile):
+            for line in lines:
+                event = events.parse(line)
+                if event is None:
+                    self.logger.warning('%s unrecognized event: %s' % (self.name(), line))
+                elif self.process_event(event):
+                    self.mark_dirty()
+
+    def process_event(self, event):
+        """
+        Process an event from the executable (see digits.events)
+        Returns True if the event was processed
+
+        Arguments:
+        event -- a dict with the name of the event in "event"
+        """
+        if event['event'] == 'log':
+            level = event.get('level')
+            message = event.get('message')
+            if level == 'warning':
+                self.logger.warning('%s: %s' % (self.name(), message))
+                return True
+            if level in ['error', 'critical']:
+                self.logger.error('%s: %s' % (self.name(), message))
+                self.exception = message
+                return True
+        return False
+
+    def is_digits_output(self, line):
+        """
+        Returns True if a line of output is in DIGITS's log format
+        Cheaper than preprocess_output_digits() (no timestamp parsing)
+        """
+        match = DIGITS_OUTPUT_RE.match(line)
+        return match is not None and bool(match.group(3))
+
     def preprocess_output_digits(self, line):
         """
         Takes line of output and parses it according to DIGITS's log format
         Returns (timestamp, level, message) or (None, None, None)
         """
-        # NOTE: This must change when the logging format changes
-        # YYYY-MM-DD HH:MM:SS [LEVEL] message
-        match = re.match(r'(\S{10} \S{8}) \[(\w+)\s*\] (.*)$', line)
+        match = DIGITS_OUTPUT_RE.match(line)
         if match:
             timestr = match.group(1)
             timestamp = time.mktime(time.strptime(timestr, digits.log.DATE_FORMAT))
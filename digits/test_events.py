@@ -0,0 +1,55 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import logging
+
+from . import events as _
+
+class TestEvents():
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read_fd)
+
+    def read_events(self):
+        data = os.read(self.read_fd, 65536)
+        return [_.parse(line) for line in data.splitlines()]
+
+    def test_emit(self):
+        """events are written as lines of JSON"""
+        writer = _.EventWriter(self.write_fd)
+        assert writer.enabled()
+        writer.emit('progress', done=1, total=4)
+        writer.emit('selected', train=3, val=1, test=0)
+        assert self.read_events() == [
+                {'event': 'progress', 'done': 1, 'total': 4},
+                {'event': 'selected', 'train': 3, 'val': 1, 'test': 0},
+                ]
+
+    def test_disabled(self):
+        """nothing is written without a channel"""
+        os.close(self.write_fd)
+        writer = _.EventWriter()
+        assert not writer.enabled()
+        writer.emit('progress', done=1, total=4)
+
+    def test_log_handler(self):
+        """warnings and errors are sent as log events"""
+        writer = _.EventWriter(self.write_fd)
+        logger = logging.getLogger('digits.test_events')
+        handler = _.EventHandler(writer)
+        logger.addHandler(handler)
+        try:
+            logger.info('not sent')
+            logger.error('bad %s', 'thing')
+        finally:
+            logger.removeHandler(handler)
+        assert self.read_events() == [{'event': 'log', 'level': 'error', 'message': 'bad thing'}]
+
+    def test_parse(self):
+        """lines which aren't events are rejected"""
+        assert _.parse('{"event": "x", "a": 1}') == {'event': 'x', 'a': 1}
+        for line in ['not json', '[1, 2]', '{"a": 1}']:
+            assert _.parse(line) is None, line
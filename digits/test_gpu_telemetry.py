@@ -0,0 +1,110 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import gevent
+
+from . import gpu_telemetry as _
+
+class FakeNvml(object):
+    """
+    Counts the calls to NVML
+    """
+
+    def __init__(self, fail_init=False):
+        self.fail_init = fail_init
+        self.calls = []
+
+    def init(self):
+        self.calls.append('init')
+        if self.fail_init:
+            raise RuntimeError('nvmlInit() failed with error #9')
+
+    def shutdown(self):
+        self.calls.append('shutdown')
+
+    def device_handle(self, index):
+        self.calls.append(('handle', index))
+        if index == 'missing':
+            raise RuntimeError('nvmlDeviceGetHandleByPciBusId() failed with error #2')
+        return 'handle-%s' % index
+
+    def memory(self, handle):
+        self.calls.append(('memory', handle))
+        return {'total': 100, 'used': 25, 'free': 75}
+
+    def utilization(self, handle):
+        return {'gpu': 50, 'memory': 10}
+
+    def temperature(self, handle):
+        return None
+
+
+class TestGpuTelemetry():
+
+    def setUp(self):
+        self.nvml = FakeNvml()
+        self.telemetry = _.GpuTelemetry(self.nvml, interval=0.01)
+
+    def tearDown(self):
+        self.telemetry.stop()
+
+    def test_poll(self):
+        """each GPU is sampled once however many subscribers watch it"""
+        received = []
+        self.telemetry.subscribe(['0', '1'], received.append)
+        self.telemetry.subscribe(['1'], received.append)
+        self.telemetry.poll()
+        self.telemetry.poll()
+        assert self.nvml.calls.count('init') == 1
+        assert self.nvml.calls.count(('handle', '1')) == 1
+        assert self.nvml.calls.count(('memory', 'handle-1')) == 2
+        assert received[-1] == {'1': {
+            'memory': {'total': 100, 'used': 25, 'free': 75},
+            'utilization': {'gpu': 50, 'memory': 10},
+            }}, received
+        assert sorted(received[-2]) == ['0', '1']
+        assert self.telemetry.latest('0')['utilization']['gpu'] == 50
+
+    def test_poller(self):
+        """the GPUs are sampled until nobody is subscribed"""
+        received = []
+        subscription = self.telemetry.subscribe(['0'], received.append)
+        gevent.sleep(0.05)
+        assert len(received) >= 2, received
+        self.telemetry.unsubscribe(subscription)
+        gevent.sleep(0.03)
+        assert self.telemetry._poller is None
+        assert self.telemetry.latest('0') is None
+        count = len(received)
+        gevent.sleep(0.03)
+        assert len(received) == count
+
+    def test_missing_device(self):
+        """a GPU without a handle has no samples"""
+        self.telemetry.subscribe(['missing'])
+        self.telemetry.poll()
+        self.telemetry.poll()
+        assert self.telemetry.latest('missing') is None
+        assert self.nvml.calls.count(('handle', 'missing')) == 1
+
+    def test_init_failed(self):
+        """NVML is disabled when it can't be initialized"""
+        self.telemetry.nvml = FakeNvml(fail_init=True)
+        self.telemetry.subscribe(['0'])
+        self.telemetry.poll()
+        assert not self.telemetry.available()
+        assert self.telemetry.latest('0') is None
+
+    def test_stop(self):
+        """NVML is shut down"""
+        self.telemetry.subscribe(['0'])
+        self.telemetry.poll()
+        self.telemetry.stop()
+        assert self.nvml.calls[-1] == 'shutdown'
+
+    def test_unavailable(self):
+        """without NVML nothing is sampled"""
+        telemetry = _.GpuTelemetry(interval=0.01)
+        telemetry.nvml = None
+        telemetry.subscribe(['0'])
+        assert telemetry._poller is None
+        assert telemetry.latest('0') is None
@@ -0,0 +1,146 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from . import gpu_topology as _
+
+# Recorded on a dual-socket host with two GPUs behind each PCIe switch
+NVIDIA_SMI_TOPO = """\
+        GPU0    GPU1    GPU2    GPU3    CPU Affinity
+GPU0     X      PIX     SOC     SOC     0-11,24-35
+GPU1    PIX      X      SOC     SOC     0-11,24-35
+GPU2    SOC     SOC      X      NV2     12-23,36-47
+GPU3    SOC     SOC     NV2      X      12-23,36-47
+
+Legend:
+
+  X   = Self
+  SOC  = Connection traversing PCIe as well as the SMP link between CPU sockets(e.g. QPI)
+  PHB  = Connection traversing PCIe as well as a PCIe Host Bridge (typically the CPU)
+  PXB  = Connection traversing multiple PCIe switches (without traversing the PCIe Host Bridge)
+  PIX  = Connection traversing a single PCIe switch
+  NV#  = Connection traversing a bonded set of # NVLinks
+"""
+
+NVIDIA_SMI_BUS_IDS = """\
+0, 00000000:04:00.0
+1, 00000000:05:00.0
+2, 00000000:84:00.0
+3, 00000000:85:00.0
+"""
+
+class TestTopology():
+
+    def test_distance(self):
+        """distance is symmetric"""
+        t = _.Topology({('0', '1'): 10})
+        assert t.distance('0', '1') == 10
+        assert t.distance('1', '0') == 10
+        assert t.distance('0', '0') == 0
+        assert t.distance('0', '2') == _.UNKNOWN_COST
+
+    def test_best_set(self):
+        """pick the best connected GPUs"""
+        t = _.Topology({
+            ('0', '1'): 50, ('0', '2'): 10, ('0', '3'): 50,
+            ('1', '2'): 50, ('1', '3'): 10, ('2', '3'): 50,
+            })
+        assert t.best_set(['0', '1', '2', '3'], 2) == ['0', '2']
+        assert t.best_set(['1', '0', '3'], 2) == ['1', '3']
+        assert t.best_set(['0', '1'], 2) == ['0', '1']
+        assert t.best_set(['0', '1'], 3) is None
+        assert t.best_set(['3', '0'], 1) == ['3']
+
+    def test_best_set_greedy(self):
+        """pick the best connected GPUs from many"""
+        t = _.Topology({('0', '2'): 10, ('1', '3'): 20})
+        with mock.patch.object(_, 'MAX_COMBINATIONS', 0):
+            assert t.best_set(['0', '1', '2', '3'], 2) == ['0', '2']
+
+    def test_no_topology(self):
+        """all GPUs are equal without a topology"""
+        assert _.Topology().best_set(['2', '0', '1'], 2) == ['2', '0']
+
+    def test_normalize_bus_id(self):
+        """normalize PCI bus IDs"""
+        assert _.normalize_bus_id('00000000:0A:00.0') == '0000:0a:00.0'
+        assert _.normalize_bus_id('0000:0a:00.0\x00') == '0000:0a:00.0'
+        assert _.normalize_bus_id('             ') is None
+
+
+class TestNvidiaSmi():
+
+    def test_parse(self):
+        """parse nvidia-smi topo -m"""
+        matrix = _.parse_nvidia_smi_topo(NVIDIA_SMI_TOPO)
+        assert matrix[('0', '1')] == _.LINK_COSTS['PIX']
+        assert matrix[('1', '2')] == _.LINK_COSTS['SOC']
+        assert matrix[('2', '3')] < _.LINK_COSTS['NV']
+        assert matrix[('0', '0')] == 0
+        assert len(matrix) == 16
+
+    def test_cuda_order(self):
+        """nvidia-smi indices are mapped to CUDA indices"""
+        def run(args):
+            if 'topo' in args:
+                return NVIDIA_SMI_TOPO
+            return NVIDIA_SMI_BUS_IDS
+        # CUDA puts the fastest GPUs first
+        bus_ids = {
+                '0': '0000:84:00.0',
+                '1': '0000:85:00.0',
+                '2': '0000:04:00.0',
+                '3': '0000:05:00.0',
+                }
+        t = _.nvidia_smi_topology(bus_ids, run)
+        assert t.distance('0', '1') < _.LINK_COSTS['NV']
+        assert t.distance('2', '3') == _.LINK_COSTS['PIX']
+        assert t.distance('0', '2') == _.LINK_COSTS['SOC']
+
+    def test_missing(self):
+        """nvidia-smi not installed"""
+        def run(args):
+            raise OSError('not found')
+        assert _.nvidia_smi_topology({'0': '0000:04:00.0'}, run) is None
+
+
+class TestSysfs():
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.sysfs, 'bus', 'pci', 'devices'))
+        # two GPUs behind one switch, one on another root complex
+        self.add_device('0000:04:00.0', ['pci0000:00', '0000:00:02.0', '0000:02:00.0', '0000:03:08.0'], 0)
+        self.add_device('0000:05:00.0', ['pci0000:00', '0000:00:02.0', '0000:02:00.0', '0000:03:10.0'], 0)
+        self.add_device('0000:07:00.0', ['pci0000:00', '0000:00:03.0'], 0)
+        self.add_device('0000:84:00.0', ['pci0000:80', '0000:80:02.0'], 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def add_device(self, bus_id, parents, numa_node):
+        device_dir = os.path.join(self.sysfs, 'devices', *(parents + [bus_id]))
+        os.makedirs(device_dir)
+        with open(os.path.join(device_dir, 'numa_node'), 'w') as outfile:
+            outfile.write('%d\n' % numa_node)
+        os.symlink(device_dir, os.path.join(self.sysfs, 'bus', 'pci', 'devices', bus_id))
+
+    def test_sysfs(self):
+        """read the PCIe tree from sysfs"""
+        bus_ids = {
+                '0': '0000:04:00.0',
+                '1': '0000:05:00.0',
+                '2': '0000:07:00.0',
+                '3': '0000:84:00.0',
+                '4': '0000:99:00.0',
+                }
+        t = _.sysfs_topology(bus_ids, self.sysfs)
+        assert t.distance('0', '1') == _.LINK_COSTS['PIX']
+        assert t.distance('0', '2') == _.LINK_COSTS['PHB']
+        assert t.distance('0', '3') == _.LINK_COSTS['SYS']
+        assert t.distance('0', '4') == _.UNKNOWN_COST
+
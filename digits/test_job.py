@@ -0,0 +1,117 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import pickle
+
+import mock
+
+from . import job as _
+from status import Status
+from task import Task
+
+class TestDirty():
+    """
+    tests for Job.is_dirty()
+    """
+
+    def setUp(self):
+        self.job = _.Job('tmp')
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.job.dir())
+
+    def test_new_job(self):
+        """new jobs are dirty until saved"""
+        assert self.job.is_dirty()
+        assert self.job.save(), 'failed to save'
+        assert not self.job.is_dirty()
+
+    def test_status_update(self):
+        """status changes make the job dirty"""
+        assert self.job.save(), 'failed to save'
+        self.job.status = Status.RUN
+        assert self.job.is_dirty()
+
+    def test_task(self):
+        """changes to a task make the job dirty"""
+        task = Task(job_dir=self.job.dir())
+        self.job.tasks.append(task)
+        assert self.job.save(), 'failed to save'
+        assert not task.is_dirty()
+        assert not self.job.is_dirty()
+        task.status = Status.RUN
+        assert self.job.is_dirty()
+
+    def test_loaded_job(self):
+        """loaded jobs are clean"""
+        assert self.job.save(), 'failed to save'
+        loaded = _.Job.load(self.job.id())
+        assert not loaded.is_dirty()
+
+
+
+class TestSaveFile():
+    """
+    tests for saving jobs with serialization instead of pickle
+    """
+
+    def setUp(self):
+        self.job = _.Job('tmp')
+        self.job.tasks.append(Task(job_dir=self.job.dir()))
+        self.job.tasks.append(Task(job_dir=self.job.dir(), parents=self.job.tasks[0]))
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.job.dir())
+
+    def test_round_trip(self):
+        """jobs are saved and loaded"""
+        self.job.status = Status.DONE
+        assert self.job.save(), 'failed to save'
+        assert os.path.exists(self.job.path(_.Job.SAVE_FILE))
+        loaded = _.Job.load(self.job.id())
+        assert loaded.name() == 'tmp'
+        assert loaded.status == Status.DONE
+        assert loaded.tasks[1].parents[0] is loaded.tasks[0]
+
+    def test_upgrade_pickle(self):
+        """jobs are moved out of pickle files"""
+        self.job.status = Status.DONE
+        with open(self.job.path(_.Job.PICKLE_FILE), 'wb') as outfile:
+            pickle.dump(self.job, outfile)
+        assert _.JobSummary.load(self.job.id()) is None
+
+        loaded = _.Job.load(self.job.id())
+        assert loaded.status == Status.DONE
+        assert loaded.is_dirty(), 'the job should be saved in the new format'
+        assert loaded.save(), 'failed to save'
+        assert not os.path.exists(self.job.path(_.Job.PICKLE_FILE))
+        assert _.JobSummary.load(self.job.id()).status == Status.DONE
+        assert _.Job.load(self.job.id()).status == Status.DONE
+
+
+class TestDiskUsage():
+
+    def setUp(self):
+        self.job = _.Job('tmp')
+
+    def tearDown(self):
+        shutil.rmtree(self.job.dir())
+
+    def test_disk_usage(self):
+        """disk usage is measured and cached"""
+        os.mkdir(self.job.path('sub'))
+        with open(self.job.path('sub/a'), 'w') as outfile:
+            outfile.write('x' * 100)
+        assert self.job.disk_usage() == 100
+        with open(self.job.path('b'), 'w') as outfile:
+            outfile.write('x' * 50)
+        assert self.job.disk_usage() == 100, 'should be cached'
+        assert self.job.disk_usage(refresh=True) == 150
+        assert self.job.json_dict(True)['disk_usage'] == 150
@@ -0,0 +1,56 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tarfile
+import tempfile
+from cStringIO import StringIO
+
+from nose.tools import assert_raises
+
+from . import job_archive as _
+from job import Job
+
+class TestJobArchive():
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.files = {
+                Job.SUMMARY_FILE: '{}',
+                Job.SAVE_FILE: 'state',
+                os.path.join('train_db', 'data.mdb'): 'x' * 10000,
+                }
+        os.mkdir(os.path.join(self.job_dir, 'train_db'))
+        for name, contents in self.files.iteritems():
+            with open(os.path.join(self.job_dir, name), 'w') as outfile:
+                outfile.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.job_dir)
+
+    def test_round_trip(self):
+        """archive and restore a job directory"""
+        size = _.archive(self.job_dir)
+        assert _.is_archived(self.job_dir)
+        assert sorted(os.listdir(self.job_dir)) == sorted([Job.SUMMARY_FILE, Job.ARCHIVE_FILE])
+        assert size < 10000, 'archive should be compressed'
+        with assert_raises(ValueError):
+            _.archive(self.job_dir)
+
+        _.restore(self.job_dir)
+        assert not _.is_archived(self.job_dir)
+        for name, contents in self.files.iteritems():
+            with open(os.path.join(self.job_dir, name)) as infile:
+                assert infile.read() == contents, '%s not restored' % name
+
+    def test_unsafe_path(self):
+        """archives with paths outside of the job directory are rejected"""
+        filename = os.path.join(self.job_dir, Job.ARCHIVE_FILE)
+        with tarfile.open(filename, 'w:gz') as tar:
+            info = tarfile.TarInfo('../escaped')
+            info.size = 1
+            tar.addfile(info, StringIO('x'))
+        with assert_raises(ValueError):
+            _.restore(self.job_dir)
+        assert _.is_archived(self.job_dir), 'archive should be kept'
+        assert not os.path.exists(os.path.join(self.job_dir, '..', 'escaped'))
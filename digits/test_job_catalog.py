@@ -0,0 +1,180 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from . import job_catalog as _
+from job import Job
+from job_registry import JobRegistry
+from status import Status
+
+class TestJobCatalog():
+
+    def setUp(self):
+        self.catalog = _.JobCatalog()
+        self.patcher = mock.patch.object(_.JobCatalog, 'job_type',
+                staticmethod(lambda job: getattr(job, 'catalog_type', 'job')))
+        self.patcher.start()
+        self.jobs = []
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.catalog.close()
+        for job in self.jobs:
+            shutil.rmtree(job.dir())
+
+    def make_job(self, name, created, job_type='dataset', status=None, username=None):
+        job = Job(name, username=username)
+        job.catalog_type = job_type
+        job.status_history[0] = (job.status_history[0][0], created)
+        if status is not None:
+            job.status_history.append((Status(status), created + 1))
+        self.jobs.append(job)
+        return job
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_query(self):
+        """filter and page through jobs"""
+        a = self.make_job('cats', 1000, status=Status.DONE)
+        b = self.make_job('dogs', 1001, job_type='model', username='alice')
+        c = self.make_job('more cats', 1002, job_type='model', status=Status.ERROR)
+        for job in [a, c, b]:
+            self.catalog.update(job)
+
+        assert self.ids(self.catalog.query()) == [c.id(), b.id(), a.id()]
+        assert self.ids(self.catalog.query(limit=1, offset=1)) == [b.id()]
+        assert self.ids(self.catalog.query(offset=2)) == [a.id()]
+        assert self.ids(self.catalog.query(job_type='model')) == [c.id(), b.id()]
+        assert self.ids(self.catalog.query(status=[Status.DONE, Status.ERROR])) == [c.id(), a.id()]
+        assert self.ids(self.catalog.query(running=True)) == [b.id()]
+        assert self.ids(self.catalog.query(q='cat')) == [c.id(), a.id()]
+        assert self.ids(self.catalog.query(q='ALI')) == [b.id()]
+        assert self.ids(self.catalog.query(q='%')) == []
+        assert self.catalog.count(job_type='model') == 2
+        assert self.catalog.count(q='cat', running=False) == 2
+
+        row = self.catalog.query(q='dogs')[0]
+        assert _.JobCatalog.json_dict(row) == b.json_dict()
+
+    def test_registry_sync(self):
+        """the registry keeps the catalog up to date"""
+        r = JobRegistry(catalog=self.catalog)
+        a = self.make_job('a', 1000)
+        b = self.make_job('b', 1001)
+        r.add(a)
+        r.add(b)
+        assert self.catalog.count() == 2
+
+        with mock.patch('digits.webapp.socketio'):
+            a.status = Status.RUN
+        assert self.ids(self.catalog.query(status=[Status.RUN])) == [a.id()]
+
+        a._name = 'renamed'
+        r.update(a)
+        assert self.ids(self.catalog.query(q='renamed')) == [a.id()]
+
+        r.remove(b.id())
+        assert self.ids(self.catalog.query()) == [a.id()]
+
+        self.catalog.update(b)
+        r.prune_catalog()
+        assert self.ids(self.catalog.query()) == [a.id()]
+
+    def test_archived(self):
+        """archived jobs keep their row"""
+        r = JobRegistry(catalog=self.catalog)
+        a = self.make_job('a', 1000)
+        b = self.make_job('b', 1001, job_type='model')
+        b.dataset_id = a.id()
+        r.add(a)
+        r.add(b)
+
+        assert r.archive(b.id()) is b
+        assert b.id() not in r
+        assert r.is_archived(b.id())
+        assert self.ids(self.catalog.query(archived=True)) == [b.id()]
+        assert self.ids(self.catalog.query(archived=True, dataset_id=a.id())) == [b.id()]
+        assert self.ids(self.catalog.query(archived=False)) == [a.id()]
+        assert _.JobCatalog.json_dict(self.catalog.query(archived=True)[0])['archived']
+        r.prune_catalog()
+        assert self.catalog.count() == 2
+
+        r.add(b)
+        assert not r.is_archived(b.id())
+        assert self.catalog.count(archived=True) == 0
+
+        r.archive(b.id())
+        r.remove(b.id())
+        assert not r.is_archived(b.id())
+        assert self.ids(self.catalog.query()) == [a.id()]
+
+    def test_updated(self):
+        """the time of the last status change is kept"""
+        a = self.make_job('a', 1000)
+        self.catalog.update(a)
+        assert self.catalog.query()[0]['updated'] == 1000
+        a.status_history.append((Status(Status.DONE), 1500))
+        self.catalog.update_status(a)
+        row = self.catalog.query()[0]
+        assert (row['created'], row['updated'], row['status']) == (1000, 1500, Status.DONE)
+
+    def test_retention(self):
+        """the finished models which a policy wasn't enforced on are listed"""
+        a = self.make_job('a', 1000, job_type='model', status=Status.DONE)
+        b = self.make_job('b', 1001, job_type='model', status=Status.DONE)
+        b.train_task = mock.Mock()
+        b.train_task.return_value.pretrained_model = '/jobs/a/snapshot_iter_1.caffemodel'
+        c = self.make_job('c', 1002, job_type='model')
+        for job in [a, b, c]:
+            self.catalog.update(job)
+
+        assert self.catalog.pretrained_models() == set(['/jobs/a/snapshot_iter_1.caffemodel'])
+        assert self.catalog.retention_pending('last=1') == [a.id(), b.id()]
+        self.catalog.set_retention(a.id(), 'last=1')
+        # updates keep the policy
+        self.catalog.update(a)
+        assert self.catalog.retention_pending('last=1') == [b.id()]
+        assert self.catalog.retention_pending('last=2') == [a.id(), b.id()]
+
+    def test_add_column(self):
+        """the new columns are added to old catalogs"""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'jobs.sqlite')
+            catalog = _.JobCatalog(filename)
+            with catalog._conn:
+                catalog._conn.execute('DROP TABLE jobs')
+                catalog._conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, type TEXT NOT NULL, '
+                        'class TEXT NOT NULL, status TEXT NOT NULL, name TEXT NOT NULL, '
+                        'created REAL NOT NULL, dataset_id TEXT, user TEXT, '
+                        'priority INTEGER NOT NULL DEFAULT 0)')
+            catalog.close()
+            catalog = _.JobCatalog(filename)
+            catalog.update(self.make_job('a', 1000), archived=True)
+            assert catalog.count(archived=True) == 1
+            assert catalog.pretrained_models() == set()
+            catalog.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_batch(self):
+        """changes in a batch are committed at the end"""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'jobs.sqlite')
+            catalog = _.JobCatalog(filename)
+            other = _.JobCatalog(filename)
+            with catalog.batch():
+                catalog.update(self.make_job('a', 1000))
+                catalog.update(self.make_job('b', 1001))
+                assert other.count() == 0
+            assert other.count() == 2
+            catalog.close()
+            other.close()
+        finally:
+            shutil.rmtree(directory)
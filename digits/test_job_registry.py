@@ -0,0 +1,131 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import mock
+
+from . import job_registry as _
+from job import Job, JobSummary
+from job_catalog import JobCatalog
+from status import Status
+
+class DummyModelJob(Job):
+    def __init__(self, dataset_id, **kwargs):
+        super(DummyModelJob, self).__init__(**kwargs)
+        self.dataset_id = dataset_id
+
+class TestJobRegistry():
+
+    def test_add_get_remove(self):
+        """add, get and remove a job"""
+        r = _.JobRegistry()
+        job = Job('tmp')
+        assert r.add(job), 'failed to add job'
+        assert not r.add(job), 'added the same job twice'
+        assert r.get(job.id()) is job, 'job not found'
+        assert job.id() in r
+        assert len(r) == 1
+        assert r.remove(job.id()) is job, 'failed to remove job'
+        assert r.get(job.id()) is None, 'job still found'
+        assert len(r) == 0
+        assert r.jobs() == []
+
+    def test_unload(self):
+        """loaded jobs can be replaced with their summary"""
+        loaded = []
+        r = _.JobRegistry(loader=lambda summary: loaded.append(summary) or job)
+        job = Job('tmp')
+        r.add(job)
+        assert not r.unload(job.id()), 'unloaded a running job'
+        job.status_history.append((Status(Status.DONE), 1))
+        job._dirty = False
+        assert r.unload(job.id())
+        assert isinstance(r.peek(job.id()), JobSummary)
+        assert r.jobs()[0].name() == 'tmp'
+        assert not r.unload(job.id())
+        assert r.get(job.id(), access=False) is job
+        assert r.last_access(job.id()) is None
+        assert len(loaded) == 1
+
+    def test_last_access(self):
+        """the last access is kept in the catalog"""
+        catalog = JobCatalog()
+        r = _.JobRegistry(catalog=catalog)
+        job = Job('tmp')
+        r.add(job)
+        with mock.patch('time.time', return_value=1000):
+            r.get(job.id())
+        with mock.patch('time.time', return_value=1010):
+            r.get(job.id())
+        assert r.last_access(job.id()) == 1000
+        with mock.patch('time.time', return_value=2000):
+            r.get(job.id())
+        assert catalog.last_access(job.id()) == 2000
+
+        # a new registry finds it
+        r = _.JobRegistry(catalog=catalog)
+        r.add(job)
+        assert r.last_access(job.id()) == 2000
+        r.remove(job.id())
+        assert r.last_access(job.id()) is None
+
+    def test_get_missing(self):
+        """get a missing job"""
+        r = _.JobRegistry()
+        assert r.get(None) is None
+        assert r.get('not-a-job') is None
+
+    def test_sorted_newest_first(self):
+        """jobs are sorted by creation time"""
+        r = _.JobRegistry()
+        jobs = [Job('tmp%d' % i) for i in xrange(5)]
+        for i, job in enumerate(jobs):
+            job.status_history[0] = (job.status_history[0][0], 1000 + i)
+        # add in a scrambled order
+        for i in [3, 0, 4, 1, 2]:
+            r.add(jobs[i])
+        assert r.jobs() == list(reversed(jobs)), 'jobs not sorted'
+
+    def test_type_index(self):
+        """filter jobs by type"""
+        r = _.JobRegistry()
+        job = Job('tmp')
+        model = DummyModelJob(dataset_id=job.id(), name='model')
+        r.add(job)
+        r.add(model)
+        assert r.jobs(DummyModelJob) == [model]
+        assert set(r.jobs(Job)) == set([job, model])
+        assert r.count(Job) == 2
+
+    def test_status_index(self):
+        """status changes update the indexes"""
+        r = _.JobRegistry()
+        job = Job('tmp')
+        r.add(job)
+        assert r.jobs(running=True) == [job]
+        assert r.jobs(running=False) == []
+
+        job.status = Status.RUN
+        assert r.with_status(Status.RUN) == [job]
+        assert r.with_status(Status.INIT) == []
+        assert r.jobs(running=True) == [job]
+
+        job.status = Status.DONE
+        assert r.with_status(Status.DONE) == [job]
+        assert r.jobs(running=True) == []
+        assert r.jobs(running=False) == [job]
+
+        r.remove(job.id())
+        assert r.with_status(Status.DONE) == []
+        assert r.jobs(running=False) == []
+
+    def test_models_for_dataset(self):
+        """reverse lookup of models by dataset"""
+        r = _.JobRegistry()
+        dataset = Job('dataset')
+        model1 = DummyModelJob(dataset_id=dataset.id(), name='model1')
+        model2 = DummyModelJob(dataset_id=dataset.id(), name='model2')
+        for job in [dataset, model1, model2]:
+            r.add(job)
+        assert set(r.models_for_dataset(dataset.id())) == set([model1, model2])
+        r.remove(model1.id())
+        assert r.models_for_dataset(dataset.id()) == [model2]
+        assert r.models_for_dataset('not-a-job') == []
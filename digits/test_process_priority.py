@@ -0,0 +1,83 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+
+from . import process_priority as _
+
+class TestParse():
+
+    def test_parse(self):
+        """settings are parsed"""
+        p = _.ProcessPriority.parse('nice=10 ionice=idle cpus=0,2-4')
+        assert p.nice == 10
+        assert p.ionice_class == 'idle'
+        assert p.ionice_level is None
+        assert p.cpus == [0, 2, 3, 4]
+
+    def test_ionice_level(self):
+        """an ionice level defaults to the best-effort class"""
+        p = _.ProcessPriority.parse('ionice=realtime:2')
+        assert (p.ionice_class, p.ionice_level) == ('realtime', 2)
+        assert _.ProcessPriority(ionice_level=7).ionice_class == 'best-effort'
+
+    def test_str(self):
+        """priorities can be parsed from their string"""
+        for value in ['nice=10 ionice=best-effort:7', 'cpus=0,1,5', '']:
+            p = _.ProcessPriority.parse(value)
+            assert str(p) == value, str(p)
+            assert _.ProcessPriority.from_dict(p.to_dict()) == p
+
+    def test_invalid(self):
+        """invalid settings are rejected"""
+        for value in ['nice=20', 'nice', 'ionice=fast', 'ionice=idle:8',
+                'cpus=3-1', 'cpus=', 'cpus=-1', 'color=red']:
+            try:
+                _.ProcessPriority.parse(value)
+            except ValueError:
+                pass
+            else:
+                assert False, value
+
+    def test_parse_priorities(self):
+        """priorities are given per task type"""
+        priorities = _.parse_priorities('create_db: nice=10 ionice=idle; train: cpus=0-1;')
+        assert sorted(priorities.keys()) == ['create_db', 'train']
+        assert priorities['create_db'] == _.ProcessPriority(nice=10, ionice_class='idle')
+        assert priorities['train'].cpus == [0, 1]
+        assert _.parse_priorities('') == {}
+        try:
+            _.parse_priorities('nice=10')
+        except ValueError:
+            pass
+        else:
+            assert False
+
+
+class TestApply():
+
+    def run_child(self, priority):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                if not priority.apply():
+                    code = 0
+            finally:
+                os._exit(code)
+        return os.waitpid(pid, 0)[1]
+
+    def test_apply(self):
+        """lowering the priority doesn't need any privileges"""
+        assert self.run_child(_.ProcessPriority(nice=1,
+            ionice_class='best-effort', ionice_level=7, cpus=[0])) == 0
+
+    def test_failed(self):
+        """settings which can't be applied are returned"""
+        assert _.ProcessPriority(cpus=[_.CPU_SETSIZE - 1]).apply() == ['cpus']
+
+    def test_check(self):
+        """the settings are checked without applying them here"""
+        nice = os.nice(0)
+        assert _.ProcessPriority(nice=1, cpus=[0]).check() == []
+        assert _.ProcessPriority(nice=1, cpus=[_.CPU_SETSIZE - 1]).check() == ['cpus']
+        assert os.nice(0) == nice
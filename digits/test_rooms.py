@@ -0,0 +1,77 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import mock
+
+from . import rooms as _
+
+class TestRoomTracker():
+
+    def setUp(self):
+        self.rooms = _.RoomTracker()
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.socketio = self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_listeners(self):
+        """clients join and leave rooms"""
+        self.rooms.join('job', 'a')
+        self.rooms.join('job', 'b')
+        self.rooms.join('other', 'a')
+        assert self.rooms.listeners('job') == 2
+        self.rooms.leave('job', 'b')
+        self.rooms.leave('job', 'b')
+        assert self.rooms.listeners('job') == 1
+        self.rooms.leave_all('a')
+        assert self.rooms.listeners('job') == 0
+        assert self.rooms.listeners('other') == 0
+
+    def test_empty_room(self):
+        """messages for an empty room aren't built"""
+        build = mock.Mock(return_value={'update': 'progress'})
+        assert not self.rooms.emit('task update', build, 'job')
+        assert not build.called
+        assert not self.socketio.emit.called
+
+    def test_emit(self):
+        """messages are sent to the room"""
+        self.rooms.join('job', 'a')
+        assert self.rooms.emit('task update', lambda: {'update': 'progress'}, 'job')
+        self.socketio.emit.assert_called_once_with('task update',
+                {'update': 'progress'}, namespace='/jobs', room='job')
+        # nothing is sent when the builder returns None
+        assert not self.rooms.emit('task update', lambda: None, 'job')
+        assert self.socketio.emit.call_count == 1
+
+    def test_snapshot(self):
+        """late joiners get the last message of each kind"""
+        build = mock.Mock(side_effect=[{'percentage': 10}, {'percentage': 20}])
+        self.rooms.emit('job update', lambda: {'status': 'Running'}, 'job', key='status')
+        self.rooms.emit('task update', build, 'job', key='progress')
+        self.rooms.emit('task update', build, 'job', key='progress')
+        assert not build.called
+        assert self.rooms.snapshot('job') == [
+                ('job update', {'status': 'Running'}),
+                ('task update', {'percentage': 10}),
+                ]
+        # the skipped message was only built once
+        assert self.rooms.snapshot('job')[1][1] == {'percentage': 10}
+        assert build.call_count == 1
+        # messages without a key aren't kept
+        self.rooms.join('job', 'a')
+        self.rooms.emit('task update', lambda: {'update': 'graph'}, 'job')
+        assert len(self.rooms.snapshot('job')) == 2
+        self.rooms.emit('task update', build, 'job', key='progress')
+        assert self.rooms.snapshot('job')[1][1] == {'percentage': 20}
+        self.rooms.forget('job')
+        assert self.rooms.snapshot('job') == []
+
+    def test_max_rooms(self):
+        """only the rooms used last are kept"""
+        self.rooms.MAX_ROOMS = 2
+        for room in ('a', 'b', 'c'):
+            self.rooms.emit('job update', lambda: room, room, key='status')
+        assert self.rooms.snapshot('a') == []
+        assert len(self.rooms.snapshot('b')) == 1
+        assert len(self.rooms.snapshot('c')) == 1
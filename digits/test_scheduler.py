@@ -1,11 +1,22 @@
 # Copyright (c) 2014-2015, NVIDIA CORPORATION.  All rights reserved.
 
+import os
+import time
+
 from nose.tools import assert_raises
 import mock
 
 from . import scheduler as _
 from config import config_value
-from job import Job
+from job import Job, JobSummary
+from job_catalog import JobCatalog
+from job_registry import JobRegistry
+from dataset import DatasetJob
+from status import Status
+from task import Task
+from model.tasks import TrainTask, RetentionPolicy
+import gpu_topology
+from process_priority import ProcessPriority
 
 class TestScheduler():
 
@@ -29,6 +40,444 @@ class TestScheduler():
         s = self.get_scheduler()
         assert s.stop(), 'failed to stop'
 
+    def test_stop_closes_catalog(self):
+        """the job catalog is closed on shutdown"""
+        s = self.get_scheduler()
+        with mock.patch.object(s.jobs.catalog, 'close') as close:
+            assert s.stop(), 'failed to stop'
+        assert close.called
+
+    def test_load_past_jobs_lazily(self):
+        """past jobs are loaded on first access"""
+        job = DatasetJob(name='tmp')
+        job.status = Status.DONE
+        assert job.save(), 'failed to save job'
+
+        s = self.get_scheduler()
+        s.load_past_jobs()
+        summary = s.jobs.peek(job.id())
+        assert isinstance(summary, JobSummary), 'job should not be loaded yet'
+        assert summary.name() == 'tmp'
+        assert summary.status == Status.DONE
+        assert summary in s.completed_dataset_jobs()
+
+        loaded = s.get_job(job.id())
+        assert isinstance(loaded, DatasetJob), 'job should be loaded'
+        assert s.jobs.peek(job.id()) is loaded
+        assert s.delete_job(job.id()), 'failed to delete job'
+
+    def test_load_past_running_job(self):
+        """past running jobs are aborted"""
+        job = DatasetJob(name='tmp')
+        job.status = Status.RUN
+        assert job.save(), 'failed to save job'
+
+        s = self.get_scheduler()
+        s.load_past_jobs()
+        summary = s.jobs.peek(job.id())
+        assert summary is not None, 'job not loaded'
+        assert summary.status == Status.ABORT, 'job status is %s' % summary.status
+        assert s.delete_job(job.id()), 'failed to delete job'
+
+    def test_archive_restore(self):
+        """archived jobs are restored when requested"""
+        job = DatasetJob(name='tmp')
+        job.status = Status.DONE
+        assert job.save(), 'failed to save job'
+
+        s = self.get_scheduler()
+        s.load_past_jobs()
+        assert s.archive_job(job.id())
+        assert job.id() not in s.jobs
+        assert s.jobs.is_archived(job.id())
+        assert sorted(os.listdir(job.dir())) == sorted([Job.SUMMARY_FILE, Job.ARCHIVE_FILE])
+        assert [j.id() for j in s.archived_jobs(DatasetJob)] == [job.id()]
+
+        other = self.get_scheduler()
+        other.load_past_jobs()
+        assert other.jobs.is_archived(job.id()), 'archive not found on load'
+
+        loaded = s.get_job(job.id())
+        assert isinstance(loaded, DatasetJob), 'job should be restored'
+        assert loaded.name() == 'tmp'
+        assert not s.jobs.is_archived(job.id())
+        assert os.path.exists(loaded.path(Job.SAVE_FILE))
+
+        # delete it while archived
+        assert other.delete_job(job.id()), 'failed to delete job'
+        assert not other.jobs.is_archived(job.id())
+        assert not os.path.exists(job.dir())
+        s.jobs.remove(job.id())
+
+    def test_archive_stale_jobs(self):
+        """jobs which haven't been used recently are archived"""
+        job = DatasetJob(name='tmp')
+        job.status = Status.DONE
+        assert job.save(), 'failed to save job'
+
+        s = self.get_scheduler()
+        s.load_past_jobs()
+        assert s.archive_stale_jobs(60) == 0
+        with mock.patch('time.time', return_value=time.time() + 120):
+            loaded = s.get_job(job.id())
+        assert s.archive_stale_jobs(60) == 0, 'job was used recently'
+
+        loaded.status = Status.RUN
+        with mock.patch('time.time', return_value=time.time() + 240):
+            with assert_raises(_.errors.ArchiveError):
+                s.archive_job(job.id())
+            assert s.archive_stale_jobs(60) == 0, 'job is running'
+            loaded.status = Status.DONE
+        with mock.patch('time.time', return_value=time.time() + 480):
+            assert s.archive_stale_jobs(60) == 1
+        assert s.jobs.is_archived(job.id())
+        assert s.delete_job(job.id()), 'failed to delete job'
+
+    def test_host_resources(self):
+        """resources are sized from the host or the config"""
+        s = _.Scheduler(cpu_cores=3, memory=1000, io_tokens=2)
+        assert s.resources['cpus'][0].max_value == 3
+        assert s.resources['memory'][0].max_value == 1000
+        assert s.resources['io'][0].max_value == 2
+        assert s.resources['gpus'] == []
+
+        s = _.Scheduler()
+        assert s.resources['cpus'][0].max_value == _.host_cpu_count()
+        assert s.resources['memory'][0].max_value > 0
+
+        settings = {'cpu_cores': 2, 'memory': 2**30, 'io_tokens': 5, 'shortest_job_first': True}
+        with mock.patch.object(_, 'config_value',
+                side_effect=lambda key: settings[key] if key in settings else config_value(key)):
+            s = _.Scheduler()
+        assert s.resources['cpus'][0].max_value == 2
+        assert s.resources['memory'][0].max_value == 2**30
+        assert s.resources['io'][0].max_value == 5
+        assert s.shortest_job_first
+
+
+    def test_collect_snapshots(self):
+        """retention policies are enforced on loaded model jobs"""
+        s = self.get_scheduler()
+        task = mock.Mock(spec=TrainTask)
+        task.enforce_retention.return_value = ['a', 'b']
+        job = mock.Mock(spec=_.ModelJob)
+        job.tasks = [task]
+        with mock.patch.object(s.jobs, 'loaded_jobs', return_value=[job, mock.Mock(spec=Job)]):
+            assert s.collect_snapshots() == 2
+        task.enforce_retention.assert_called_with(s.snapshot_retention, set())
+        job.disk_usage.assert_called_with(refresh=True)
+
+    def test_collect_snapshots_of_past_jobs(self):
+        """the default policy is enforced once on jobs which aren't loaded"""
+        s = self.get_scheduler()
+        s.snapshot_retention = RetentionPolicy(keep_last=1)
+        s.jobs = JobRegistry(catalog=JobCatalog())
+        for name, pretrained in (('old', None), ('new', '/jobs/old/snapshot_1.caffemodel')):
+            s.jobs.add(JobSummary('/jobs/%s' % name, {
+                'id': name,
+                'name': name,
+                'class': 'digits.model.job.ModelJob',
+                'status_history': [['D', 1000]],
+                'dataset_id': 'dataset',
+                'pretrained_model': pretrained,
+                }))
+        task = mock.Mock(spec=TrainTask)
+        task.enforce_retention.return_value = ['x']
+        job = mock.Mock(spec=_.ModelJob)
+        job.tasks = [task]
+        job.is_dirty.return_value = False
+        with mock.patch.object(s.jobs, 'get', return_value=job) as get, \
+                mock.patch.object(s.jobs, 'unload') as unload:
+            assert s.collect_snapshots() == 2
+            get.assert_any_call('new', access=False)
+            unload.assert_any_call('new')
+            task.enforce_retention.assert_called_with(s.snapshot_retention,
+                    set(['/jobs/old/snapshot_1.caffemodel']))
+            assert s.collect_snapshots() == 0, 'enforced twice'
+            s.snapshot_retention = RetentionPolicy(keep_last=2)
+            assert s.collect_snapshots() == 2, 'new policy not enforced'
+
+    def test_process_priorities(self):
+        """tasks run with the priority for their type"""
+        s = _.Scheduler()
+        assert s.process_priorities == s.DEFAULT_PROCESS_PRIORITIES
+        priority = ProcessPriority(cpus=[0, 1])
+        s = _.Scheduler(process_priorities={'train': priority})
+        for task_class, expected in [(TrainTask, priority), (Task, None)]:
+            task = mock.Mock(spec=task_class)
+            task.TASK_TYPE = task_class.TASK_TYPE
+            with mock.patch.object(s, 'release_resources'):
+                s.run_task(task, {})
+            assert task.process_priority == expected, task_class
+
+    def test_invalid_process_priorities(self):
+        """priorities which can't be applied are logged at startup"""
+        priority = ProcessPriority(cpus=[1023])
+        with mock.patch.object(_, 'logger') as logger:
+            _.Scheduler(process_priorities={'train': priority})
+        assert logger.warning.call_count == 1
+        assert 'cpus' in logger.warning.call_args[0][0]
+
+
+class TestRequestResources():
+
+    def setUp(self):
+        self.resources = _.Scheduler(cpu_cores=4, memory=1000, io_tokens=1).resources
+        self.task = Task(job_dir='/tmp')
+
+    def test_available(self):
+        """request available resources"""
+        offer = self.task.request_resources(self.resources, {'cpus': 2, 'memory': 500})
+        assert offer == {'cpus': [('cpus', 2)], 'memory': [('memory', 500)]}, offer
+
+    def test_capped(self):
+        """requests are capped at the capacity"""
+        offer = self.task.request_resources(self.resources, {'memory': 5000})
+        assert offer == {'memory': [('memory', 1000)]}, offer
+
+    def test_busy(self):
+        """request busy resources"""
+        self.resources['io'][0].allocate(object(), 1)
+        assert self.task.request_resources(self.resources, {'cpus': 1, 'io': 1}) is None
+
+    def test_unknown(self):
+        """request an unknown resource type"""
+        assert self.task.request_resources(self.resources, {'tpus': 1}) is None
+
+
+class TestQueueOrder():
+
+    def make_job(self, job_id, created, username=None,
+            priority=Job.PRIORITY_NORMAL, work=None, gpus=1):
+        job = mock.Mock()
+        job.id.return_value = job_id
+        job.status_history = [(Status(Status.INIT), created)]
+        job.username = username
+        job.priority = priority
+        task = mock.Mock()
+        task.estimated_work.return_value = work
+        task.gpus_needed.return_value = gpus
+        task.selected_gpus = None
+        task.status = Status(Status.WAIT)
+        task.status_history = [(task.status, created)]
+        def offer_resources(resources):
+            free = [gpu.identifier for gpu in resources['gpus'] if gpu.remaining() >= 1]
+            if len(free) < gpus:
+                return None
+            return {'gpus': [(i, 1) for i in free[:gpus]]}
+        task.offer_resources.side_effect = offer_resources
+        job.tasks = [task]
+        return job
+
+    def started(self, s, jobs):
+        """
+        Returns the ids of the jobs whose tasks were started, in order
+        """
+        with mock.patch.object(_.gevent, 'spawn') as spawn:
+            s.start_queued_tasks([(job, job.tasks[0]) for job in jobs])
+        tasks = [call[0][1] for call in spawn.call_args_list]
+        return [job.id() for task in tasks for job in jobs if job.tasks[0] is task]
+
+    def test_fifo(self):
+        """oldest first by default"""
+        s = _.Scheduler('0')
+        jobs = [self.make_job('new', 2), self.make_job('old', 1)]
+        assert self.started(s, jobs) == ['old']
+
+    def test_priority(self):
+        """higher priority first"""
+        s = _.Scheduler('0')
+        jobs = [
+                self.make_job('low', 1, priority=Job.PRIORITY_LOW),
+                self.make_job('high', 3, priority=Job.PRIORITY_HIGH),
+                self.make_job('normal', 2),
+                ]
+        assert self.started(s, jobs) == ['high']
+        jobs[1].tasks[0].status = Status.RUN
+        s.resources['gpus'][0].deallocate(jobs[1].tasks[0])
+        assert self.started(s, [jobs[0], jobs[2]]) == ['normal']
+
+    def test_fair_share(self):
+        """users share the GPUs"""
+        s = _.Scheduler('0,1')
+        jobs = [
+                self.make_job('a1', 1, username='a'),
+                self.make_job('a2', 2, username='a'),
+                self.make_job('b1', 3, username='b'),
+                ]
+        assert self.started(s, jobs) == ['a1', 'b1']
+
+    def test_shortest_job_first(self):
+        """shortest job first"""
+        jobs = [
+                self.make_job('long', 1, work=100),
+                self.make_job('unknown', 2),
+                self.make_job('short', 3, work=10),
+                ]
+        assert self.started(_.Scheduler('0'), jobs) == ['long']
+        s = _.Scheduler('0', shortest_job_first=True)
+        assert self.started(s, jobs) == ['short']
+
+    def test_reservation(self):
+        """reserve GPUs for a multi-GPU job"""
+        s = _.Scheduler('0,1', reservation_wait=60)
+        running = mock.Mock()
+        running.est_done.return_value = 100
+        s.resources['gpus'][0].allocate(running, 1)
+
+        big = self.make_job('big', time.time() - 30, gpus=2)
+        small = self.make_job('small', time.time(), work=10)
+        assert self.started(s, [big, small]) == ['small']
+        assert s.reservation is None
+        s.resources['gpus'][1].deallocate(small.tasks[0])
+
+        # after waiting long enough, the free GPU is reserved
+        big.tasks[0].status_history = [(Status(Status.WAIT), time.time() - 90)]
+        assert self.started(s, [big, small]) == []
+        assert s.reservation.task is big.tasks[0]
+        assert sorted(s.reservation.gpus) == ['0', '1']
+        assert s.reservation.start >= time.time() + 99
+
+        # backfill with a job which is expected to finish in time
+        s.runtime_rates[type(small.tasks[0])] = 1
+        assert self.started(s, [big, small]) == ['small']
+        s.resources['gpus'][1].deallocate(small.tasks[0])
+        s.runtime_rates[type(small.tasks[0])] = 20
+        assert self.started(s, [big, small]) == []
+
+        # the reservation is released once the job starts
+        s.resources['gpus'][0].deallocate(running)
+        assert self.started(s, [big, small]) == ['big']
+        assert self.started(s, [small]) == []
+        assert s.reservation is None
+
+    def test_record_runtime(self):
+        """runtime estimates are learned"""
+        s = _.Scheduler()
+        task = mock.Mock()
+        task.estimated_work.return_value = 50
+        task.status = Status(Status.DONE)
+        task.status_history = [
+                (Status(Status.INIT), 0),
+                (Status(Status.RUN), 100),
+                (Status(Status.DONE), 200),
+                ]
+        s.record_runtime(task)
+        task.estimated_work.return_value = 10
+        assert s.estimated_runtime(task) == 20
+
+
+class TestGpuSharing():
+
+    GB = 2**30
+
+    def setUp(self):
+        self.s = _.Scheduler(cpu_cores=16)
+        self.s.resources['gpus'] = [
+                _.GpuResource('0', memory=4*self.GB),
+                _.GpuResource('1', memory=4*self.GB),
+                ]
+        # mocked NVML - nothing else is using the GPUs
+        self.nvml_info = {'memory': {'total': 4*self.GB, 'used': 0, 'free': 4*self.GB}}
+        patcher = mock.patch.object(_.device_query, 'get_nvml_info',
+                side_effect=lambda index: self.nvml_info)
+        patcher.start()
+        self.patchers = [patcher]
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def make_task(self, gpu_memory=None):
+        task = TrainTask(dataset=None, train_epochs=1, snapshot_interval=1,
+                learning_rate=0.01, lr_policy={}, job_dir='/tmp', gpu_count=1)
+        task.gpu_memory = gpu_memory
+        return task
+
+    def start(self, task):
+        resources = task.offer_resources(self.s.resources)
+        if resources is None:
+            return None
+        assert self.s.reserve_resources(task, resources)
+        return resources['gpus']
+
+    def test_memory_fraction(self):
+        """GPU memory fraction"""
+        gpu = self.s.resources['gpus'][0]
+        assert gpu.memory_fraction(None) == 1
+        assert gpu.memory_fraction(self.GB) == 0.25
+        assert gpu.memory_fraction(8*self.GB) == 1
+        assert _.GpuResource('2').memory_fraction(self.GB) == 1
+
+    def test_unknown_footprint(self):
+        """tasks with an unknown footprint use a whole GPU"""
+        assert self.start(self.make_task()) == [('0', 1)]
+        assert self.start(self.make_task(self.GB)) == [('1', 0.25)]
+        assert self.start(self.make_task()) is None
+
+    def test_packing(self):
+        """small tasks are packed onto the same GPU"""
+        assert self.start(self.make_task(self.GB)) == [('0', 0.25)]
+        assert self.start(self.make_task(2*self.GB)) == [('0', 0.5)]
+        assert self.start(self.make_task(2*self.GB)) == [('1', 0.5)]
+        # a whole GPU is needed
+        assert self.start(self.make_task()) is None
+
+    def test_nvml_free_memory(self):
+        """admission checks NVML free memory"""
+        self.nvml_info['memory']['free'] = self.GB // 2
+        assert self.start(self.make_task(self.GB)) is None
+        self.nvml_info['memory']['free'] = 2 * self.GB
+        assert self.start(self.make_task(self.GB)) == [('0', 0.25)]
+
+    def test_telemetry_free_memory(self):
+        """the free memory is taken from the GPU telemetry when it has a sample"""
+        self.nvml_info['memory']['free'] = 2 * self.GB
+        telemetry = mock.Mock()
+        telemetry.latest.side_effect = lambda index: \
+                {'memory': {'free': self.GB // 2}} if index == '0' else None
+        with mock.patch.object(_.gpu_telemetry, 'get_telemetry', return_value=telemetry):
+            assert self.s.resources['gpus'][0].free_memory() == self.GB // 2
+            assert self.s.resources['gpus'][1].free_memory() == 2 * self.GB
+            assert self.start(self.make_task(self.GB)) == [('1', 0.25)]
+
+    def test_topology(self):
+        """multi-GPU tasks get the best connected GPUs"""
+        self.s.resources['gpus'].append(_.GpuResource('2', memory=4*self.GB))
+        gpu_topology.set_topology(gpu_topology.Topology({
+            ('0', '1'): 50, ('0', '2'): 50, ('1', '2'): 10,
+            }))
+        try:
+            task = self.make_task()
+            task.gpu_count = 2
+            assert self.start(task) == [('1', 1), ('2', 1)]
+        finally:
+            gpu_topology.set_topology(None)
+
+    def test_measured_footprint(self):
+        """measured footprints are used to share GPUs"""
+        task = self.make_task()
+        task.gpu_memory_key = lambda: 'lenet'
+        assert self.start(task) == [('0', 1)]
+        task.status = Status.RUN
+        job = mock.Mock()
+        job.tasks = [task]
+        self.s.jobs.jobs = lambda running=None: [job]
+
+        # caffe reported how much memory it needs
+        task.set_data_memory(100 * 2**20)
+        self.s.update_gpu_footprints()
+        fraction = float(task.gpu_memory) / (4*self.GB)
+        assert task.current_resources['gpus'] == [('0', fraction)]
+        assert self.s.resources['gpus'][0].remaining() == 1 - fraction
+
+        # the same network can now share the GPU
+        other = self.make_task()
+        other.gpu_memory_key = lambda: 'lenet'
+        self.s.apply_gpu_footprint(other)
+        assert other.gpu_memory == task.gpu_memory
+        assert self.start(other) == [('0', fraction)]
+
 
 class TestSchedulerFlow():
 
@@ -49,3 +498,42 @@ class TestSchedulerFlow():
         assert self.s.delete_job(job), 'failed to delete job'
         assert len(self.s.jobs) == 0, 'scheduler has %d jobs' % len(self.s.jobs)
 
+
+    def test_delete_dataset_with_dependents(self):
+        """can't delete a dataset which a model depends on"""
+        dataset = Job('dataset')
+        model = Job('model')
+        model.dataset_id = dataset.id()
+        # scheduler checks the type of the dataset job
+        with mock.patch.object(_, 'DatasetJob', Job):
+            assert self.s.add_job(dataset), 'failed to add dataset'
+            assert self.s.add_job(model), 'failed to add model'
+            with assert_raises(_.errors.DeleteError):
+                self.s.delete_job(dataset)
+            assert self.s.delete_job(model), 'failed to delete model'
+            assert self.s.delete_job(dataset), 'failed to delete dataset'
+        assert len(self.s.jobs) == 0, 'scheduler has %d jobs' % len(self.s.jobs)
+
+    def test_delete_jobs(self):
+        """delete a dataset along with its models"""
+        dataset = DatasetJob(name='dataset')
+        model = Job('model')
+        model.dataset_id = dataset.id()
+        assert self.s.add_job(dataset), 'failed to add dataset'
+        assert self.s.add_job(model), 'failed to add model'
+        directories = [dataset.dir(), model.dir()]
+
+        results = self.s.delete_jobs([dataset.id(), model.id(), 'foo'])
+        assert results[dataset.id()] is None, results
+        assert results[model.id()] is None, results
+        assert results['foo'] == 'Job not found'
+        assert len(self.s.jobs) == 0, 'scheduler has %d jobs' % len(self.s.jobs)
+        for directory in directories:
+            assert not os.path.exists(directory), 'not moved to the trash'
+        # the reaper removes the files in the background
+        for _i in xrange(50):
+            if self.s.trash.is_empty():
+                break
+            time.sleep(0.1)
+        assert self.s.trash.is_empty(), 'trash not emptied'
+
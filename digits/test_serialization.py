@@ -0,0 +1,135 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from google.protobuf import descriptor_pb2
+
+from . import serialization as _
+from status import Status
+
+Point = namedtuple('Point', ['x', 'y'])
+
+class Thing(object):
+    def __init__(self, value):
+        self.value = value
+
+class StatefulThing(object):
+    def __init__(self, value):
+        self.value = value
+        self.cache = 'not saved'
+
+    def __getstate__(self):
+        return {'value': self.value, 'version': 1}
+
+    def __setstate__(self, state):
+        if state['version'] < 2:
+            state['upgraded'] = True
+        self.__dict__ = state
+
+
+class TestRoundTrip():
+
+    def round_trip(self, value):
+        return _.loads(_.dumps(value))
+
+    def test_builtins(self):
+        """builtin types keep their types"""
+        value = {
+                'none': None,
+                'bool': True,
+                'int': 3,
+                'long': 2**70,
+                'float': 0.1,
+                'str': 'abc',
+                'bytes': '\xff\x00',
+                'unicode': u'caf\xe9',
+                'list': [1, [2]],
+                'tuple': (1, 'a'),
+                'set': set([1, 2]),
+                'frozenset': frozenset(['a']),
+                'int keys': {1: 'a', (2, 3): 'b'},
+                '__private': 1,
+                'ordered': OrderedDict([('b', 1), ('a', 2)]),
+                'namedtuple': Point(1, 2),
+                }
+        result = self.round_trip(value)
+        assert result == value
+        for key in value:
+            assert type(result[key]) is type(value[key]), key
+        assert result['ordered'].keys() == ['b', 'a']
+        assert type(result.keys()[0]) is str
+
+    def test_numpy(self):
+        """numpy arrays are stored as blobs"""
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        result = self.round_trip({'a': array})['a']
+        assert result.dtype == np.float32
+        assert (result == array).all()
+        assert result.flags.writeable
+
+    def test_numpy_scalars(self):
+        """numpy scalars keep their types"""
+        value = [np.float64(0.1), np.int32(-3), np.bool_(True)]
+        result = self.round_trip(value)
+        assert result == value
+        assert [type(v) for v in result] == [type(v) for v in value]
+
+    def test_protobuf(self):
+        """protocol buffers are stored as blobs"""
+        message = descriptor_pb2.FileDescriptorProto(name='test')
+        message.message_type.add(name='Nested')
+        option = descriptor_pb2.DescriptorProto.ExtensionRange(start=1, end=2)
+        result = self.round_trip([message, option])
+        assert result == [message, option]
+        assert type(result[1]) is descriptor_pb2.DescriptorProto.ExtensionRange
+
+    def test_objects(self):
+        """objects are restored with __setstate__"""
+        result = self.round_trip([Thing(1), StatefulThing(2), Status(Status.RUN)])
+        assert result[0].value == 1
+        assert result[1].value == 2
+        assert result[1].upgraded
+        assert not hasattr(result[1], 'cache')
+        assert result[2] == Status.RUN
+        assert result[2].name == 'Running'
+
+    def test_shared_references(self):
+        """objects referenced twice are restored once"""
+        a = Thing(1)
+        b = Thing(a)
+        a.other = b
+        result = self.round_trip({'z': a, 'a': [b, a]})
+        assert result['a'][1] is result['z']
+        assert result['a'][0] is result['z'].other
+        assert result['a'][0].value is result['z']
+
+    def test_format(self):
+        """the manifest is readable and blobs follow it"""
+        data = _.dumps({'a': '\xff' * 100})
+        lines = data.split('\n', 2)
+        assert lines[0] == '%s %d' % (_.MAGIC, _.FORMAT_VERSION)
+        assert '"__bytes__"' in lines[1]
+        assert lines[2] == '\xff' * 100
+
+    def test_unsupported(self):
+        """values which would need pickle are rejected"""
+        for value in [Thing, len, np.zeros(2, dtype=[('a', 'f4')]), OrderedDict().iteritems()]:
+            try:
+                _.dumps({'a': [value]})
+            except TypeError:
+                pass
+            else:
+                assert False, 'serialized %r' % value
+        assert '__pickle__' not in _.dumps({'a': Point(1, 2)})
+
+    def test_bad_files(self):
+        """unsupported files are rejected"""
+        for data in ['', 'garbage', '%s 999\n{}\n' % _.MAGIC, _.dumps('x')[:-2],
+                _.dumps({'a': '\xff' * 100})[:-1]]:
+            try:
+                _.loads(data)
+            except ValueError:
+                pass
+            else:
+                assert False, 'loaded %r' % data
@@ -0,0 +1,201 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import sys
+import signal
+import shutil
+import tempfile
+
+import gevent
+import mock
+
+from . import task as _
+from status import Status
+import events
+from process_priority import ProcessPriority
+
+class CommandTask(_.Task):
+    """
+    Runs a python snippet and records its output
+    """
+
+    def __init__(self, job_dir, code):
+        super(CommandTask, self).__init__(job_dir)
+        self.code = code
+        self.lines = []
+
+    def name(self):
+        return 'Command'
+
+    def task_arguments(self, resources):
+        return [sys.executable, '-u', '-c', self.code]
+
+    def process_output(self, line):
+        self.lines.append(line)
+        return True
+
+
+class EventsTask(CommandTask):
+    """
+    Also records the events it receives
+    """
+    EVENTS_CHANNEL = True
+
+    def __init__(self, job_dir, code):
+        super(EventsTask, self).__init__(job_dir, code)
+        self.events = []
+
+    def process_output(self, line):
+        return self.is_digits_output(line)
+
+    def process_event(self, event):
+        self.events.append(event)
+        return super(EventsTask, self).process_event(event)
+
+
+class TestRun():
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch('digits.webapp.socketio')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.job_dir)
+
+    def test_output(self):
+        """output is processed line by line"""
+        task = CommandTask(self.job_dir,
+                'import sys\n'
+                'for i in range(1000): print "line %d" % i\n'
+                'sys.stdout.write("progress\\r  \\nlast")')
+        assert task.run({})
+        assert task.status == Status.DONE
+        assert len(task.lines) == 1002
+        assert task.lines[-2:] == ['progress', 'last']
+
+    def test_error(self):
+        """the exit code is checked"""
+        task = CommandTask(self.job_dir, 'import sys; sys.exit(3)')
+        assert not task.run({})
+        assert task.status == Status.ERROR
+        assert task.exception == 'error code 3'
+
+    def test_abort(self):
+        """a quiet process can be aborted"""
+        task = CommandTask(self.job_dir, 'import time; print "started"; time.sleep(60)')
+        greenlet = gevent.spawn(task.run, {})
+        with gevent.Timeout(10):
+            while not task.lines:
+                gevent.sleep(0.05)
+            task.abort()
+            assert not greenlet.get()
+        assert task.status == Status.ABORT
+
+    def test_flush_outputs(self):
+        """outputs are flushed while the process runs"""
+        task = CommandTask(self.job_dir, 'import time; print "started"; time.sleep(60)')
+        task.FLUSH_INTERVAL = 0.2
+        task.flush_outputs = mock.Mock()
+        greenlet = gevent.spawn(task.run, {})
+        with gevent.Timeout(10):
+            while task.flush_outputs.call_count < 2:
+                gevent.sleep(0.05)
+            assert task.lines == ['started']
+            task.abort()
+            greenlet.get()
+
+    def test_events(self):
+        """events are read from their own channel"""
+        task = EventsTask(self.job_dir,
+                'import os, json\n'
+                'f = os.fdopen(int(os.environ["%s"]), "w")\n'
+                'print "2015-01-01 00:00:00 [INFO ] human log"\n'
+                'for i in range(100): f.write(json.dumps({"event": "progress", "done": i, "total": 100}) + "\\n")\n'
+                'f.write(json.dumps({"event": "log", "level": "error", "message": "oops"}) + "\\n")\n'
+                % events.ENV_FD)
+        assert task.run({})
+        assert [e['done'] for e in task.events[:-1]] == range(100)
+        assert task.exception == 'oops'
+        assert task.is_digits_output('2015-01-01 00:00:00 [INFO ] human log')
+        assert not task.is_digits_output('Traceback (most recent call last):')
+
+    def test_usage(self):
+        """the resources used by a short process are recorded"""
+        task = CommandTask(self.job_dir,
+                'import os, time\n'
+                'start = time.time()\n'
+                'data = "x" * 50000000\n'
+                'with open("output", "w") as outfile:\n'
+                '    outfile.write(data[:10000000])\n'
+                '    outfile.flush()\n'
+                '    os.fsync(outfile.fileno())\n'
+                'while time.time() - start < 1.2: pass\n'
+                'print "done"')
+        assert task.run({})
+        assert task.lines == ['done']
+        usage = task.json_dict()['usage']
+        assert usage['wall_time'] >= 1.2, usage
+        assert usage['user_time'] + usage['system_time'] > 0.5, usage
+        assert usage['max_rss'] >= 50000000, usage
+        assert usage['write_bytes'] >= 10000000, usage
+
+    def test_usage_sampled(self):
+        """the resources used by the executable are sampled while it runs"""
+        task = CommandTask(self.job_dir,
+                'import time\n'
+                'data = "x" * 50000000\n'
+                'start = time.time()\n'
+                'while time.time() - start < 0.5: pass\n'
+                'print "ready"\n'
+                'time.sleep(60)')
+        task.USAGE_INTERVAL = 0.2
+        greenlet = gevent.spawn(task.run, {})
+        with gevent.Timeout(10):
+            while not task.lines:
+                gevent.sleep(0.05)
+            # sampled from the executable rather than tools/report_usage.py
+            while task.usage.max_rss < 50000000 or task.usage.cpu_time() < 0.3:
+                gevent.sleep(0.05)
+            task.abort()
+            greenlet.get()
+
+    def test_abort_stops_command(self):
+        """the executable doesn't outlive the process which reports its usage"""
+        def proc_stat(pid):
+            try:
+                with open('/proc/%d/stat' % pid) as infile:
+                    # state and parent pid
+                    return infile.read().rsplit(')', 1)[1].split()[:2]
+            except IOError:
+                return None
+
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            task = CommandTask(self.job_dir, 'import os, time; print os.getpid(); time.sleep(60)')
+            greenlet = gevent.spawn(task.run, {})
+            with gevent.Timeout(10):
+                while not task.lines:
+                    gevent.sleep(0.05)
+                pid = int(task.lines[0])
+                if sig == signal.SIGTERM:
+                    task.abort()
+                    assert not greenlet.get()
+                else:
+                    # the wrapper is killed
+                    os.kill(int(proc_stat(pid)[1]), sig)
+                    greenlet.get()
+                while proc_stat(pid) is not None and proc_stat(pid)[0] != 'Z':
+                    gevent.sleep(0.05)
+
+    def test_process_priority(self):
+        """the process priority is applied to the process"""
+        task = CommandTask(self.job_dir,
+                'import os\n'
+                'print "nice", os.nice(0)\n'
+                'for line in open("/proc/self/status"):\n'
+                '    if line.startswith("Cpus_allowed_list:"): print "cpus", line.split()[1]')
+        task.process_priority = ProcessPriority(nice=5, cpus=[0])
+        assert task.run({})
+        assert 'nice %d' % (os.nice(0) + 5) in task.lines, task.lines
+        assert 'cpus 0' in task.lines, task.lines
@@ -0,0 +1,109 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import sys
+import signal
+import socket
+import shutil
+import tempfile
+
+from . import tool_pool as _
+from . import utils, events
+
+class TestToolPool():
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = _.ToolPool(tools=['parse_folder'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.stop()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folder = os.path.join(self.directory, 'images')
+        for category in ('cat', 'dog'):
+            os.makedirs(os.path.join(self.folder, category))
+            for i in xrange(3):
+                open(os.path.join(self.folder, category, '%d.jpg' % i), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def args(self, *args):
+        return [sys.executable, os.path.join(_.TOOLS_DIR, 'parse_folder.py')] + list(args)
+
+    def run(self, args, events_fd=None):
+        p = self.pool.popen(args, self.directory, events_fd=events_fd)
+        output = []
+        for lines in utils.readlines(p.stdout, timeout=5):
+            output.extend(lines)
+            if not lines and p.poll() is not None:
+                break
+        return p, p.wait(timeout=5), output
+
+    def test_tool_name(self):
+        """only the tools which the worker imported can run"""
+        assert self.pool.tool_name(self.args('folder')) == 'parse_folder'
+        assert self.pool.tool_name([sys.executable, os.path.join(_.TOOLS_DIR, 'create_db.py')]) is None
+        assert self.pool.tool_name([sys.executable, 'parse_folder.py']) is None
+        assert self.pool.tool_name(['python', '-c', 'pass']) is None
+
+    def test_run(self):
+        """tools write their output and events like a subprocess"""
+        read_fd, write_fd = os.pipe()
+        try:
+            p, returncode, output = self.run(self.args(self.folder, 'labels.txt',
+                '--train_file=train.txt', '--min=2'), events_fd=write_fd)
+        finally:
+            os.close(write_fd)
+        with os.fdopen(read_fd) as infile:
+            received = [events.parse(line) for line in infile]
+
+        assert returncode == 0, output
+        assert p.rusage['ru_maxrss'] > 0, p.rusage
+        assert any('Found 6 images in 2 categories.' in line for line in output), output
+        assert {'event': 'found', 'images': 6, 'categories': 2} in received, received
+        with open(os.path.join(self.directory, 'labels.txt')) as infile:
+            labels = infile.read()
+            assert sorted(labels.split()) == ["cat", "dog"], labels
+
+    def test_random(self):
+        """each run has its own random numbers"""
+        folder = os.path.join(self.directory, 'many')
+        for category in ('cat', 'dog'):
+            os.makedirs(os.path.join(folder, category))
+            for i in xrange(30):
+                open(os.path.join(folder, category, '%d.jpg' % i), 'w').close()
+        shuffled = []
+        for run in xrange(2):
+            p, returncode, output = self.run(self.args(folder, 'labels%d.txt' % run,
+                '--train_file=train%d.txt' % run))
+            assert returncode == 0, output
+            with open(os.path.join(self.directory, 'train%d.txt' % run)) as infile:
+                shuffled.append(infile.read())
+        assert sorted(shuffled[0].split('\n')) == sorted(shuffled[1].split('\n'))
+        assert shuffled[0] != shuffled[1], 'the images were shuffled the same way'
+
+    def test_error(self):
+        """the exit code is returned"""
+        p, returncode, output = self.run(self.args(os.path.join(self.directory, 'missing'), 'labels.txt'))
+        assert returncode == 1, output
+
+    def test_terminate(self):
+        """tools can be stopped with a signal"""
+        # a server which never answers, so the tool waits for it
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        try:
+            url = 'http://127.0.0.1:%d/' % server.getsockname()[1]
+            p = self.pool.popen(self.args(url, 'labels.txt',
+                '--train_file=train.txt'), self.directory)
+            assert p.poll() is None
+            p.terminate()
+            returncode = p.wait(timeout=5)
+        finally:
+            server.close()
+        assert returncode == -signal.SIGTERM, (returncode, p.stdout.read())
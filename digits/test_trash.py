@@ -0,0 +1,59 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tempfile
+
+from . import trash as _
+
+class TestTrash():
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.trash = _.Trash(os.path.join(self.directory, '.trash'),
+                chunk_size=100, pause=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_dir(self, name):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.join(path, 'train_db'))
+        with open(os.path.join(path, 'train_db', 'data.mdb'), 'w') as outfile:
+            outfile.write('x' * 1000)
+        with open(os.path.join(path, 'status.state'), 'w') as outfile:
+            outfile.write('state')
+        return path
+
+    def test_put(self):
+        """directories are moved into the trash"""
+        path = self.make_dir('job')
+        assert self.trash.is_empty()
+        new_path = self.trash.put(path)
+        assert not os.path.exists(path)
+        assert os.path.exists(os.path.join(new_path, 'status.state'))
+
+        # the same name can be deleted again
+        path = self.make_dir('job')
+        other_path = self.trash.put(path)
+        assert other_path != new_path
+        assert len(self.trash.contents()) == 2
+
+    def test_empty(self):
+        """files are removed gradually"""
+        self.trash.put(self.make_dir('a'))
+        self.trash.put(self.make_dir('b'))
+
+        sizes = []
+        def stop():
+            # record the size of the big files each time it's checked
+            sizes.append(sum(os.path.getsize(os.path.join(root, 'data.mdb'))
+                for root, dirs, files in os.walk(self.trash.directory)
+                if 'data.mdb' in files))
+            return len(sizes) > 3
+        assert not self.trash.empty(stop=stop), 'should have stopped early'
+        assert sizes == [2000, 1900, 1800, 1700], sizes
+        assert len(self.trash.contents()) == 2
+
+        assert self.trash.empty()
+        assert self.trash.is_empty()
@@ -413,6 +413,35 @@ class TestWebapp(WebappBaseTest):
         for h in ['Home', 'Datasets', 'Models']:
             assert h in rv.data, 'unexpected page format'
 
+    def test_page_home_paged(self):
+        """home page with page numbers"""
+        rv = self.app.get('/?datasets_page=2&models_page=1')
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        rv = self.app.get('/?models_page=a')
+        assert rv.status_code == 400, 'should return 400 for an invalid page'
+
+    def test_index_json_filters(self):
+        """index.json with filters"""
+        rv = self.app.get('/index.json?limit=5&offset=0&status=done,running&type=model&q=x')
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        assert content['datasets'] == []
+        assert content['limit'] == 5
+        assert 'total' in content
+        for query in ['limit=-1', 'offset=a', 'status=foo', 'type=foo']:
+            rv = self.app.get('/index.json?' + query)
+            assert rv.status_code == 400, '%s should return 400' % query
+
+    def test_delete_jobs(self):
+        """bulk delete"""
+        rv = self.app.post('/jobs/delete')
+        assert rv.status_code == 400, 'should return 400 without job_id'
+        rv = self.app.post('/jobs/delete', data={'job_id': ['foo', 'bar']})
+        assert rv.status_code == 200, 'delete failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        assert content['deleted'] == []
+        assert sorted(content['errors']) == ['bar', 'foo']
+
     def test_invalid_page(self):
         """invalid page"""
         rv = self.app.get('/foo')
@@ -560,6 +589,7 @@ class TestCreatedDataset(WebappBaseTest):
         for image_type in ImageType.TYPES:
             yield self.check_index_json, image_type
             yield self.check_dataset_json, image_type
+            yield self.check_model_graphs, image_type
 
     def check_index_json(self, image_type):
         """created dataset - index.json"""
@@ -580,6 +610,12 @@ class TestCreatedDataset(WebappBaseTest):
         content = json.loads(rv.data)
         assert content['id'] == self.datasets[image_type], 'expected different job_id'
 
+    def check_model_graphs(self, image_type):
+        """created dataset - no model graphs"""
+        for url in ('/models/%s/graph/combined.json', '/models/%s/gpu_history.json'):
+            rv = self.app.get(url % self.datasets[image_type])
+            assert rv.status_code == 404, 'expected 404, not %s' % rv.status_code
+
 class TestModelCreation(WebappBaseTest):
     """
     Model creation tests
@@ -733,6 +769,8 @@ class TestCreatedModel(WebappBaseTest):
             self.check_download(image_type)
             yield self.check_index_json, image_type
             yield self.check_model_json, image_type
+            yield self.check_graph_json, image_type
+            yield self.check_gpu_history_json, image_type
             yield self.check_classify_one, image_type
             yield self.check_classify_one_json, image_type
             yield self.check_classify_many, image_type
@@ -775,6 +813,36 @@ class TestCreatedModel(WebappBaseTest):
         assert content['id'] == self.id_map[image_type].model_id, 'expected different job_id'
         assert len(content['snapshots']) > 0, 'no snapshots in list'
 
+    def check_graph_json(self, image_type):
+        """created model - graph json"""
+        rv = self.app.get('/models/%s/graph/combined.json' % self.id_map[image_type].model_id)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        assert content['data']['columns'], 'no graph data'
+        assert content['counts'], 'no counts'
+        rv = self.app.get('/models/%s/graph/other.json' % self.id_map[image_type].model_id)
+        assert rv.status_code == 404, 'expected 404, not %s' % rv.status_code
+        rv = self.app.get('/models/%s/graph/combined.json?start=0&end=0.5&points=10' % self.id_map[image_type].model_id)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        for column in content['data']['columns']:
+            assert len(column) <= 11, 'too many points'
+        rv = self.app.get('/models/%s/graph/combined.json?points=2' % self.id_map[image_type].model_id)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        rv = self.app.get('/models/%s/graph/combined.json?points=1' % self.id_map[image_type].model_id)
+        assert rv.status_code == 400, 'expected 400, not %s' % rv.status_code
+
+    def check_gpu_history_json(self, image_type):
+        """created model - gpu history json"""
+        rv = self.app.get('/models/%s/gpu_history.json' % self.id_map[image_type].model_id)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        assert 'gpus' in content and 'data' in content, 'missing keys'
+        rv = self.app.get('/models/%s/gpu_history.json?points=2' % self.id_map[image_type].model_id)
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        rv = self.app.get('/models/%s/gpu_history.json?points=x' % self.id_map[image_type].model_id)
+        assert rv.status_code == 400, 'expected 400, not %s' % rv.status_code
+
     def check_classify_one(self, image_type):
         """created model - classify one"""
         category = next(iter(LABELS))
@@ -0,0 +1,294 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import sys
+import json
+import errno
+import signal
+import socket
+import struct
+import itertools
+import _multiprocessing
+
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.socket
+import gevent.subprocess
+
+import digits
+from digits.config import config_value
+from digits.utils.errors import ToolPoolError
+
+TOOLS_DIR = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(digits.__file__))),
+        'tools')
+
+class PooledProcess(object):
+    """
+    A tool running in the ToolPool
+    Provides the parts of Popen which Task.run() uses
+    """
+
+    def __init__(self, stdout):
+        """
+        Arguments:
+        stdout -- a file for reading the output of the tool
+        """
+        self.stdout = stdout
+        self.pid = None
+        self.returncode = None
+        # the rusage from wait4() (a dict with ru_utime, ru_stime, ru_maxrss,
+        #   ru_inblock and ru_oublock)
+        self.rusage = None
+        self.error = None
+        self._started = gevent.event.Event()
+        self._exited = gevent.event.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self._exited.wait(timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.pid is None or self.returncode is not None:
+            return
+        try:
+            os.kill(self.pid, sig)
+        except OSError as e:
+            # exited, but the worker hasn't said so yet
+            if e.errno != errno.ESRCH:
+                raise
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def on_reply(self, reply):
+        if 'error' in reply:
+            self.error = reply['error']
+            self.returncode = -1
+        elif 'returncode' in reply:
+            self.rusage = reply.get('rusage')
+            self.returncode = reply['returncode']
+        else:
+            self.pid = reply['pid']
+        self._started.set()
+        if self.returncode is not None:
+            self._exited.set()
+
+
+class ToolPool(object):
+    """
+    Runs the tools in children forked from a worker process (tools/worker.py)
+    which has already imported them
+
+    Starting a tool this way doesn't start Python, import numpy, PIL, lmdb
+        and caffe or load the config again, which is most of the run time
+        for a small dataset
+    """
+
+    # The tools which the worker imports
+    TOOLS = ('parse_folder', 'create_db')
+    # Seconds to wait for the worker to start a tool
+    START_TIMEOUT = 60
+
+    def __init__(self, tools=None):
+        """
+        Keyword arguments:
+        tools -- overrides TOOLS
+        """
+        self.tools = tuple(tools or self.TOOLS)
+        self._worker = None
+        # set if the worker exited before it was ready
+        self._broken = False
+        self._sock = None
+        self._ready = None
+        self._reader = None
+        self._processes = {}
+        self._ids = itertools.count()
+        self._lock = gevent.lock.Semaphore()
+
+    def tool_name(self, args):
+        """
+        Returns the name of the tool which args would run, or None if the
+        worker can't run it
+
+        Arguments:
+        args -- arguments for Popen (e.g. [sys.executable, tools/parse_folder.py, ...])
+        """
+        if len(args) < 2 or args[0] != sys.executable:
+            return None
+        script = args[1]
+        if os.path.dirname(os.path.abspath(script)) != TOOLS_DIR:
+            return None
+        name, ext = os.path.splitext(os.path.basename(script))
+        if ext != '.py' or name not in self.tools:
+            return None
+        return name
+
+    def can_run(self, args):
+        return self.tool_name(args) is not None
+
+    def start(self):
+        """
+        Start the worker (if it isn't running)
+        """
+        if self._worker is not None:
+            return
+        sock, worker_sock = gevent.socket.socketpair()
+        try:
+            self._worker = gevent.subprocess.Popen([sys.executable,
+                os.path.join(TOOLS_DIR, 'worker.py'),
+                str(worker_sock.fileno())] + list(self.tools),
+                close_fds=True,
+                pass_fds=(worker_sock.fileno(),),
+                )
+        finally:
+            worker_sock.close()
+        self._sock = sock
+        self._ready = gevent.event.Event()
+        self._reader = gevent.spawn(self.read_replies, sock, self._ready)
+
+    def stop(self):
+        """
+        Stop the worker
+        The tools which are running keep running
+        """
+        if self._worker is None:
+            return
+        worker = self._worker
+        # the worker exits when the socket is closed
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._reader.join()
+        worker.wait()
+
+    def popen(self, args, cwd, events_fd=None, priority=None):
+        """
+        Run a tool in the worker
+        Returns a PooledProcess
+
+        Arguments:
+        args -- arguments for Popen (see tool_name())
+        cwd -- the working directory for the tool
+
+        Keyword arguments:
+        events_fd -- the write end of the events pipe (see digits.events)
+        priority -- a ProcessPriority for the tool
+        """
+        name = self.tool_name(args)
+        if name is None:
+            raise ToolPoolError('The tool worker can\'t run "%s"' % ' '.join(args[:2]))
+
+        with self._lock:
+            if self._broken:
+                raise ToolPoolError('The tool worker failed to start')
+            self.start()
+            if not self._ready.wait(self.START_TIMEOUT) or self._worker is None:
+                raise ToolPoolError('The tool worker didn\'t start')
+            read_fd, write_fd = os.pipe()
+            process = PooledProcess(os.fdopen(read_fd, 'rb'))
+            fds = [write_fd]
+            if events_fd is not None:
+                fds.append(events_fd)
+            request_id = next(self._ids)
+            header = json.dumps({
+                'id': request_id,
+                'tool': name,
+                'argv': args[2:],
+                'cwd': cwd,
+                'fds': len(fds),
+                'priority': priority.to_dict() if priority else None,
+                })
+            self._processes[request_id] = process
+            try:
+                self._sock.sendall(struct.pack('!I', len(header)) + header)
+                for fd in fds:
+                    self.send_fd(fd)
+            except (IOError, OSError) as e:
+                self._processes.pop(request_id, None)
+                process.stdout.close()
+                raise ToolPoolError('Lost the tool worker: %s' % e)
+            finally:
+                # only the tool writes to the pipe
+                os.close(write_fd)
+
+        if not process._started.wait(self.START_TIMEOUT):
+            process.stdout.close()
+            raise ToolPoolError('The tool worker didn\'t start "%s"' % name)
+        if process.error is not None:
+            process.stdout.close()
+            raise ToolPoolError(process.error)
+        return process
+
+    def send_fd(self, fd):
+        while True:
+            gevent.socket.wait_write(self._sock.fileno())
+            try:
+                _multiprocessing.sendfd(self._sock.fileno(), fd)
+                return
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def read_replies(self, sock, ready):
+        """
+        Pass the replies from the worker to the PooledProcesses
+        """
+        infile = sock.makefile('rb')
+        try:
+            for line in infile:
+                reply = json.loads(line)
+                if reply.get('ready'):
+                    ready.set()
+                    continue
+                process = self._processes.get(reply['id'])
+                if process is None:
+                    continue
+                process.on_reply(reply)
+                if process.returncode is not None:
+                    del self._processes[reply['id']]
+        except (IOError, ValueError):
+            pass
+        finally:
+            # the worker is gone
+            infile.close()
+            sock.close()
+            if not ready.is_set():
+                self._broken = True
+            ready.set()
+            for process in self._processes.values():
+                process.on_reply({'error': 'the tool worker exited'})
+            self._processes = {}
+            self._worker = None
+            self._sock = None
+
+
+# the ToolPool used by get_pool()
+_pool = None
+
+def get_pool():
+    """
+    Returns the ToolPool for this process, or None if tool workers are
+    disabled
+    """
+    global _pool
+    if not config_value('tool_workers'):
+        return None
+    if _pool is None:
+        _pool = ToolPool()
+    return _pool
+
+def stop_pool():
+    """
+    Stop the worker of the ToolPool (if it was started)
+    """
+    if _pool is not None:
+        _pool.stop()
@@ -0,0 +1,122 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import errno
+import shutil
+
+import gevent
+
+class Trash(object):
+    """
+    A directory which deleted jobs are moved into
+
+    Moving a job directory into the trash is a rename, so it returns
+        immediately no matter how large the job is
+    The files are removed later by empty(), a little at a time so that the
+        server keeps responding while a large dataset is deleted
+    """
+
+    # Bytes cut from the end of a large file at a time
+    CHUNK_SIZE = 2**30
+    # Seconds to wait between chunks (so that other IO can get through)
+    PAUSE = 0.01
+
+    def __init__(self, directory, chunk_size=None, pause=None):
+        """
+        Arguments:
+        directory -- where to keep the deleted files (must be on the same
+            filesystem as the directories which are deleted)
+
+        Keyword arguments:
+        chunk_size -- overrides CHUNK_SIZE
+        pause -- overrides PAUSE
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.pause = self.PAUSE if pause is None else pause
+
+    def put(self, path):
+        """
+        Move a directory into the trash
+        Returns the new path, or None if it had to be removed right away
+        (e.g. because it's on another filesystem)
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        # make the name unique in case the same path is deleted again
+        new_path = os.path.join(self.directory, '%s.%s' % (
+            os.path.basename(os.path.normpath(path)), os.urandom(4).encode('hex')))
+        try:
+            os.rename(path, new_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.rmtree(path)
+            return None
+        return new_path
+
+    def contents(self):
+        """
+        Returns the paths in the trash
+        """
+        if not os.path.exists(self.directory):
+            return []
+        return [os.path.join(self.directory, name)
+                for name in sorted(os.listdir(self.directory))]
+
+    def is_empty(self):
+        return not self.contents()
+
+    def empty(self, stop=None):
+        """
+        Remove everything in the trash
+        Returns True if the trash is empty
+
+        Keyword arguments:
+        stop -- a function which returns True if the removal should stop
+            early (checked between chunks)
+        """
+        for path in self.contents():
+            if not self.remove(path, stop):
+                return False
+        return True
+
+    def remove(self, path, stop=None):
+        """
+        Remove a path from the trash gradually
+        Returns False if stopped before it was removed
+
+        Keyword arguments:
+        stop -- see empty()
+        """
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    if not self._remove_file(os.path.join(root, name), stop):
+                        return False
+                for name in dirs:
+                    subdir = os.path.join(root, name)
+                    if os.path.islink(subdir):
+                        os.remove(subdir)
+                    else:
+                        os.rmdir(subdir)
+            os.rmdir(path)
+            return True
+        return self._remove_file(path, stop)
+
+    def _remove_file(self, filename, stop):
+        if not os.path.islink(filename):
+            size = os.path.getsize(filename)
+            # freeing the blocks of a huge file at once can stall the disk
+            while size > self.chunk_size:
+                if stop is not None and stop():
+                    return False
+                size -= self.chunk_size
+                with open(filename, 'r+b') as f:
+                    f.truncate(size)
+                gevent.sleep(self.pause)
+        if stop is not None and stop():
+            return False
+        os.remove(filename)
+        gevent.sleep(0)
+        return True
@@ -2,14 +2,18 @@
 
 import os
 import math
+import errno
 import fcntl
 import locale
 from random import uniform
 from urlparse import urlparse
-from io import BlockingIOError
 import inspect
 
+import gevent.socket
+
 HTTP_TIMEOUT = 6.05
+# Bytes read from a pipe at a time by readlines()
+READ_SIZE = 65536
 
 def is_url(url):
     return url is not None and urlparse(url).scheme != ""
@@ -18,49 +22,56 @@ def wait_time():
     """Wait a random number of seconds"""
     return uniform(0.3, 0.5)
 
-# From http://code.activestate.com/recipes/578900-non-blocking-readlines/
-def nonblocking_readlines(f):
-    """Generator which yields lines from F (a file object, used only for
-       its fileno()) without blocking.  If there is no data, you get an
-       endless stream of empty strings until there is data again (caller
-       is expected to sleep for a while).
-       Newlines are normalized to the Unix standard.
+def readlines(f, timeout=None):
+    """
+    Generator which yields lists of lines read from F (a file object, used
+       only for its fileno()) as they become available.
+    Only the current greenlet waits for data, so an idle pipe costs nothing,
+       and every complete line which has arrived is returned at once.
+    If nothing arrives for TIMEOUT seconds, an empty list is yielded (so
+       that the caller can check on other things).
+    Newlines are normalized to the Unix standard and removed.
+    Stops at the end of the file.
     """
     fd = f.fileno()
     fl = fcntl.fcntl(fd, fcntl.F_GETFL)
     fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
     enc = locale.getpreferredencoding(False)
 
-    buf = bytearray()
+    buf = ''
     while True:
         try:
-            block = os.read(fd, 8192)
-        except (BlockingIOError, OSError):
-            yield ""
+            gevent.socket.wait_read(fd, timeout)
+        except gevent.socket.timeout:
+            yield []
             continue
+        try:
+            block = os.read(fd, READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                continue
+            raise
 
         if not block:
+            buf = buf.rstrip('\r')
             if buf:
-                yield buf.decode(enc)
-                buf.clear()
-            break
-
-        buf.extend(block)
-
-        while True:
-            r = buf.find(b'\r')
-            n = buf.find(b'\n')
-            if r == -1 and n == -1: break
-
-            if r == -1 or r > n:
-                yield buf[:(n+1)].decode(enc)
-                buf = buf[(n+1):]
-            elif n == -1 or n > r:
-                yield buf[:r].decode(enc) + '\n'
-                if n == r+1:
-                    buf = buf[(r+2):]
-                else:
-                    buf = buf[(r+1):]
+                yield [buf.decode(enc)]
+            return
+
+        buf += block
+        if '\r' in buf:
+            # keep a trailing '\r' in case the '\n' is in the next block
+            hold = buf.endswith('\r')
+            if hold:
+                buf = buf[:-1]
+            buf = buf.replace('\r\n', '\n').replace('\r', '\n')
+            if hold:
+                buf += '\r'
+        end = buf.rfind('\n')
+        if end >= 0:
+            lines = buf[:end].decode(enc).split('\n')
+            buf = buf[end+1:]
+            yield lines
 
 def subclass(cls):
     """
@@ -88,6 +99,24 @@ def override(method):
     method.override = True
     return method
 
+def dir_size(path):
+    """
+    Returns the number of bytes used by the files in a directory tree
+    (symlinks aren't followed)
+
+    Arguments:
+    path -- the directory
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                # deleted meanwhile
+                pass
+    return total
+
 def sizeof_fmt(size, suffix='B'):
     """
     Return a human-readable string representation of a filesize
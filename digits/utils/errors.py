@@ -17,3 +17,15 @@ class LoadImageError(DigitsError):
     Errors that occur while loading an image
     """
     pass
+
+class ArchiveError(DigitsError):
+    """
+    Errors that occur when archiving or restoring a job
+    """
+    pass
+
+class ToolPoolError(DigitsError):
+    """
+    Errors that occur when running a tool in the tool worker
+    """
+    pass
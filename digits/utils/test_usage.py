@@ -0,0 +1,95 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import shutil
+import tempfile
+
+from . import usage as _
+
+class TestReadProc():
+
+    def setUp(self):
+        self.proc_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.proc_dir, '42'))
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_dir)
+
+    def write(self, name, contents):
+        with open(os.path.join(self.proc_dir, '42', name), 'w') as outfile:
+            outfile.write(contents)
+
+    def test_read(self):
+        """CPU time, peak memory and IO are read"""
+        ticks = _.CLOCK_TICKS
+        self.write('stat', '42 (a (strange) name) S 1 42 42 0 -1 4194304 100 0 0 0 %d %d %d %d 20 0 1 0 100 1000 100\n'
+                % (2 * ticks, ticks, ticks, 0))
+        self.write('status', 'Name:\tpython\nVmPeak:\t  9000 kB\nVmHWM:\t  2048 kB\nVmRSS:\t  1024 kB\n')
+        self.write('io', 'rchar: 100\nwchar: 200\nsyscr: 1\nsyscw: 2\nread_bytes: 4096\nwrite_bytes: 8192\ncancelled_write_bytes: 0\n')
+        assert _.read_proc(42, proc_dir=self.proc_dir) == {
+                'user_time': 3.0,
+                'system_time': 1.0,
+                'max_rss': 2048 * 1024,
+                'read_bytes': 4096,
+                'write_bytes': 8192,
+                }
+
+    def test_missing(self):
+        """unreadable files are skipped"""
+        self.write('status', 'Name:\tpython\nState:\tZ (zombie)\n')
+        assert _.read_proc(42, proc_dir=self.proc_dir) == {}
+        assert _.read_proc(43, proc_dir=self.proc_dir) == {}
+
+
+class TestResourceUsage():
+
+    def test_update(self):
+        """the samples only increase"""
+        usage = _.ResourceUsage()
+        usage.update({'user_time': 2, 'max_rss': 1000})
+        usage.update({'user_time': 1, 'read_bytes': 10})
+        d = usage.json_dict()
+        assert d['user_time'] == 2
+        assert d['max_rss'] == 1000
+        assert d['read_bytes'] == 10
+
+    def test_rusage(self):
+        """the rusage replaces the samples"""
+        usage = _.ResourceUsage()
+        usage.update({'user_time': 2, 'max_rss': 4096, 'read_bytes': 10})
+        usage.add_rusage({'ru_utime': 1.5, 'ru_stime': 0.5, 'ru_maxrss': 2})
+        usage.finish()
+        d = usage.json_dict()
+        assert d['user_time'] == 1.5
+        assert d['system_time'] == 0.5
+        assert d['max_rss'] == 2048
+        assert d['read_bytes'] == 10
+        assert d['wall_time'] >= 0
+
+    def test_blocks(self):
+        """the I/O is read from the rusage if it's there"""
+        usage = _.ResourceUsage()
+        usage.add_rusage({'ru_utime': 1, 'ru_stime': 0, 'ru_maxrss': 2,
+            'ru_inblock': 3, 'ru_oublock': 4})
+        d = usage.json_dict()
+        assert (d['max_rss'], d['read_bytes'], d['write_bytes']) == (2048, 1536, 2048)
+
+
+class TestUsageReport():
+
+    def test_read(self):
+        """lines are read as they arrive"""
+        read_fd, write_fd = os.pipe()
+        report = _.UsageReport(read_fd)
+        try:
+            report.read()
+            os.write(write_fd, '{"pid": 4')
+            report.read()
+            assert report.pid is None
+            os.write(write_fd, '2}\n{"ru_utime": 1, "ru_stime": 0, "ru_maxrss": 2}\n')
+            os.close(write_fd)
+            report.read()
+            assert report.pid == 42
+            assert report.rusage['ru_maxrss'] == 2
+        finally:
+            report.close()
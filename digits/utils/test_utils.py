@@ -0,0 +1,45 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+
+import gevent
+
+from . import readlines
+
+class TestReadlines():
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.infile = os.fdopen(self.read_fd, 'rb')
+
+    def tearDown(self):
+        self.infile.close()
+        try:
+            os.close(self.write_fd)
+        except OSError:
+            pass
+
+    def test_lines(self):
+        """complete lines are yielded together"""
+        os.write(self.write_fd, 'one\ntwo\r\nthree\rfo')
+        reader = readlines(self.infile)
+        assert next(reader) == ['one', 'two', 'three']
+        os.write(self.write_fd, 'ur\r')
+        os.write(self.write_fd, '\nfive')
+        lines = next(reader)
+        if not lines:
+            # the second write arrived separately
+            lines = next(reader)
+        assert lines == ['four'], lines
+        os.close(self.write_fd)
+        assert list(reader) == [['five']]
+
+    def test_timeout(self):
+        """an empty list is yielded when nothing arrives"""
+        reader = readlines(self.infile, timeout=0.01)
+        assert next(reader) == []
+        gevent.spawn_later(0.05, os.write, self.write_fd, 'late\n')
+        lines = []
+        while not lines:
+            lines = next(reader)
+        assert lines == ['late']
@@ -0,0 +1,198 @@
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import os
+import json
+import time
+import errno
+import fcntl
+
+PROC_DIR = '/proc'
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+def read_proc(pid, proc_dir=None):
+    """
+    Returns what a process has used so far according to /proc/<pid>
+    Returns a dict with any of: user_time, system_time, max_rss, read_bytes,
+        write_bytes (the files which can't be read are skipped)
+
+    Arguments:
+    pid -- the process ID
+
+    Keyword arguments:
+    proc_dir -- overrides PROC_DIR
+    """
+    directory = os.path.join(proc_dir or PROC_DIR, str(pid))
+    values = {}
+
+    try:
+        with open(os.path.join(directory, 'stat')) as infile:
+            # the name can contain spaces, so start after it
+            fields = infile.read().rsplit(')', 1)[1].split()
+        # utime, stime, cutime and cstime (fields 14-17)
+        utime, stime, cutime, cstime = [int(f) for f in fields[11:15]]
+        values['user_time'] = float(utime + cutime) / CLOCK_TICKS
+        values['system_time'] = float(stime + cstime) / CLOCK_TICKS
+    except (IOError, IndexError, ValueError):
+        pass
+
+    try:
+        with open(os.path.join(directory, 'status')) as infile:
+            for line in infile:
+                if line.startswith('VmHWM:'):
+                    # peak resident set size in kB
+                    values['max_rss'] = int(line.split()[1]) * 1024
+                    break
+    except (IOError, IndexError, ValueError):
+        pass
+
+    try:
+        with open(os.path.join(directory, 'io')) as infile:
+            for line in infile:
+                key, _, value = line.partition(':')
+                if key in ('read_bytes', 'write_bytes'):
+                    values[key] = int(value)
+    except (IOError, ValueError):
+        pass
+
+    return values
+
+
+class ResourceUsage(object):
+    """
+    What the process of a Task has cost
+    Sampled from /proc while it runs, then replaced with the rusage which
+        wait4() returned when it exited (see add_rusage), which is exact
+        however short the process was
+    """
+
+    FIELDS = ('wall_time', 'user_time', 'system_time', 'max_rss',
+            'read_bytes', 'write_bytes')
+
+    def __init__(self):
+        self.start_time = time.time()
+        # seconds
+        self.wall_time = 0
+        self.user_time = 0
+        self.system_time = 0
+        # bytes
+        self.max_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+    def update(self, values):
+        """
+        Update with values which only increase while a process runs
+        (e.g. from read_proc)
+        """
+        for key, value in values.iteritems():
+            if value > getattr(self, key):
+                setattr(self, key, value)
+        self.wall_time = time.time() - self.start_time
+
+    def sample(self, pid):
+        """
+        Update from /proc/<pid>
+        """
+        self.update(read_proc(pid))
+
+    def add_rusage(self, rusage):
+        """
+        Replace the samples with the rusage which wait4() returned for the
+        process (the values which it doesn't have are kept)
+
+        Arguments:
+        rusage -- a resource.struct_rusage, or a dict with ru_utime,
+            ru_stime and ru_maxrss (and optionally ru_inblock and ru_oublock)
+        """
+        if not isinstance(rusage, dict):
+            rusage = dict((key, getattr(rusage, key))
+                    for key in ('ru_utime', 'ru_stime', 'ru_maxrss', 'ru_inblock', 'ru_oublock'))
+        values = {
+            'user_time': rusage['ru_utime'],
+            'system_time': rusage['ru_stime'],
+            # kB on Linux
+            'max_rss': rusage['ru_maxrss'] * 1024,
+            }
+        # blocks of 512 bytes (the read_bytes and write_bytes of /proc/<pid>/io)
+        if 'ru_inblock' in rusage:
+            values['read_bytes'] = rusage['ru_inblock'] * 512
+        if 'ru_oublock' in rusage:
+            values['write_bytes'] = rusage['ru_oublock'] * 512
+        for key, value in values.iteritems():
+            setattr(self, key, value)
+        self.wall_time = time.time() - self.start_time
+
+    def finish(self):
+        """
+        Called when the process has exited
+        """
+        self.wall_time = time.time() - self.start_time
+
+    def cpu_time(self):
+        return self.user_time + self.system_time
+
+    def json_dict(self):
+        """
+        Returns a dict used for a JSON representation
+        """
+        return dict((key, getattr(self, key)) for key in self.FIELDS)
+
+
+class UsageReport(object):
+    """
+    Reads what tools/report_usage.py writes about the command it runs:
+        a line of JSON with its pid once it has started, and a line with
+        its rusage once it has exited
+    Never blocks (the pipe is non-blocking)
+    """
+
+    def __init__(self, fd):
+        """
+        Arguments:
+        fd -- the read end of the pipe
+        """
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.fd = fd
+        self.pid = None
+        # a dict with ru_utime, ru_stime, ru_maxrss, ru_inblock and ru_oublock
+        self.rusage = None
+        self._buffer = ''
+
+    def read(self):
+        """
+        Read the lines which have been written so far
+        """
+        if self.fd is None:
+            return
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                break
+            self._buffer += data
+        lines = self._buffer.split('\n')
+        # keep a partial line for later
+        self._buffer = lines.pop()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'pid' in record:
+                self.pid = record['pid']
+            else:
+                self.rusage = record
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
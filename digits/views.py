@@ -7,11 +7,12 @@ import traceback
 import flask
 from werkzeug import HTTP_STATUS_CODES
 import werkzeug.exceptions
-from flask.ext.socketio import join_room, leave_room
+from flask.ext.socketio import join_room, leave_room, emit
 
 from . import dataset, model
 from config import config_value
-from webapp import app, socketio, scheduler, autodoc
+from status import Status
+from webapp import app, socketio, rooms, scheduler, autodoc
 import dataset.views
 import model.views
 from digits.utils import errors
@@ -30,18 +31,28 @@ def home():
             datasets: [{id, name, status},...],
             models: [{id, name, status},...]
         }
+
+    The JSON can be filtered and paged with these arguments:
+        limit -- return at most this many jobs (newest first)
+        offset -- skip this many jobs
+        status -- comma-separated statuses (e.g. "Done,Error")
+        type -- "dataset" or "model"
+        q -- only return jobs whose name, id or user contains this
+    Then "total" is the number of jobs which match (without limit/offset)
+
+    The page shows 10 completed jobs of each type, paged with the
+    datasets_page and models_page arguments
     """
-    running_datasets    = get_job_list(dataset.DatasetJob, True)
-    completed_datasets  = get_job_list(dataset.DatasetJob, False)
-    running_models      = get_job_list(model.ModelJob, True)
-    completed_models    = get_job_list(model.ModelJob, False)
+    if request_wants_json() and any(arg in flask.request.args for arg in CATALOG_ARGS):
+        return flask.jsonify(query_catalog(flask.request.args))
 
+    catalog = scheduler.jobs.catalog
     if request_wants_json():
         return flask.jsonify({
-            'datasets': [j.json_dict()
-                for j in running_datasets + completed_datasets],
-            'models': [j.json_dict()
-                for j in running_models + completed_models],
+            'datasets': [catalog.json_dict(r)
+                for r in get_job_rows('dataset', True) + get_job_rows('dataset', False)],
+            'models': [catalog.json_dict(r)
+                for r in get_job_rows('model', True) + get_job_rows('model', False)],
             })
     else:
         new_dataset_options = [
@@ -63,21 +74,115 @@ def home():
                     ])
                 ]
 
+        # the completed jobs are paged with ?datasets_page=n&models_page=n
+        pages = {}
+        for job_type in ['dataset', 'model']:
+            count = catalog.count(job_type=job_type, running=False, archived=False)
+            pages[job_type] = {
+                    'number': non_negative_arg(flask.request.args, '%ss_page' % job_type) or 1,
+                    'count': max(1, (count + HOME_PAGE_SIZE - 1) // HOME_PAGE_SIZE),
+                    }
+
         return flask.render_template('home.html',
                 new_dataset_options = new_dataset_options,
-                running_datasets    = running_datasets,
-                completed_datasets  = completed_datasets,
+                running_datasets    = home_entries(get_job_rows('dataset', True)),
+                completed_datasets  = home_entries(get_job_rows('dataset', False, pages['dataset']['number'])),
+                datasets_page       = pages['dataset'],
                 new_model_options   = new_model_options,
-                running_models      = running_models,
-                completed_models    = completed_models,
+                running_models      = home_entries(get_job_rows('model', True)),
+                completed_models    = home_entries(get_job_rows('model', False, pages['model']['number'])),
+                models_page         = pages['model'],
                 )
 
-def get_job_list(cls, running):
-    return sorted(
-            [j for j in scheduler.jobs if isinstance(j, cls) and j.status.is_running() == running],
-            key=lambda j: j.status_history[0][1],
-            reverse=True,
-            )
+# Completed jobs of each type on a page of the home page
+HOME_PAGE_SIZE = 10
+
+def get_job_rows(job_type, running, page=None):
+    """
+    Returns the catalog rows of the jobs which aren't archived (newest first)
+
+    Arguments:
+    job_type -- "dataset" or "model"
+    running -- filter on Status.is_running()
+
+    Keyword arguments:
+    page -- if set, only return this page of HOME_PAGE_SIZE rows (from 1)
+    """
+    if page is None:
+        limit, offset = None, 0
+    else:
+        limit, offset = HOME_PAGE_SIZE, (page - 1) * HOME_PAGE_SIZE
+    return scheduler.jobs.catalog.query(job_type=job_type, running=running,
+            archived=False, limit=limit, offset=offset)
+
+def home_entries(rows):
+    """
+    Returns a dict for each catalog row with what home.html shows about the job
+    """
+    return [{
+        'id': row['id'],
+        'name': row['name'],
+        'status': Status(row['status']),
+        'created': row['created'],
+        'updated': row['updated'] or row['created'],
+        } for row in rows]
+
+# Arguments for /index.json which are served from the JobCatalog
+CATALOG_ARGS = ['limit', 'offset', 'status', 'type', 'q']
+
+def query_catalog(args):
+    """
+    Returns the JSON for /index.json filtered with the CATALOG_ARGS
+
+    Arguments:
+    args -- the request arguments
+    """
+    limit = non_negative_arg(args, 'limit')
+    offset = non_negative_arg(args, 'offset') or 0
+
+    status = None
+    if args.get('status'):
+        status = []
+        for s in args['status'].split(','):
+            s = s.strip().lower()
+            for val in [Status.INIT, Status.WAIT, Status.RUN, Status.DONE, Status.ABORT, Status.ERROR]:
+                if s in (val.lower(), Status(val).name.lower()):
+                    status.append(val)
+                    break
+            else:
+                raise werkzeug.exceptions.BadRequest('Unknown status "%s"' % s)
+
+    job_type = args.get('type') or None
+    if job_type is not None:
+        job_type = job_type.lower().rstrip('s')
+        if job_type not in ['dataset', 'model']:
+            raise werkzeug.exceptions.BadRequest('Unknown type "%s"' % args['type'])
+
+    q = args.get('q') or None
+    catalog = scheduler.jobs.catalog
+    rows = catalog.query(job_type=job_type, status=status, q=q, limit=limit, offset=offset)
+    return {
+            'datasets': [catalog.json_dict(r) for r in rows if r['type'] == 'dataset'],
+            'models': [catalog.json_dict(r) for r in rows if r['type'] == 'model'],
+            'total': catalog.count(job_type=job_type, status=status, q=q),
+            'offset': offset,
+            'limit': limit,
+            }
+
+def non_negative_arg(args, name):
+    """
+    Returns an integer request argument or None if it's missing
+    """
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise werkzeug.exceptions.BadRequest('Invalid %s "%s"' % (name, args[name]))
+    return value
 
 
 ### Jobs routes
@@ -111,8 +216,33 @@ def edit_job(job_id):
 
     old_name = job.name()
     job._name = flask.request.form['job_name']
+    job.mark_dirty()
+    scheduler.jobs.update(job)
     return 'Changed job name from "%s" to "%s"' % (old_name, job.name())
 
+@app.route('/jobs/<job_id>/priority', methods=['POST'])
+@autodoc('jobs')
+def set_job_priority(job_id):
+    """
+    Change the priority of a job
+    Jobs with a higher priority are started first
+    """
+    job = scheduler.get_job(job_id)
+    if job is None:
+        raise werkzeug.exceptions.NotFound('Job not found')
+
+    try:
+        priority = int(flask.request.form['priority'])
+    except (KeyError, ValueError):
+        raise werkzeug.exceptions.BadRequest('Missing or invalid priority')
+    if priority not in [value for value, _ in job.PRIORITY_CHOICES]:
+        raise werkzeug.exceptions.BadRequest('Unknown priority %d' % priority)
+
+    job.priority = priority
+    job.mark_dirty()
+    scheduler.jobs.update(job)
+    return flask.jsonify(job.json_dict())
+
 @app.route('/datasets/<job_id>/status', methods=['GET'])
 @app.route('/models/<job_id>/status', methods=['GET'])
 @app.route('/jobs/<job_id>/status', methods=['GET'])
@@ -140,18 +270,42 @@ def delete_job(job_id):
     """
     Deletes a job
     """
-    job = scheduler.get_job(job_id)
-    if job is None:
+    # don't restore an archived job just to delete it
+    if scheduler.jobs.peek(job_id) is None and not scheduler.jobs.is_archived(job_id):
         raise werkzeug.exceptions.NotFound('Job not found')
 
     try:
         if scheduler.delete_job(job_id):
+            rooms.forget(job_id)
             return 'Job deleted.'
         else:
             raise werkzeug.exceptions.Forbidden('Job not deleted')
     except errors.DeleteError as e:
         raise werkzeug.exceptions.Forbidden(str(e))
 
+@app.route('/jobs/delete.json', methods=['POST'])
+@app.route('/jobs/delete', methods=['POST'])
+@autodoc(['jobs', 'api'])
+def delete_jobs():
+    """
+    Deletes several jobs at once (given as job_id arguments)
+
+    Returns JSON: {deleted:[],errors:{job_id:message}}
+    """
+    job_ids = flask.request.form.getlist('job_id') or flask.request.args.getlist('job_id')
+    if not job_ids:
+        raise werkzeug.exceptions.BadRequest('job_id is a required field')
+
+    results = scheduler.delete_jobs([str(job_id) for job_id in job_ids])
+    for job_id, error in results.iteritems():
+        if error is None:
+            rooms.forget(job_id)
+    return flask.jsonify({
+        'deleted': [job_id for job_id in job_ids if results[job_id] is None],
+        'errors': dict((job_id, error) for job_id, error in results.iteritems()
+            if error is not None),
+        })
+
 @app.route('/datasets/<job_id>/abort', methods=['POST'])
 @app.route('/models/<job_id>/abort', methods=['POST'])
 @app.route('/jobs/<job_id>/abort', methods=['POST'])
@@ -169,6 +323,24 @@ def abort_job(job_id):
     else:
         raise werkzeug.exceptions.Forbidden('Job not aborted')
 
+@app.route('/datasets/<job_id>/archive', methods=['POST'])
+@app.route('/models/<job_id>/archive', methods=['POST'])
+@app.route('/jobs/<job_id>/archive', methods=['POST'])
+@autodoc('jobs')
+def archive_job(job_id):
+    """
+    Compresses a finished job and unloads it
+    The job is restored the next time it is opened
+    """
+    if scheduler.jobs.peek(job_id) is None:
+        raise werkzeug.exceptions.NotFound('Job not found')
+
+    try:
+        scheduler.archive_job(job_id)
+    except errors.ArchiveError as e:
+        raise werkzeug.exceptions.Forbidden(str(e))
+    return 'Job archived.'
+
 ### Error handling
 
 @app.errorhandler(Exception)
@@ -269,16 +441,20 @@ def on_disconnect():
     """
     Somebody disconnected from a jobs page
     """
-    pass
+    rooms.leave_all(socketio_client())
 
 @socketio.on('join', namespace='/jobs')
 def on_join(data):
     """
     Somebody joined a room
+    Sends them the last updates for the room
     """
     room = data['room']
     join_room(room)
     flask.session['room'] = room
+    rooms.join(room, socketio_client())
+    for event, message in rooms.snapshot(room):
+        emit(event, message)
 
 @socketio.on('leave', namespace='/jobs')
 def on_leave():
@@ -290,4 +466,10 @@ def on_leave():
         del flask.session['room']
         #print '>>> Somebody left room %s' % room
         leave_room(room)
+        rooms.leave(room, socketio_client())
 
+def socketio_client():
+    """
+    Returns an id for the SocketIO client of the current request
+    """
+    return flask.request.namespace.socket.sessid
@@ -6,6 +6,7 @@ from flask.ext.socketio import SocketIO
 from digits import utils
 from config import config_value
 import digits.scheduler
+import digits.rooms
 
 ### Create Flask, Scheduler and SocketIO objects
 
@@ -17,6 +18,8 @@ app.config['WTF_CSRF_ENABLED'] = False
 app.config['SECRET_KEY'] = config_value('secret_key')
 app.url_map.redirect_defaults = False
 socketio = SocketIO(app)
+# clients in the SocketIO rooms of the /jobs namespace
+rooms = digits.rooms.RoomTracker()
 scheduler = digits.scheduler.Scheduler(config_value('gpu_list'))
 
 # Set up flask API documentation, if installed
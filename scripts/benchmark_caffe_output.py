@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+"""
+Measures how quickly recorded caffe logs (caffe_output.log in a model's job
+    directory) are parsed
+
+Compares digits.model.tasks.caffe_output with the parser which it replaced
+    (one uncompiled regex per kind of message, strptime on every line and a
+    scan of the network for each net output)
+"""
+
+import sys
+import os.path
+import re
+import time
+import argparse
+
+try:
+    import digits
+except ImportError:
+    # Add path for DIGITS package
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import digits.config; digits.config.load_config()
+from digits.model.tasks import caffe_output
+
+# the network is unknown, so make the layer scan about as long as LeNet's
+LAYER_TOPS = [['data', 'label'], ['conv1'], ['pool1'], ['conv2'], ['pool2'],
+        ['ip1'], ['ip1'], ['ip2'], ['accuracy'], ['loss']]
+LAYER_TYPES = dict((top, '?') for tops in LAYER_TOPS for top in tops)
+
+def legacy_parse(line):
+    float_exp = '(NaN|[-+]?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?)'
+    match = re.match(r'(\w)(\d{4} \S{8}).*]\s+(\S.*)$', line)
+    if not match:
+        return
+    timestr = '%s%s' % (time.strftime('%Y'), match.group(2))
+    time.mktime(time.strptime(timestr, '%Y%m%d %H:%M:%S'))
+    message = match.group(3)
+    re.match(r'Iteration (\d+)', message)
+    match = re.match(r'(Train|Test) net output #(\d+): (\S*) = %s' % float_exp, message, flags=re.IGNORECASE)
+    if match:
+        name = match.group(3)
+        for tops in LAYER_TOPS:
+            if name in tops:
+                break
+        return
+    if re.match(r'Iteration (\d+).*lr = %s' % float_exp, message, flags=re.IGNORECASE):
+        return
+    if re.match(r'Snapshotting to (.*)\s*$', message):
+        return
+    re.match(r'Memory required for data:\s+(\d+)', message)
+
+def fast_parse(line):
+    level, message = caffe_output.parse_line(line)
+    if not message:
+        return
+    parsed = caffe_output.parse_message(message)
+    if parsed and parsed[0] == caffe_output.NET_OUTPUT:
+        LAYER_TYPES.get(parsed[1][2], '?')
+
+def benchmark(parse, lines, repeat):
+    """
+    Returns the best time taken to parse all of the lines
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for line in lines:
+            parse(line)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Caffe output parsing benchmark')
+    parser.add_argument('logs', nargs='+',
+            help='caffe_output.log files from model job directories')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='how many times to parse each log')
+    args = vars(parser.parse_args())
+
+    lines = []
+    for filename in args['logs']:
+        with open(filename) as infile:
+            lines.extend(line.strip() for line in infile if line.strip())
+    if not lines:
+        parser.error('the logs are empty')
+
+    print '%d lines' % len(lines)
+    results = []
+    for name, parse in (('legacy', legacy_parse), ('fast', fast_parse)):
+        elapsed = benchmark(parse, lines, args['repeat'])
+        results.append(elapsed)
+        print '%-8s %8.3f s %12.0f lines/s' % (name, elapsed, len(lines) / max(elapsed, 1e-9))
+    print 'speedup: %.1fx' % (results[0] / max(results[1], 1e-9))
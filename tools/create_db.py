@@ -19,7 +19,7 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import digits.config
 digits.config.load_config()
-from digits import utils, log
+from digits import utils, log, events
 
 import numpy as np
 import PIL.Image
@@ -81,6 +81,9 @@ class DbCreator:
             shuffle     = True,
             mean_files  = None,
             encoding    = 'none',
+            read_threads    = 10,
+            write_threads   = 10,
+            batch_size      = 100,
             ):
         """
         Read an input file and create a database from the specified image/label pairs
@@ -98,6 +101,9 @@ class DbCreator:
         shuffle -- shuffle images before saving
         mean_files -- an array of mean files to save (can be empty)
         encoding -- 'none', 'png' or 'jpg'
+        read_threads -- threads reading images (1 if not shuffle)
+        write_threads -- threads writing to the database (1 if not shuffle)
+        batch_size -- how many records each write thread adds at a time
         """
         ### Validate input
 
@@ -139,6 +145,12 @@ class DbCreator:
         if encoding not in ['none', 'png', 'jpg']:
             raise ValueError('Unsupported encoding format "%s"' % encoding)
         self.encoding = encoding
+        if read_threads <= 0 or write_threads <= 0:
+            logger.error('unsupported number of threads')
+            return False
+        if batch_size <= 0:
+            logger.error('unsupported batch_size')
+            return False
 
         ### Start working
 
@@ -150,10 +162,6 @@ class DbCreator:
             # This obviously hurts performance considerably
             read_threads = 1
             write_threads = 1
-        else:
-            read_threads = 10
-            write_threads = 10
-        batch_size = 100
 
         total_images_added = 0
         total_image_sum = None
@@ -199,6 +207,7 @@ class DbCreator:
 
         for key in sorted(lines_per_category):
             logger.debug('Category %s has %d images.' % (key, lines_per_category[key]))
+            events.emit('category', label=key, count=lines_per_category[key])
 
         # Start read threads
         for i in xrange(read_threads):
@@ -225,7 +234,9 @@ class DbCreator:
 
             # Send update every 2 seconds
             if time.time() - wait_time > 2:
-                logger.debug('Processed %d/%d' % (lines_read - self.read_queue.qsize(), lines_read))
+                processed = lines_read - self.read_queue.qsize()
+                logger.debug('Processed %d/%d' % (processed, lines_read))
+                events.emit('progress', done=processed, total=lines_read)
                 #print '\tRead queue size: %d' % self.read_queue.qsize()
                 #print '\tWrite queue size: %d' % self.write_queue.qsize()
                 #print '\tRead threads done: %d' % read_threads_done
@@ -299,6 +310,7 @@ class DbCreator:
 
         logger.info('Database created after %d seconds.' % (time.time() - start))
         logger.info('Total images added: %d' % total_images_written)
+        events.emit('result', entries=total_images_written)
 
         self.shutdown.set()
         return True
@@ -487,7 +499,14 @@ class DbCreator:
             self.keys_lock.release()
         return range(i, i+num)
 
-if __name__ == '__main__':
+def main(argv=None):
+    """
+    Runs the tool with command line arguments
+    Returns the exit code
+
+    Keyword arguments:
+    argv -- the arguments (default: sys.argv[1:])
+    """
     parser = argparse.ArgumentParser(description='Create-Db tool - DIGITS')
 
     ### Positional arguments
@@ -532,8 +551,23 @@ if __name__ == '__main__':
             default = 'none',
             help = 'Choose encoding format ("jpg", "png" or "none" [default])'
             )
+    parser.add_argument('--read_threads',
+            type=int,
+            default=10,
+            help='threads reading images, ignored without --shuffle [default=10]'
+            )
+    parser.add_argument('--write_threads',
+            type=int,
+            default=10,
+            help='threads writing to the database, ignored without --shuffle [default=10]'
+            )
+    parser.add_argument('--batch_size',
+            type=int,
+            default=100,
+            help='records added to the database at a time [default=100]'
+            )
 
-    args = vars(parser.parse_args())
+    args = vars(parser.parse_args(argv))
 
     db = DbCreator(args['db_name'],
             backend=args['backend'])
@@ -545,8 +579,14 @@ if __name__ == '__main__':
             shuffle         = args['shuffle'],
             mean_files      = args['mean_file'],
             encoding        = args['encoding'],
+            read_threads    = args['read_threads'],
+            write_threads   = args['write_threads'],
+            batch_size      = args['batch_size'],
             ):
-        sys.exit(0)
+        return 0
     else:
-        sys.exit(1)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
 
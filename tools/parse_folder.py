@@ -19,7 +19,7 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import digits.config
 digits.config.load_config()
-from digits import utils, log
+from digits import utils, log, events
 
 logger = logging.getLogger('digits.tools.parse_folder')
 
@@ -433,6 +433,7 @@ def parse_folder(folder, labels_file,
 
         subdir_index += 1
         logger.debug('Progress: %0.2f' % (float(subdir_index)/len(subdirs)))
+        events.emit('progress', done=subdir_index, total=len(subdirs))
 
     if percent_train:
         train_outfile.close()
@@ -453,10 +454,19 @@ def parse_folder(folder, labels_file,
     logger.info('Selected %d for training.' % train_count)
     logger.info('Selected %d for validation.' % val_count)
     logger.info('Selected %d for testing.' % test_count)
+    events.emit('found', images=train_count + val_count + test_count, categories=len(labels))
+    events.emit('selected', train=train_count, val=val_count, test=test_count)
     return True
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    """
+    Runs the tool with command line arguments
+    Returns the exit code
+
+    Keyword arguments:
+    argv -- the arguments (default: sys.argv[1:])
+    """
     parser = argparse.ArgumentParser(description='Parse-Folder tool - DIGITS')
 
     ### Positional arguments
@@ -503,7 +513,7 @@ if __name__ == '__main__':
             help='What is the maximum limit of images per category? (categories which exceed this limit will be trimmed down) [default=None]'
             )
 
-    args = vars(parser.parse_args())
+    args = vars(parser.parse_args(argv))
 
     for valid in [
             validate_folder(args['folder']),
@@ -520,13 +530,13 @@ if __name__ == '__main__':
             validate_range(args['max'], min_value=1, allow_none=True),
             ]:
         if not valid:
-            sys.exit(1)
+            return 1
 
     try:
         percent_train, percent_val, percent_test = calculate_percentages(**args)
     except Exception as e:
         logger.error('%s: %s' % (type(e).__name__, e))
-        sys.exit(1)
+        return 1
 
     start_time = time.time()
 
@@ -541,7 +551,9 @@ if __name__ == '__main__':
             max_per_category= args['max'],
             ):
         logger.info('Done after %d seconds.' % (time.time() - start_time))
-        sys.exit(0)
+        return 0
     else:
-        sys.exit(1)
+        return 1
 
+if __name__ == '__main__':
+    sys.exit(main())
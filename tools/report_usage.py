@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import sys
+import os
+import json
+import errno
+import signal
+import ctypes
+import ctypes.util
+import argparse
+
+# Signals which are passed on to the command
+FORWARDED_SIGNALS = [signal.SIGTERM, signal.SIGINT, signal.SIGHUP]
+
+# From <linux/prctl.h>
+PR_SET_PDEATHSIG = 1
+
+def die_with_parent():
+    """
+    Make the kernel send SIGKILL to this process when its parent exits
+    (so the command doesn't outlive a SIGKILL sent to this wrapper)
+    Does nothing where prctl() isn't available
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+def run(fd, args):
+    """
+    Run a command and return its exit status
+    Writes two lines of JSON to fd: {"pid": pid} once the command has
+        started (so that it can be sampled while it runs) and its rusage
+        when it has exited
+    The server can't wait4() for its own children because gevent reaps them,
+        so their peak memory and I/O are lost when they exit
+
+    Arguments:
+    fd -- a file descriptor for the report
+    args -- the command and its arguments
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(fd)
+            die_with_parent()
+            os.execvp(args[0], args)
+        except OSError as e:
+            sys.stderr.write('%s: %s\n' % (args[0], e))
+        os._exit(127)
+
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, lambda signum, frame: os.kill(pid, signum))
+
+    outfile = os.fdopen(fd, 'w')
+    outfile.write(json.dumps({'pid': pid}) + '\n')
+    outfile.flush()
+
+    while True:
+        try:
+            _, status, rusage = os.wait4(pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+    with outfile:
+        outfile.write(json.dumps({
+            'ru_utime': rusage.ru_utime,
+            'ru_stime': rusage.ru_stime,
+            'ru_maxrss': rusage.ru_maxrss,
+            'ru_inblock': rusage.ru_inblock,
+            'ru_oublock': rusage.ru_oublock,
+            }) + '\n')
+    return status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report-Usage tool - DIGITS')
+
+    ### Positional arguments
+
+    parser.add_argument('fd',
+            type=int,
+            help='File descriptor to write the pid and rusage of the command to')
+    parser.add_argument('command',
+            nargs=argparse.REMAINDER,
+            help='The command to run')
+
+    args = vars(parser.parse_args())
+
+    status = run(args['fd'], args['command'])
+    if os.WIFSIGNALED(status):
+        # exit the same way
+        signum = os.WTERMSIG(status)
+        if signum in FORWARDED_SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+        sys.exit(128 + signum)
+    sys.exit(os.WEXITSTATUS(status))
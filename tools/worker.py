@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# Copyright (c) 2015, NVIDIA CORPORATION.  All rights reserved.
+
+import sys
+import os
+import json
+import errno
+import random
+import struct
+import select
+import signal
+import socket
+import argparse
+import traceback
+import importlib
+import _multiprocessing
+
+import numpy as np
+
+try:
+    import digits
+except ImportError:
+    # Add path for DIGITS package
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import digits.config
+digits.config.load_config()
+from digits import log, events
+from digits.process_priority import ProcessPriority
+
+# Seconds between checks for children which have exited
+POLL_INTERVAL = 1
+
+class Worker(object):
+    """
+    Runs tools for the DIGITS server (see digits.tool_pool.ToolPool)
+
+    The tools are imported once, and each run is a child forked from this
+        process, so it starts without importing numpy, PIL, lmdb or caffe
+        again and can be stopped with a signal like any other process
+
+    Requests arrive on a unix socket as a length-prefixed JSON header
+        followed by the file descriptors for the output and the events
+    Replies are lines of JSON
+    """
+
+    def __init__(self, sock, tools):
+        """
+        Arguments:
+        sock -- a connected unix socket
+        tools -- the names of the tools to import
+        """
+        self.sock = sock
+        self.tools = {}
+        for name in tools:
+            self.tools[name] = importlib.import_module(name).main
+        # {pid: request id}
+        self.children = {}
+
+    def serve(self):
+        """
+        Handle requests until the server closes the socket
+        """
+        self.reply(ready=True)
+        while True:
+            try:
+                readable, _, _ = select.select([self.sock], [], [], POLL_INTERVAL)
+            except select.error as e:
+                # interrupted by SIGCHLD
+                if e.args[0] != errno.EINTR:
+                    raise
+                readable = []
+            if readable:
+                request = self.read_request()
+                if request is None:
+                    break
+                self.start(*request)
+            self.reap()
+
+    def read_request(self):
+        """
+        Returns (header, fds) or None if the socket was closed
+        """
+        data = self.read_exactly(4)
+        if data is None:
+            return None
+        size, = struct.unpack('!I', data)
+        data = self.read_exactly(size)
+        if data is None:
+            return None
+        header = json.loads(data)
+        fds = [_multiprocessing.recvfd(self.sock.fileno())
+                for _ in xrange(header['fds'])]
+        return header, fds
+
+    def read_exactly(self, size):
+        # never read past the header - the file descriptors come next
+        data = ''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def reply(self, **fields):
+        self.sock.sendall(json.dumps(fields) + '\n')
+
+    def start(self, header, fds):
+        """
+        Fork a child to run a tool
+
+        Arguments:
+        header -- the request
+        fds -- the output file descriptor, then the events one (if any)
+        """
+        request_id = header['id']
+        try:
+            if header['tool'] not in self.tools:
+                self.reply(id=request_id, error='unknown tool "%s"' % header['tool'])
+                return
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                self.run_child(header, fds)
+            self.children[pid] = request_id
+            self.reply(id=request_id, pid=pid)
+        except OSError as e:
+            self.reply(id=request_id, error=str(e))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def run_child(self, header, fds):
+        """
+        Run a tool in a forked child (never returns)
+        """
+        code = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # every child would get the same random numbers from the
+            #   generators it inherited (e.g. for shuffling the images)
+            random.seed()
+            np.random.seed()
+            self.sock.close()
+            os.dup2(fds[0], 1)
+            os.dup2(fds[0], 2)
+            os.chdir(header['cwd'])
+            if header.get('priority'):
+                ProcessPriority.from_dict(header['priority']).apply()
+            if len(fds) > 1:
+                os.environ[events.ENV_FD] = str(fds[1])
+                events.set_writer(events.EventWriter(fds[1]))
+                log.setup_events_logging()
+            sys.argv = ['%s.py' % header['tool']] + header['argv']
+            code = self.tools[header['tool']](header['argv'])
+        except SystemExit as e:
+            code = e.code
+        except:
+            traceback.print_exc()
+        finally:
+            if not isinstance(code, int):
+                code = 1 if code else 0
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def reap(self):
+        """
+        Report the children which have exited
+        """
+        while self.children:
+            try:
+                pid, status, rusage = os.wait4(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    return
+                raise
+            if pid == 0:
+                return
+            request_id = self.children.pop(pid, None)
+            if request_id is None:
+                continue
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            else:
+                returncode = os.WEXITSTATUS(status)
+            self.reply(id=request_id, pid=pid, returncode=returncode,
+                    rusage={
+                        'ru_utime': rusage.ru_utime,
+                        'ru_stime': rusage.ru_stime,
+                        'ru_maxrss': rusage.ru_maxrss,
+                        'ru_inblock': rusage.ru_inblock,
+                        'ru_oublock': rusage.ru_oublock,
+                        })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tool-Worker - DIGITS')
+
+    ### Positional arguments
+
+    parser.add_argument('fd',
+            type=int,
+            help='File descriptor of a unix socket connected to the DIGITS server')
+    parser.add_argument('tools',
+            nargs='+',
+            help='The tools to import (e.g. parse_folder create_db)')
+
+    args = vars(parser.parse_args())
+
+    # the server stops the worker by closing the socket
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # wake up select() when a child exits (other calls are restarted)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.siginterrupt(signal.SIGCHLD, False)
+
+    sock = socket.fromfd(args['fd'], socket.AF_UNIX, socket.SOCK_STREAM)
+    os.close(args['fd'])
+    # the server's end may have made it non-blocking
+    sock.setblocking(True)
+
+    worker = Worker(sock, args['tools'])
+    worker.serve()
+    sys.exit(0)
+